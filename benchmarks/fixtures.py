@@ -0,0 +1,246 @@
+"""Synthetic input files for the benchmarks
+
+Nothing here needs the network: the IONEX files are written where RMextract looks for them,
+so it never tries to download them.
+"""
+
+import datetime
+import os
+
+import numpy as np
+
+from simpleRM import ionex
+from simpleRM import sites
+
+
+def site(name="CHIME"):
+    """Site location without needing the astropy site registry
+
+    Parameters
+    ----------
+    name : str, optional
+
+    Returns
+    -------
+    site : `astropy.coordinates.EarthLocation`
+    """
+    return sites.get_site(name, registry=False)
+
+
+def write_ionex(filename, date, interval=3600, exponent=-1, seed=0):
+    """Write a synthetic IONEX file
+
+    TEC follows a smooth day/night pattern plus noise on the standard CODE 2.5x5 deg grid
+
+    Parameters
+    ----------
+    filename : str
+    date : `datetime.date`
+    interval : int, optional
+        time between maps [sec]
+    exponent : int, optional
+    seed : int, optional
+    """
+    rng = np.random.default_rng(seed)
+    lats = np.arange(87.5, -87.5 - 2.5, -2.5)
+    lons = np.arange(-180.0, 180.0 + 5.0, 5.0)
+    nmaps = 86400 // interval + 1
+    t0 = datetime.datetime(date.year, date.month, date.day)
+
+    def epoch(t):
+        return f"{t.year:6d}{t.month:6d}{t.day:6d}{t.hour:6d}{t.minute:6d}{t.second:6d}"
+
+    lines = []
+
+    def card(content, label):
+        lines.append(f"{content:<60s}{label:<20s}")
+
+    card("     1.0            IONOSPHERE MAPS     GNSS", "IONEX VERSION / TYPE")
+    card(epoch(t0), "EPOCH OF FIRST MAP")
+    card(
+        epoch(t0 + datetime.timedelta(seconds=interval * (nmaps - 1))),
+        "EPOCH OF LAST MAP",
+    )
+    card(f"{interval:6d}", "INTERVAL")
+    card(f"{nmaps:6d}", "# OF MAPS IN FILE")
+    card(f"{lats[0]:8.1f}{lats[-1]:6.1f}{-2.5:6.1f}", "LAT1 / LAT2 / DLAT")
+    card(f"{lons[0]:8.1f}{lons[-1]:6.1f}{5.0:6.1f}", "LON1 / LON2 / DLON")
+    card(f"{exponent:6d}", "EXPONENT")
+    card("", "END OF HEADER")
+    LAT, LON = np.meshgrid(lats, lons, indexing="ij")
+    for i in range(nmaps):
+        hour = i * interval / 3600.0
+        sun = 15.0 * (hour - 12.0)
+        tec = (
+            200
+            + 300
+            * np.cos(np.radians(LAT)) ** 2
+            * (1 + np.cos(np.radians(LON - sun - 180.0)))
+            / 2
+        )
+        tec += rng.normal(0, 5, tec.shape)
+        card(f"{i + 1:6d}", "START OF TEC MAP")
+        card(
+            epoch(t0 + datetime.timedelta(seconds=interval * i)), "EPOCH OF CURRENT MAP"
+        )
+        for j, lat in enumerate(lats):
+            card(
+                f"  {lat:6.1f}{lons[0]:6.1f}{lons[-1]:6.1f}{5.0:6.1f}{450.0:6.1f}",
+                "LAT/LON1/LON2/DLON/H",
+            )
+            row = np.round(tec[j]).astype(int)
+            for k in range(0, len(row), 16):
+                lines.append("".join(f"{v:5d}" for v in row[k : k + 16]))
+        card(f"{i + 1:6d}", "END OF TEC MAP")
+    card("", "END OF FILE")
+    with open(filename, "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def write_ionex_days(ionexPath, start_mjd, ndays):
+    """Write synthetic IONEX files for a range of days
+
+    Parameters
+    ----------
+    ionexPath : str
+    start_mjd : int
+    ndays : int
+
+    Returns
+    -------
+    filenames : list
+    """
+    os.makedirs(ionexPath, exist_ok=True)
+    filenames = []
+    for mjd in range(start_mjd, start_mjd + ndays):
+        date = ionex.mjd_to_date(mjd)
+        filename = os.path.join(ionexPath, ionex.ionex_filename(date))
+        write_ionex(filename, date, seed=mjd)
+        filenames.append(filename)
+    return filenames
+
+
+def write_psrfits(
+    filename,
+    nsub=20,
+    nchan=64,
+    nbin=128,
+    npol=4,
+    tsub=10.0,
+    imjd=59216,
+    smjd=77700,
+    telescope="CHIME",
+):
+    """Write a synthetic PSRFITS fold-mode file
+
+    Parameters
+    ----------
+    filename : str
+    nsub : int, optional
+    nchan : int, optional
+    nbin : int, optional
+    npol : int, optional
+    tsub : float, optional
+        subintegration length [sec]
+    imjd : int, optional
+    smjd : int, optional
+    telescope : str, optional
+    """
+    from astropy.io import fits
+
+    header = fits.Header()
+    header["OBS_MODE"] = "PSR"
+    header["TELESCOP"] = telescope
+    header["ANT_X"], header["ANT_Y"], header["ANT_Z"] = sites.positions[telescope]
+    header["SRC_NAME"] = "J2035+36"
+    header["RA"] = "20:35:34.79"
+    header["DEC"] = "+36:52:44.4"
+    header["STT_IMJD"] = imjd
+    header["STT_SMJD"] = smjd
+    header["STT_OFFS"] = 0.25
+    header["OBSFREQ"] = 600.0
+    header["OBSBW"] = 400.0
+    header["OBSNCHAN"] = nchan
+    history = fits.BinTableHDU.from_columns(
+        [fits.Column(name="DATE_PRO", format="24A", array=["2021"])], name="HISTORY"
+    )
+    freqs = 400.0 + (np.arange(nchan) + 0.5) * 400.0 / nchan
+    rng = np.random.default_rng(1)
+    columns = [
+        fits.Column(name="TSUBINT", format="1D", unit="s", array=np.full(nsub, tsub)),
+        fits.Column(
+            name="OFFS_SUB",
+            format="1D",
+            unit="s",
+            array=(np.arange(nsub) + 0.5) * tsub,
+        ),
+        fits.Column(
+            name="DAT_FREQ", format=f"{nchan}D", array=np.tile(freqs, (nsub, 1))
+        ),
+        fits.Column(name="DAT_WTS", format=f"{nchan}E", array=np.ones((nsub, nchan))),
+        fits.Column(
+            name="DAT_OFFS",
+            format=f"{nchan * npol}E",
+            array=np.zeros((nsub, nchan * npol)),
+        ),
+        fits.Column(
+            name="DAT_SCL",
+            format=f"{nchan * npol}E",
+            array=np.ones((nsub, nchan * npol)),
+        ),
+        fits.Column(
+            name="DATA",
+            format=f"{nbin * nchan * npol}I",
+            dim=f"({nbin},{nchan},{npol})",
+            array=rng.integers(-1000, 1000, (nsub, npol, nchan, nbin)).astype(np.int16),
+        ),
+    ]
+    subint = fits.BinTableHDU.from_columns(columns, name="SUBINT")
+    subint.header["POL_TYPE"] = "IQUV"
+    subint.header["NPOL"] = npol
+    subint.header["NCHAN"] = nchan
+    subint.header["NBIN"] = nbin
+    subint.header["TBIN"] = 0.001
+    subint.header["CHAN_BW"] = 400.0 / nchan
+    subint.header["REFFREQ"] = 600.0
+    subint.header["DM"] = 93.5
+    subint.header["RM"] = 0.0
+    fits.HDUList([fits.PrimaryHDU(header=header), history, subint]).writeto(
+        filename, overwrite=True
+    )
+
+
+def write_timer(filename, mjd=59216.9, nsub=10, tsub=37.4, telescope="CHIME"):
+    """Write a synthetic Timer header (followed by some padding)
+
+    Uses the header layout from :func:`simpleRM.read_Timer.get_layout`, which must be available
+
+    Parameters
+    ----------
+    filename : str
+    mjd : float, optional
+    nsub : int, optional
+    tsub : float, optional
+        subintegration length [sec]
+    telescope : str, optional
+    """
+    from simpleRM import read_Timer
+
+    header = np.zeros(1, dtype=read_Timer.header_dtype())
+    values = {
+        "psrname": b"J2035+36",
+        "mjd": int(mjd),
+        "fracmjd": mjd - int(mjd),
+        "telid": telescope.encode(),
+        "coord_type": b"05",
+        "ra": np.radians(308.895),
+        "dec": np.radians(36.879),
+        "nsub_int": nsub,
+        "sub_int_time": tsub,
+    }
+    for name, value in values.items():
+        if name in header.dtype.names:
+            header[name] = value
+    with open(filename, "wb") as f:
+        f.write(header.tobytes())
+        f.write(bytes(1024))
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+"""Check the start-up time of the console scripts
+
+Runs each script with --help under `python -X importtime` and reports
+the total import time and wall time.  Fails (exit status 1) if a script
+imports any of the heavy packages just to show its help,
+or if its imports take longer than the budget.
+
+Run from the top of the repository:
+
+    python benchmarks/import_time.py [--budget 0.5] [--json]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+scripts = [
+    "getRM",
+    "getRM_psrfits",
+    "getRM_psrchive",
+    "getRM_prefetch",
+    "getRM_refresh",
+]
+# should not be needed for --help or argument errors
+heavy = ["numpy", "scipy", "astropy", "RMextract", "ephem"]
+
+
+def measure(script):
+    """Import time for running a console script with --help
+
+    Parameters
+    ----------
+    script : str
+
+    Returns
+    -------
+    result : dict
+        "import_time" and "wall_time" [sec], and the "heavy" packages that were imported
+    """
+    code = f"import sys; sys.argv = ['{script}', '--help']; from simpleRM.scripts import {script}; {script}.main()"
+    start = time.perf_counter()
+    p = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        cwd=os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."),
+    )
+    wall_time = time.perf_counter() - start
+    if p.returncode != 0:
+        raise RuntimeError(f"{script} --help failed:\n{p.stderr}")
+
+    total = 0
+    modules = set()
+    for line in p.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        modules.add(name.strip())
+        # only count top-level imports (the others are included in them)
+        if not name[1:].startswith(" "):
+            total += int(cumulative)
+    return {
+        "import_time": total / 1e6,
+        "wall_time": wall_time,
+        "heavy": sorted(m for m in heavy if m in modules),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Check the start-up time of the console scripts",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "--budget", default=0.5, type=float, help="Maximum import time [sec]"
+    )
+    parser.add_argument(
+        "--json", default=False, action="store_true", help="Output JSON"
+    )
+    args = parser.parse_args()
+
+    results = {script: measure(script) for script in scripts}
+    failed = [
+        script
+        for script, result in results.items()
+        if len(result["heavy"]) > 0 or result["import_time"] > args.budget
+    ]
+    if args.json:
+        print(json.dumps({"budget": args.budget, "results": results}, indent=2))
+    else:
+        print("# SCRIPT\t\tIMPORT(s)\tWALL(s)\tHEAVY")
+        for script, result in results.items():
+            print(
+                f"{script:16s}\t{result['import_time']:.3f}\t\t{result['wall_time']:.3f}\t{','.join(result['heavy'])}"
+            )
+    if len(failed) > 0:
+        print(f"Start-up regression in: {', '.join(failed)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
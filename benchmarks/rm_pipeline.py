@@ -0,0 +1,336 @@
+#!/usr/bin/env python
+"""Benchmark the RM pipeline on synthetic data
+
+Synthetic IONEX files, PSRFITS files and Timer headers are written to a
+scratch directory (see `fixtures.py`), so no network access is needed.
+Each scenario reports wall time for a "cold" run (no IONEX files parsed yet,
+and including any one-off imports)
+and a "warm" run (repeated in the same process), the time spent reading IONEX,
+the breakdown of the cold run into stages (from `simpleRM.profiling`),
+and the peak memory of a cold run (measured separately with `tracemalloc`,
+since tracing slows everything down).
+
+Scenarios:
+
+- single: one source and site for an hour at 100 s (`simpleRM.simpleRM`)
+- many_sources: many sources at two sites for an hour at 100 s (`simpleRM.simpleRM_batch`)
+- long_duration: one source over several days at 300 s
+- fine_timestep: one source for an hour at 1 s
+- psrfits_headers: reading many PSRFITS headers
+- timer_headers: reading many Timer headers, one at a time and with `read_Timer.scan_headers`
+  (skipped unless "simpleRM/data/timer_layout.json" or "timer.h" is present, or read_Timer is installed)
+
+Run from the top of the repository:
+
+    python benchmarks/rm_pipeline.py [--engine native] [--quick] [--out results.json]
+"""
+
+import argparse
+import glob
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+# RMextract logs every IONEX file it reads
+os.environ.setdefault("RMEXT_LOGLEVEL", "WARNING")
+
+import numpy as np
+import astropy
+from astropy import units as u
+from astropy.time import Time
+from astropy.coordinates import SkyCoord
+from loguru import logger
+
+from simpleRM import simpleRM, ionex, field, profiling, psrfits, read_Timer
+import fixtures
+
+start_mjd = 59216
+# never contacted, since all of the IONEX files are already present
+server = "http://localhost/CODE/"
+scenarios = [
+    "single",
+    "many_sources",
+    "long_duration",
+    "fine_timestep",
+    "psrfits_headers",
+    "timer_headers",
+]
+
+
+def reset_ionex(ionexPath):
+    """Forget any parsed IONEX data (and field grids), so the next run starts cold"""
+    ionex._load_ionex.cache_clear()
+    ionex._load_ionex_window.cache_clear()
+    field._get_grid.cache_clear()
+    for filename in glob.glob(os.path.join(ionexPath, "*.tec.npy")) + glob.glob(
+        os.path.join(ionexPath, "*.axes.npz")
+    ):
+        os.remove(filename)
+
+
+def timed(function):
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+def peak_memory(function):
+    """Peak memory allocated by Python while running `function` [MB]"""
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1] / 2**20
+    finally:
+        tracemalloc.stop()
+
+
+def read_ionex_time(ionexPath, times, engine):
+    """Time to read the IONEX files needed for `times` once"""
+    from RMextract import getIONEX
+
+    filenames = [
+        os.path.join(ionexPath, ionex.ionex_filename(ionex.mjd_to_date(mjd)))
+        for mjd in np.unique(np.floor(times.mjd).astype(int))
+    ]
+    if engine == "native":
+        return timed(lambda: [ionex.read_ionex(f) for f in filenames])
+    return timed(lambda: [getIONEX.read_tec(f) for f in filenames])
+
+
+def run_rm(ionexPath, engine, run, times):
+    """Cold, warm, IONEX reading and memory for one RM calculation"""
+    reset_ionex(ionexPath)
+    profiling.enable()
+    profiling.reset()
+    cold = timed(run)
+    # breakdown of the cold run from simpleRM.profiling
+    cold_stages = {
+        name: values["time"] for name, values in profiling.summary()["stages"].items()
+    }
+    warm = timed(run)
+    reset_ionex(ionexPath)
+    memory = peak_memory(run)
+    return {
+        "wall_time": cold,
+        "peak_memory_mb": memory,
+        "stages": {
+            "cold": cold,
+            "warm": warm,
+            "ionex_read": read_ionex_time(ionexPath, times, engine),
+            "cold_stages": cold_stages,
+        },
+    }
+
+
+def rm_scenario(name, ionexPath, engine, quick=False):
+    # "native_field" is the native engine with precomputed field grids (simpleRM.field)
+    if engine == "native_field":
+        field.enable()
+        engine = "native"
+    else:
+        field.disable()
+    site = fixtures.site("CHIME")
+    pointing = SkyCoord(308.895 * u.deg, 36.879 * u.deg)
+    start = Time(start_mjd + 0.5, format="mjd")
+    if name == "single":
+        duration, timestep = 1 * u.hr, 100 * u.s
+    elif name == "long_duration":
+        duration, timestep = (1 if quick else 3) * u.d, 300 * u.s
+    elif name == "fine_timestep":
+        duration, timestep = (10 * u.min if quick else 1 * u.hr), 1 * u.s
+    elif name == "many_sources":
+        nsources = 10 if quick else 100
+        rng = np.random.default_rng(0)
+        pointings = SkyCoord(
+            rng.uniform(0, 360, nsources) * u.deg,
+            rng.uniform(20, 70, nsources) * u.deg,
+        )
+        sites = [site, fixtures.site("GBT")]
+        times = start + np.arange(0, 3600, 100) * u.s
+
+        def run():
+            simpleRM.simpleRM_batch(
+                pointings,
+                sites,
+                times,
+                ionexPath=ionexPath,
+                server=server,
+                engine=engine,
+            )
+
+        result = run_rm(ionexPath, engine, run, times)
+        result["size"] = {
+            "sources": nsources,
+            "sites": len(sites),
+            "times": len(times),
+        }
+        return result
+    else:
+        raise ValueError(f"Unknown scenario '{name}'")
+
+    stop = start + duration
+    nout = []
+
+    def run():
+        times, RM = simpleRM.simpleRM(
+            pointing,
+            start,
+            stop,
+            site,
+            timestep=timestep,
+            ionexPath=ionexPath,
+            server=server,
+            engine=engine,
+        )
+        nout.append(len(times))
+
+    result = run_rm(
+        ionexPath,
+        engine,
+        run,
+        start + np.arange(0, duration.to_value(u.s) + 3600, 3600) * u.s,
+    )
+    result["size"] = {"sources": 1, "sites": 1, "times": nout[0]}
+    return result
+
+
+def psrfits_scenario(directory, quick=False):
+    nfiles = 20 if quick else 200
+    filenames = []
+    for i in range(nfiles):
+        filename = os.path.join(directory, f"bench_{i:04d}.fits")
+        fixtures.write_psrfits(filename, nsub=8, nchan=32, nbin=64, smjd=40000 + 60 * i)
+        filenames.append(filename)
+
+    def run():
+        for filename in filenames:
+            ar = psrfits.PSRFITSHeader(filename)
+            ar.getPulsarCoords()
+            ar.getTelescopeCoords()
+            ar.getMJD(full=True)
+            ar.getDuration()
+
+    wall_time = timed(run)
+    return {
+        "wall_time": wall_time,
+        "peak_memory_mb": peak_memory(run),
+        "stages": {"read": wall_time},
+        "size": {"files": nfiles},
+        "files_per_second": nfiles / wall_time,
+    }
+
+
+def timer_scenario(directory, quick=False):
+    try:
+        read_Timer.get_layout()
+    except (OSError, KeyError, ValueError) as e:
+        return {"skipped": str(e)}
+    nfiles = 200 if quick else 2000
+    filenames = []
+    for i in range(nfiles):
+        filename = os.path.join(directory, f"bench_{i:04d}.ar")
+        fixtures.write_timer(filename, mjd=start_mjd + 0.5 + i / 1440)
+        filenames.append(filename)
+
+    def run_each():
+        for filename in filenames:
+            read_Timer.TimerHeader(filename)
+
+    def run_scan():
+        read_Timer.scan_headers(filenames)
+
+    each = timed(run_each)
+    scan = timed(run_scan)
+    return {
+        "wall_time": each + scan,
+        "peak_memory_mb": max(peak_memory(run_each), peak_memory(run_scan)),
+        "stages": {"TimerHeader": each, "scan_headers": scan},
+        "size": {"files": nfiles},
+        "files_per_second": {
+            "TimerHeader": nfiles / each,
+            "scan_headers": nfiles / scan,
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the RM pipeline on synthetic data",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "--scenario",
+        default=scenarios,
+        nargs="+",
+        choices=scenarios,
+        help="Scenarios to run",
+    )
+    parser.add_argument(
+        "--engine",
+        default=["rmextract", "native"],
+        nargs="+",
+        choices=["rmextract", "native", "native_field"],
+        help="RM engines to run (native_field uses precomputed field grids)",
+    )
+    parser.add_argument(
+        "--quick", default=False, action="store_true", help="Use smaller scenarios"
+    )
+    parser.add_argument(
+        "--workdir",
+        default=None,
+        type=str,
+        help="Directory for the synthetic data [default=temporary directory]",
+    )
+    parser.add_argument("--out", default=None, type=str, help="Output JSON file")
+    args = parser.parse_args()
+    logger.remove()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        workdir = args.workdir if args.workdir is not None else tmpdir
+        ionexPath = os.path.join(workdir, "IONEXdata")
+        # one day either side for the padding of the time grid
+        fixtures.write_ionex_days(ionexPath, start_mjd - 1, 6)
+
+        results = {}
+        for name in args.scenario:
+            if name == "psrfits_headers":
+                directory = os.path.join(workdir, "psrfits")
+                os.makedirs(directory, exist_ok=True)
+                results[name] = psrfits_scenario(directory, quick=args.quick)
+            elif name == "timer_headers":
+                directory = os.path.join(workdir, "timer")
+                os.makedirs(directory, exist_ok=True)
+                results[name] = timer_scenario(directory, quick=args.quick)
+            else:
+                results[name] = {
+                    engine: rm_scenario(name, ionexPath, engine, quick=args.quick)
+                    for engine in args.engine
+                }
+            print(f"Finished {name}", file=sys.stderr)
+
+    output = {
+        "environment": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "astropy": astropy.__version__,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "quick": args.quick,
+        "results": results,
+    }
+    if args.out is not None:
+        with open(args.out, "w") as f:
+            json.dump(output, f, indent=2)
+    else:
+        print(json.dumps(output, indent=2))
+
+
+if __name__ == "__main__":
+    main()
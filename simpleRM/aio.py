@@ -0,0 +1,336 @@
+import asyncio
+import functools
+import os
+
+from astropy import units as u
+from loguru import logger
+
+from simpleRM import ionex
+from simpleRM import prefetch
+from simpleRM import simpleRM as _blocking
+
+# downloads in progress, shared by concurrent requests for the same day
+_downloads = {}
+
+
+async def _run(executor, function, *args, **kwargs):
+    """Run a blocking function in `executor` (None for the default thread pool)"""
+    return await asyncio.get_running_loop().run_in_executor(
+        executor, functools.partial(function, *args, **kwargs)
+    )
+
+
+async def get_ionex_file(
+    date,
+    ionexPath="./IONEXdata/",
+    server="http://ftp.aiub.unibe.ch/CODE/",
+    retries=3,
+):
+    """Locate (and download if needed) the IONEX file for a single day without blocking
+
+    The best product already in `ionexPath` is used, and otherwise the final one is downloaded
+    (with :func:`simpleRM.prefetch.fetch_ionex`, in a thread).
+    Concurrent requests for the same day and `ionexPath` share a single download.
+
+    Parameters
+    ----------
+    date : `datetime.date`
+    ionexPath : str, optional
+    server : str, optional
+    retries : int, optional
+
+    Returns
+    -------
+    ionexf : str
+    """
+    ionexf, _ = await _run(None, ionex.find_ionex_file, date, ionexPath)
+    if ionexf is not None:
+        return ionexf
+    loop = asyncio.get_running_loop()
+    key = (loop, date, os.path.abspath(ionexPath))
+    task = _downloads.get(key)
+    if task is None:
+        logger.debug(f"Fetching IONEX file for {date}")
+        task = loop.create_task(
+            _run(
+                None,
+                prefetch.fetch_ionex,
+                date,
+                ionexPath=ionexPath,
+                server=server,
+                retries=retries,
+            )
+        )
+        _downloads[key] = task
+        task.add_done_callback(lambda _: _downloads.pop(key, None))
+    # shielded, so that cancelling one request does not cancel the download for the others
+    return await asyncio.shield(task)
+
+
+async def get_ionex_files(
+    dates, ionexPath="./IONEXdata/", server="http://ftp.aiub.unibe.ch/CODE/"
+):
+    """Locate (and download if needed) the IONEX files for a set of days concurrently
+
+    Parameters
+    ----------
+    dates : list
+        list of `datetime.date`
+    ionexPath : str, optional
+    server : str, optional
+
+    Returns
+    -------
+    filenames : dict
+        file name for each date
+    """
+    dates = sorted(set(dates))
+    filenames = await asyncio.gather(
+        *(get_ionex_file(date, ionexPath=ionexPath, server=server) for date in dates)
+    )
+    return dict(zip(dates, filenames))
+
+
+async def simpleRM(
+    pointing,
+    starttime,
+    stoptime,
+    site,
+    timestep=100 * u.s,
+    ionexPath="./IONEXdata/",
+    server="http://ftp.aiub.unibe.ch/CODE/",
+    cache=None,
+    engine="rmextract",
+    executor=None,
+):
+    """Compute RM for a single position/site and a range of times without blocking
+
+    As :func:`simpleRM.simpleRM.simpleRM`, but the IONEX files are fetched first
+    (see :func:`get_ionex_file`) and the calculation is run in `executor`
+
+    Parameters
+    ----------
+    pointing : `astropy.coordinates.SkyCoord`
+    starttime : `astropy.time.Time`
+    stopttime : `astropy.time.Time`
+    site : `astropy.coordinates.EarthLocation`
+    timestep : `astropy.units.Quantity`, optional
+    ionexPath : str, optional
+    server : str, optional
+    cache : `simpleRM.cache.RMCache`, optional
+    engine : str, optional
+    executor : `concurrent.futures.Executor`, optional
+        Where to compute RM (default is the event loop's thread pool);
+        a `concurrent.futures.ProcessPoolExecutor` keeps the calculation off the event loop's process
+
+    Returns
+    -------
+    series : `simpleRM.series.RMSeries`
+    """
+    await get_ionex_files(
+        ionex.ionex_dates(starttime, stoptime, timestep),
+        ionexPath=ionexPath,
+        server=server,
+    )
+    return await _run(
+        executor,
+        _blocking.simpleRM,
+        pointing,
+        starttime,
+        stoptime,
+        site,
+        timestep=timestep,
+        ionexPath=ionexPath,
+        server=server,
+        cache=cache,
+        engine=engine,
+    )
+
+
+async def _subints(
+    pointing, site, times, timestep, ionexPath, server, cache, engine, executor
+):
+    """RM at the mid-times of the subintegrations, with shape (time, 1)
+
+    As :func:`simpleRM.simpleRM._subint_rm`, with the IONEX files fetched first
+    """
+    await get_ionex_files(
+        ionex.ionex_dates(times.min(), times.max(), timestep),
+        ionexPath=ionexPath,
+        server=server,
+    )
+    RM = await _run(
+        executor,
+        _blocking._subint_rm,
+        pointing,
+        site,
+        times,
+        timestep,
+        ionexPath,
+        server,
+        cache,
+        engine,
+    )
+    return times, RM
+
+
+async def simpleRM_from_psrfits(
+    filename,
+    timestep=100 * u.s,
+    ionexPath="./IONEXdata/",
+    server="http://ftp.aiub.unibe.ch/CODE/",
+    cache=None,
+    engine="rmextract",
+    subint=False,
+    executor=None,
+):
+    """Compute RM based on a PSRFITS file without blocking
+
+    As :func:`simpleRM.simpleRM.simpleRM_from_psrfits`, with the header read in a thread
+    and the calculation as in :func:`simpleRM`
+
+    Parameters
+    ----------
+    filename : str
+    timestep : `astropy.units.Quantity`, optional
+    ionexPath : str, optional
+    server : str, optional
+    cache : `simpleRM.cache.RMCache`, optional
+    engine : str, optional
+    subint : bool, optional
+    executor : `concurrent.futures.Executor`, optional
+
+    Returns
+    -------
+    times : `astropy.time.Times`
+    RM : `numpy.ndarray`
+    ar : `simpleRM.psrfits.PSRFITSHeader` or `pypulse` archive
+    """
+    ar, pointing, site, starttime = await _run(None, _blocking._read_psrfits, filename)
+    if subint:
+        offsets = await _run(None, ar.getSubintinfo, "OFFS_SUB")
+        return (
+            *await _subints(
+                pointing,
+                site,
+                starttime + offsets * u.s,
+                timestep,
+                ionexPath,
+                server,
+                cache,
+                engine,
+                executor,
+            ),
+            ar,
+        )
+    duration = await _run(None, ar.getDuration)
+    return (
+        *await simpleRM(
+            pointing,
+            starttime,
+            starttime + duration * u.s,
+            site,
+            timestep=timestep,
+            ionexPath=ionexPath,
+            server=server,
+            cache=cache,
+            engine=engine,
+            executor=executor,
+        ),
+        ar,
+    )
+
+
+async def simpleRM_from_psrchive(
+    filename,
+    timestep=100 * u.s,
+    ionexPath="./IONEXdata/",
+    server="http://ftp.aiub.unibe.ch/CODE/",
+    cache=None,
+    engine="rmextract",
+    subint=False,
+    executor=None,
+):
+    """Compute RM based on a PSRCHIVE (Timer) file without blocking
+
+    As :func:`simpleRM.simpleRM.simpleRM_from_psrchive`, with the header read in a thread
+    and the calculation as in :func:`simpleRM`
+
+    Parameters
+    ----------
+    filename : str
+    timestep : `astropy.units.Quantity`, optional
+    ionexPath : str, optional
+    server : str, optional
+    cache : `simpleRM.cache.RMCache`, optional
+    engine : str, optional
+    subint : bool, optional
+    executor : `concurrent.futures.Executor`, optional
+
+    Returns
+    -------
+    times : `astropy.time.Times`
+    RM : `numpy.ndarray`
+    header : `read_Timer.TimerHeader`
+    """
+    t, pointing, site = await _run(None, _blocking._read_psrchive, filename)
+    if site is None:
+        return None
+    if subint:
+        return (
+            *await _subints(
+                pointing,
+                site,
+                t.subint_times(),
+                timestep,
+                ionexPath,
+                server,
+                cache,
+                engine,
+                executor,
+            ),
+            t,
+        )
+    return (
+        *await simpleRM(
+            pointing,
+            t.mjd,
+            t.mjd + t.duration,
+            site,
+            timestep=timestep,
+            ionexPath=ionexPath,
+            server=server,
+            cache=cache,
+            engine=engine,
+            executor=executor,
+        ),
+        t,
+    )
+
+
+def _is_fits(filename):
+    with open(filename, "rb") as f:
+        return f.read(6) == b"SIMPLE"
+
+
+async def simpleRM_from_file(filename, **kwargs):
+    """Compute RM based on a PSRFITS or PSRCHIVE (Timer) file without blocking
+
+    Files that start with a FITS header go to :func:`simpleRM_from_psrfits`,
+    and anything else to :func:`simpleRM_from_psrchive`.
+
+    Parameters
+    ----------
+    filename : str
+    kwargs :
+        passed to :func:`simpleRM_from_psrfits` or :func:`simpleRM_from_psrchive`
+
+    Returns
+    -------
+    times : `astropy.time.Times`
+    RM : `numpy.ndarray`
+    header : `simpleRM.psrfits.PSRFITSHeader` or `read_Timer.TimerHeader`
+    """
+    if await _run(None, _is_fits, filename):
+        return await simpleRM_from_psrfits(filename, **kwargs)
+    return await simpleRM_from_psrchive(filename, **kwargs)
@@ -0,0 +1,244 @@
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+from astropy import units as u
+from astropy.time import Time
+from loguru import logger
+
+from simpleRM import ionex
+
+
+def _ionex_name(filename):
+    """IONEX file name without the directory, as compared by :meth:`RMCache.invalidate`"""
+    return os.path.basename(filename).upper()
+
+
+def ionex_filenames(
+    starttime, stoptime, timestep=100 * u.s, prefix="CODG", ionexPath=None
+):
+    """Names of the IONEX files needed to cover a range of times
+
+    Includes the one timestep of padding that RMextract adds at each end
+
+    Parameters
+    ----------
+    starttime : `astropy.time.Time`
+    stoptime : `astropy.time.Time`
+    timestep : `astropy.units.Quantity`, optional
+    prefix : str, optional
+    ionexPath : str, optional
+        If supplied, use the names of the best products there (see :func:`simpleRM.ionex.find_ionex_file`)
+        for the days that have one
+
+    Returns
+    -------
+    filenames : list
+    """
+    filenames = []
+    for date in ionex.ionex_dates(starttime, stoptime, timestep):
+        ionexf = None
+        if ionexPath is not None:
+            ionexf, _ = ionex.find_ionex_file(date, ionexPath)
+        if ionexf is not None:
+            filenames.append(os.path.basename(ionexf))
+        else:
+            filenames.append(ionex.ionex_filename(date, prefix=prefix))
+    return filenames
+
+
+class RMCache:
+    """Persistent on-disk cache of RM results
+
+    Each result is stored as a separate `.npz` file named by a hash of
+    the inputs: the quantized pointing, the site geocentric XYZ, the start/stop/timestep,
+    the RM engine, the IONEX server and the IONEX files used (name, size and modification time).
+    Replacing an IONEX file, or adding a better product for a day (e.g. a final one
+    to supersede a rapid one), therefore changes the key, and :meth:`invalidate` removes the stale entries explicitly.
+    Each result also records the product and hash of its IONEX files.
+
+    The cache holds at most `max_entries` results; the least recently used are removed first.
+
+    Parameters
+    ----------
+    directory : str, optional
+        Cache directory (created if needed)
+    max_entries : int, optional
+        Maximum number of results to keep
+    precision : `astropy.units.Quantity`, optional
+        Quantization of the pointing
+    """
+
+    def __init__(
+        self, directory="./RMcache", max_entries=10000, precision=0.1 * u.arcsec
+    ):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.precision = precision
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory, exist_ok=True)
+
+    def key(
+        self,
+        pointing,
+        starttime,
+        stoptime,
+        site,
+        timestep=100 * u.s,
+        ionexPath="./IONEXdata/",
+        server="http://ftp.aiub.unibe.ch/CODE/",
+        engine="rmextract",
+    ):
+        """Compute the cache key for a `simpleRM.simpleRM` call
+
+        Parameters
+        ----------
+        pointing : `astropy.coordinates.SkyCoord`
+        starttime : `astropy.time.Time`
+        stopttime : `astropy.time.Time`
+        site : `astropy.coordinates.EarthLocation`
+        timestep : `astropy.units.Quantity`, optional
+        ionexPath : str, optional
+        server : str, optional
+        engine : str, optional
+            the engines give slightly different values, so they are cached separately
+
+        Returns
+        -------
+        key : str
+        ionex : list
+            IONEX files that the result depends on
+        """
+        q = self.precision.to_value(u.deg)
+        icrs = pointing.icrs
+        filenames = ionex_filenames(
+            starttime, stoptime, timestep=timestep, ionexPath=ionexPath
+        )
+        ionex_state = []
+        for filename in filenames:
+            try:
+                st = os.stat(os.path.join(ionexPath, filename))
+                ionex_state.append([filename, st.st_size, st.st_mtime_ns])
+            except FileNotFoundError:
+                ionex_state.append([filename, None, None])
+        inputs = {
+            "pointing": [
+                int(np.round(icrs.ra.deg / q)),
+                int(np.round(icrs.dec.deg / q)),
+            ],
+            "site": [int(np.round(x.to_value(u.m))) for x in site.to_geocentric()],
+            "start": f"{starttime.mjd:.9f}",
+            "stop": f"{stoptime.mjd:.9f}",
+            "timestep": f"{timestep.to_value(u.s):.6f}",
+            "engine": engine,
+            "server": server,
+            "ionex": ionex_state,
+        }
+        key = hashlib.sha1(json.dumps(inputs, sort_keys=True).encode()).hexdigest()
+        return key, filenames
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.npz")
+
+    def get(self, key):
+        """Look up a cached result
+
+        Parameters
+        ----------
+        key : str
+
+        Returns
+        -------
+        times : `astropy.time.Times` or None
+        RM : `numpy.ndarray` or None
+        """
+        path = self._path(key)
+        try:
+            with np.load(path) as data:
+                times = Time(data["mjd"], format="mjd")
+                RM = data["RM"]
+        except (FileNotFoundError, OSError, KeyError, ValueError):
+            return None, None
+        # mark as recently used
+        os.utime(path)
+        logger.debug(f"Found cached RM result {key}")
+        return times, RM
+
+    def put(self, key, times, RM, ionex=(), provenance=()):
+        """Store a result
+
+        Parameters
+        ----------
+        key : str
+        times : `astropy.time.Times`
+        RM : `numpy.ndarray`
+        ionex : list, optional
+            IONEX files that the result depends on
+        provenance : list, optional
+            product and hash of the IONEX files (from :func:`simpleRM.ionex.provenance`)
+        """
+        fd, tmpname = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            np.savez(
+                f,
+                mjd=times.mjd,
+                RM=RM,
+                ionex=np.array(list(ionex), dtype=str),
+                provenance=np.array(json.dumps(list(provenance))),
+            )
+        os.replace(tmpname, self._path(key))
+        logger.debug(f"Stored RM result {key}")
+        self.prune()
+
+    def prune(self):
+        """Remove the least recently used results beyond `max_entries`"""
+        entries = [e for e in os.scandir(self.directory) if e.name.endswith(".npz")]
+        if len(entries) <= self.max_entries:
+            return
+        entries.sort(key=lambda e: e.stat().st_mtime)
+        for e in entries[: len(entries) - self.max_entries]:
+            try:
+                os.remove(e.path)
+            except FileNotFoundError:
+                pass
+
+    def invalidate(self, ionex=None):
+        """Remove cached results
+
+        Parameters
+        ----------
+        ionex : str or list, optional
+            Only remove results computed from these IONEX files
+            (e.g. when a rapid product has been superseded).
+            If not supplied, remove everything.
+
+        Returns
+        -------
+        n : int
+            number of results removed
+        """
+        if isinstance(ionex, str):
+            ionex = [ionex]
+        if ionex is not None:
+            ionex = set(_ionex_name(x) for x in ionex)
+        n = 0
+        for e in os.scandir(self.directory):
+            if not e.name.endswith(".npz"):
+                continue
+            if ionex is not None:
+                try:
+                    with np.load(e.path) as data:
+                        used = set(_ionex_name(x) for x in data["ionex"].tolist())
+                except (OSError, KeyError, ValueError):
+                    used = ionex
+                if len(used & ionex) == 0:
+                    continue
+            try:
+                os.remove(e.path)
+                n += 1
+            except FileNotFoundError:
+                pass
+        logger.debug(f"Removed {n} cached RM results")
+        return n
@@ -0,0 +1,503 @@
+import functools
+import os
+
+import numpy as np
+from astropy import units as u
+from astropy.coordinates import AltAz
+from loguru import logger
+
+from simpleRM import ionex
+from simpleRM import profiling
+
+# height of the thin-shell ionosphere (m), as in RMextract
+ION_HEIGHT = 450.0e3
+# converts (TECU * nT) to rad/m^2
+RM_CONSTANT = 2.62e-6
+# number of positions for which the field is evaluated at once
+FIELD_CHUNK = 16384
+
+# WGS84 ellipsoid
+_a = 6378137.0
+_f = 1.0 / 298.257223563
+_b = _a * (1 - _f)
+_e2 = 2.0 * _f - _f * _f
+
+
+def itrf_to_wgs84(x, y, z):
+    """Convert ITRF XYZ to WGS84 latitude, longitude, height
+
+    Parameters
+    ----------
+    x, y, z : `numpy.ndarray`
+        position (m)
+
+    Returns
+    -------
+    lat : `numpy.ndarray`
+        latitude (deg)
+    lon : `numpy.ndarray`
+        longitude (deg)
+    h : `numpy.ndarray`
+        height (m)
+    """
+    E = _e2 / (1.0 - _e2)
+    p = np.sqrt(x * x + y * y)
+    q = np.arctan2(z * _a, p * _b)
+    lat = np.arctan2(z + E * _b * np.sin(q) ** 3, p - _e2 * _a * np.cos(q) ** 3)
+    v = _a / np.sqrt(1.0 - _e2 * np.sin(lat) ** 2)
+    lon = np.arctan2(y, x)
+    h = p / np.cos(lat) - v
+    return np.degrees(lat), np.degrees(lon), h
+
+
+def pierce_points(az, el, position, height=ION_HEIGHT):
+    """Find where lines of sight cross the ionospheric shell
+
+    A vectorized version of the ellipsoidal calculation in `RMextract.PosTools.getPP`
+
+    Parameters
+    ----------
+    az : `numpy.ndarray`
+        azimuth (rad)
+    el : `numpy.ndarray`
+        elevation (rad)
+    position : list
+        site ITRF XYZ (m)
+    height : float, optional
+        height of the ionosphere (m)
+
+    Returns
+    -------
+    latpp : `numpy.ndarray`
+        latitude of the pierce points (deg)
+    lonpp : `numpy.ndarray`
+        longitude of the pierce points (deg)
+    lon : `numpy.ndarray`
+        longitude of the line of sight direction (rad)
+    lat : `numpy.ndarray`
+        latitude of the line of sight direction (rad)
+    airmass : `numpy.ndarray`
+    """
+    X, Y, Z = position
+    site_lat, site_lon, _ = itrf_to_wgs84(X, Y, Z)
+    slat, clat = np.sin(np.radians(site_lat)), np.cos(np.radians(site_lat))
+    slon, clon = np.sin(np.radians(site_lon)), np.cos(np.radians(site_lon))
+    # line of sight in ITRF: from (south, east, zenith)
+    south = -np.cos(el) * np.cos(az)
+    east = np.cos(el) * np.sin(az)
+    zenith = np.sin(el)
+    dx = slat * clon * south - slon * east + clat * clon * zenith
+    dy = slat * slon * south + clon * east + clat * slon * zenith
+    dz = -clat * south + slat * zenith
+    lat = np.arcsin(np.clip(dz, -1, 1))
+    lon = np.arctan2(dy, dx)
+
+    b2 = _b * _b
+    ion_a = _a + height
+    ion_b = _b + height
+    x = X / ion_a
+    y = Y / ion_a
+    z = Z / ion_b
+    c = x * x + y * y + z * z - 1.0
+    ddx = dx / ion_a
+    ddy = dy / ion_a
+    ddz = dz / ion_b
+    A = ddx * ddx + ddy * ddy + ddz * ddz
+    B = x * ddx + y * ddy + z * ddz
+    alpha = (-B + np.sqrt(B * B - A * c)) / A
+    pp_x = X + alpha * dx
+    pp_y = Y + alpha * dy
+    pp_z = Z + alpha * dz
+
+    normal_x = pp_x / ion_a**2
+    normal_y = pp_y / ion_a**2
+    normal_z = pp_z / ion_b**2
+    norm_normal2 = normal_x**2 + normal_y**2 + normal_z**2
+    sin_lat2 = normal_z**2 / norm_normal2
+
+    g = 1.0 - _e2 * sin_lat2
+    sqrt_g = np.sqrt(g)
+    M = b2 / (_a * g * sqrt_g)
+    N = _a / sqrt_g
+
+    local_e2 = (M - N) / ((M + height) * sin_lat2 - N - height)
+    local_a = (N + height) * np.sqrt(1.0 - local_e2 * sin_lat2)
+    local_b = local_a * np.sqrt(1.0 - local_e2)
+    z_offset = ((1.0 - _e2) * N + height - (1.0 - local_e2) * (N + height)) * np.sqrt(
+        sin_lat2
+    )
+
+    x1 = X / local_a
+    y1 = Y / local_a
+    z1 = (Z - z_offset) / local_b
+    c1 = x1 * x1 + y1 * y1 + z1 * z1 - 1.0
+    ddx = dx / local_a
+    ddy = dy / local_a
+    ddz = dz / local_b
+    A = ddx * ddx + ddy * ddy + ddz * ddz
+    B = x1 * ddx + y1 * ddy + z1 * ddz
+    alpha = (-B + np.sqrt(B * B - A * c1)) / A
+    pp_x = X + alpha * dx
+    pp_y = Y + alpha * dy
+    pp_z = Z + alpha * dz
+
+    normal_x = pp_x / local_a**2
+    normal_y = pp_y / local_a**2
+    normal_z = (pp_z - z_offset) / local_b**2
+    norm_normal = np.sqrt(normal_x**2 + normal_y**2 + normal_z**2)
+    airmass = norm_normal / (dx * normal_x + dy * normal_y + dz * normal_z)
+
+    latpp, lonpp, _ = itrf_to_wgs84(pp_x, pp_y, pp_z)
+    return latpp, lonpp, lon, lat, airmass
+
+
+@functools.lru_cache(maxsize=1)
+def _wmm_coefficients():
+    """Schmidt semi-normalized WMM coefficients from RMextract's WMM.COF
+
+    Returns
+    -------
+    epoch : float
+    g, h, gdot, hdot : `numpy.ndarray`
+        with shape (n + 1, n + 1), indexed [n, m]
+    """
+    from RMextract import EMM
+
+    filename = os.path.join(os.path.dirname(EMM.__file__), "WMM.COF")
+    with open(filename) as f:
+        lines = f.read().splitlines()
+    epoch = float(lines[0].split()[0])
+    rows = []
+    for line in lines[1:]:
+        if line.startswith("9999"):
+            break
+        rows.append([float(x) for x in line.split()[:6]])
+    rows = np.array(rows)
+    nmax = int(rows[:, 0].max())
+    g, h, gdot, hdot = np.zeros((4, nmax + 1, nmax + 1))
+    n, m = rows[:, 0].astype(int), rows[:, 1].astype(int)
+    g[n, m], h[n, m], gdot[n, m], hdot[n, m] = rows[:, 2:].T
+    return epoch, g, h, gdot, hdot
+
+
+def geomagnetic_field(lat, lon, height, date):
+    """Geomagnetic field from the WMM model, for all positions at once
+
+    The same spherical-harmonic synthesis as the WMM model in RMextract
+    (`RMextract.EMM.EMM.WMM.getNED`), but vectorized over the positions.
+
+    Parameters
+    ----------
+    lat : `numpy.ndarray`
+        geodetic latitude (deg)
+    lon : `numpy.ndarray`
+        longitude (deg)
+    height : float or `numpy.ndarray`
+        height above the WGS84 ellipsoid (km)
+    date : float
+        decimal year
+
+    Returns
+    -------
+    north : `numpy.ndarray`
+    east : `numpy.ndarray`
+    down : `numpy.ndarray`
+        field components (nT)
+    """
+    epoch, g, h, gdot, hdot = _wmm_coefficients()
+    g = g + (date - epoch) * gdot
+    h = h + (date - epoch) * hdot
+    nmax = g.shape[0] - 1
+
+    # geodetic to geocentric spherical coordinates (km)
+    phi = np.radians(lat)
+    a = _a / 1e3
+    rc = a / np.sqrt(1 - _e2 * np.sin(phi) ** 2)
+    p = (rc + height) * np.cos(phi)
+    z = (rc * (1 - _e2) + height) * np.sin(phi)
+    r = np.sqrt(p**2 + z**2)
+    phic = np.arcsin(z / r)
+    cost = np.sin(phic)
+    sint = np.cos(phic)
+    lam = np.radians(lon)
+    ratio = 6371.2 / r
+
+    # (a / r)^(n + 2) for each degree
+    scales = [ratio**2]
+    for n in range(1, nmax + 1):
+        scales.append(scales[-1] * ratio)
+
+    # Gauss-normalized associated Legendre functions of the colatitude and their derivatives,
+    # computed order by order (so only two degrees are kept at a time),
+    # with the Schmidt normalization applied to the coefficients
+    schmidt = np.ones((nmax + 1, nmax + 1))
+    for n in range(1, nmax + 1):
+        schmidt[n, 0] = schmidt[n - 1, 0] * (2 * n - 1) / n
+        for m in range(1, n + 1):
+            schmidt[n, m] = schmidt[n, m - 1] * np.sqrt(
+                (n - m + 1) * (2 if m == 1 else 1) / (n + m)
+            )
+    g = g * schmidt
+    h = h * schmidt
+
+    Br = np.zeros_like(r)
+    Bt = np.zeros_like(r)
+    Bp = np.zeros_like(r)
+    cos1 = np.cos(lam)
+    sin1 = np.sin(lam)
+    cosm = np.ones_like(r)
+    sinm = np.zeros_like(r)
+    Pmm = np.ones_like(r)
+    dPmm = np.zeros_like(r)
+    for m in range(nmax + 1):
+        if m > 0:
+            Pmm, dPmm = sint * Pmm, sint * dPmm + cost * Pmm
+            cosm, sinm = cosm * cos1 - sinm * sin1, sinm * cos1 + cosm * sin1
+        P2 = dP2 = 0.0
+        P1, dP1 = Pmm, dPmm
+        degrees = range(max(m, 1), nmax + 1)
+        sP = []
+        sdP = []
+        for n in degrees:
+            if n > m:
+                K = ((n - 1) ** 2 - m**2) / ((2 * n - 1) * (2 * n - 3)) if n > 1 else 0
+                P1, P2, dP1, dP2 = (
+                    cost * P1 - K * P2,
+                    P1,
+                    cost * dP1 - sint * P1 - K * dP2,
+                    dP1,
+                )
+            sP.append(scales[n] * P1)
+            sdP.append(scales[n] * dP1)
+        # sums over degree of the terms multiplying cos(m lon) and sin(m lon)
+        n = np.array(degrees)
+        rg, rh, pg, ph = np.array(
+            [(n + 1) * g[n, m], (n + 1) * h[n, m], g[n, m], h[n, m]]
+        ) @ np.array(sP)
+        tg, th = np.array([g[n, m], h[n, m]]) @ np.array(sdP)
+        Br += cosm * rg + sinm * rh
+        Bt -= cosm * tg + sinm * th
+        Bp += m * (sinm * pg - cosm * ph)
+    Bp /= sint
+
+    # rotate from geocentric to geodetic north/down
+    north_c = -Bt
+    down_c = -Br
+    psi = phic - phi
+    north = north_c * np.cos(psi) - down_c * np.sin(psi)
+    down = north_c * np.sin(psi) + down_c * np.cos(psi)
+    return north, Bp, down
+
+
+def projected_field(latpp, lonpp, lon, lat, date, height=ION_HEIGHT):
+    """Geomagnetic field projected along the lines of sight
+
+    Uses the WMM model from RMextract (see :func:`geomagnetic_field`),
+    evaluated for all of the pierce points at once
+
+    Parameters
+    ----------
+    latpp : `numpy.ndarray`
+        latitude of the pierce points (deg)
+    lonpp : `numpy.ndarray`
+        longitude of the pierce points (deg)
+    lon : `numpy.ndarray`
+        longitude of the line of sight direction (rad)
+    lat : `numpy.ndarray`
+        latitude of the line of sight direction (rad)
+    date : float
+        decimal year
+    height : float, optional
+        height of the ionosphere (m)
+
+    Returns
+    -------
+    Bpar : `numpy.ndarray`
+        field (nT) along the line of sight, positive towards the observer
+    """
+    latpp = np.asarray(latpp, dtype=float)
+    lonpp = np.asarray(lonpp, dtype=float)
+    north, east, down = np.zeros((3,) + latpp.shape)
+    # in blocks small enough for the intermediate arrays to stay in cache
+    for i in range(0, latpp.size, FIELD_CHUNK):
+        block = np.unravel_index(
+            np.arange(i, min(i + FIELD_CHUNK, latpp.size)), latpp.shape
+        )
+        north[block], east[block], down[block] = geomagnetic_field(
+            latpp[block], lonpp[block], height / 1.0e3, date
+        )
+    # to ITRF X/Y/Z, as RMextract.EMM.EMM.WMM.getXYZ
+    phi = np.radians(latpp)
+    lam = np.radians(lonpp)
+    x = -np.cos(phi) * np.cos(lam) * down - np.sin(phi) * np.cos(lam) * north
+    x -= np.sin(lam) * east
+    y = -np.cos(phi) * np.sin(lam) * down - np.sin(phi) * np.sin(lam) * north
+    y += np.cos(lam) * east
+    z = -np.sin(phi) * down + np.cos(phi) * north
+    # minus sign since the radiation is towards the Earth
+    return -(
+        np.sin(lat) * z + np.cos(lat) * np.cos(lon) * x + np.cos(lat) * np.sin(lon) * y
+    )
+
+
+def decimal_year(date):
+    """Decimal year as used by RMextract for the geomagnetic model
+
+    Parameters
+    ----------
+    date : `datetime.date`
+
+    Returns
+    -------
+    year : float
+    """
+    return date.year + float(date.timetuple().tm_yday) / 365.0
+
+
+def ionex_window(hours, latpp, lonpp):
+    """Range of times and pierce points to load from an IONEX file
+
+    Parameters
+    ----------
+    hours : `numpy.ndarray`
+        times (hours of the day)
+    latpp : `numpy.ndarray`
+        latitudes of the pierce points (deg)
+    lonpp : `numpy.ndarray`
+        longitudes of the pierce points (deg)
+
+    Returns
+    -------
+    window : tuple
+        ((hour1, hour2), (lat1, lat2), (lon1, lon2)), for :func:`simpleRM.ionex.load_ionex`
+    """
+    return tuple((float(np.min(x)), float(np.max(x))) for x in (hours, latpp, lonpp))
+
+
+def _rm_from_altaz(tecinfo, altaz, position, hours, date, ionexf=None):
+    """RM for positions in a site's alt/az frame on a single day (any shape)
+
+    If `tecinfo` is None, only the part of `ionexf` covering the times and pierce points is loaded
+    """
+    with profiling.stage("geometry"):
+        latpp, lonpp, lon, lat, airmass = pierce_points(
+            altaz.az.rad, altaz.alt.rad, position
+        )
+    if tecinfo is None:
+        tecinfo = ionex.load_ionex(ionexf, window=ionex_window(hours, latpp, lonpp))
+    with profiling.stage("tec_interpolation"):
+        vTEC = ionex.interpolate_tec(tecinfo, hours, latpp, lonpp)
+    with profiling.stage("field"):
+        # imported here since it uses this module
+        from simpleRM import field
+
+        Bpar = field.projected_field(
+            altaz.az.rad,
+            altaz.alt.rad,
+            latpp,
+            lonpp,
+            lon,
+            lat,
+            position,
+            decimal_year(date),
+        )
+    return Bpar * vTEC * airmass * RM_CONSTANT
+
+
+def compute_rm(
+    pointings,
+    sites,
+    times,
+    ionexPath="./IONEXdata/",
+    server="http://ftp.aiub.unibe.ch/CODE/",
+    window=False,
+):
+    """Compute RM for many positions and sites at a common set of times
+
+    Parameters
+    ----------
+    pointings : `astropy.coordinates.SkyCoord`
+        Positions (1-D array)
+    sites : list
+        list of `astropy.coordinates.EarthLocation`
+    times : `astropy.time.Time`
+        Times (1-D array)
+    ionexPath : str, optional
+    server : str, optional
+    window : bool, optional
+        Only load the IONEX maps and area needed for each site and day (see :func:`ionex_window`),
+        rather than the whole file (which is better when the same files are used many times)
+
+    Returns
+    -------
+    RM : `numpy.ndarray`
+        RM with shape (source, site, time)
+    """
+    RM = np.zeros((len(pointings), len(sites), len(times)))
+    mjd = times.utc.mjd
+    day = np.floor(mjd).astype(int)
+    hours = (mjd - day) * 24
+
+    for d in np.unique(day):
+        indices = np.nonzero(day == d)[0]
+        date = ionex.mjd_to_date(d)
+        logger.debug(f"Computing for {len(indices)} times on {date}")
+        ionexf = ionex.get_ionex_file(date, ionexPath, server)
+        tecinfo = None if window else ionex.load_ionex(ionexf)
+
+        for j, site in enumerate(sites):
+            position = [x.to_value(u.m) for x in site.to_geocentric()]
+            with profiling.stage("geometry"):
+                frame = AltAz(obstime=times[indices], location=site)
+                altaz = pointings.reshape((-1, 1)).transform_to(frame)
+            RM[:, j, indices] = _rm_from_altaz(
+                tecinfo,
+                altaz,
+                position,
+                np.broadcast_to(hours[indices], altaz.shape),
+                date,
+                ionexf=ionexf,
+            )
+    return RM
+
+
+def compute_rm_samples(
+    pointings,
+    site,
+    times,
+    ionexPath="./IONEXdata/",
+    server="http://ftp.aiub.unibe.ch/CODE/",
+):
+    """Compute RM for a single site at a set of (position, time) pairs
+
+    Parameters
+    ----------
+    pointings : `astropy.coordinates.SkyCoord`
+        Positions (1-D array)
+    site : `astropy.coordinates.EarthLocation`
+    times : `astropy.time.Time`
+        Times (1-D array, same length as `pointings`)
+    ionexPath : str, optional
+    server : str, optional
+
+    Returns
+    -------
+    RM : `numpy.ndarray`
+        RM for each pair
+    """
+    RM = np.zeros(len(times))
+    mjd = times.utc.mjd
+    day = np.floor(mjd).astype(int)
+    hours = (mjd - day) * 24
+    position = [x.to_value(u.m) for x in site.to_geocentric()]
+
+    for d in np.unique(day):
+        indices = np.nonzero(day == d)[0]
+        date = ionex.mjd_to_date(d)
+        logger.debug(f"Computing for {len(indices)} samples on {date}")
+        tecinfo = ionex.load_ionex(ionex.get_ionex_file(date, ionexPath, server))
+        with profiling.stage("geometry"):
+            frame = AltAz(obstime=times[indices], location=site)
+            altaz = pointings[indices].transform_to(frame)
+        RM[indices] = _rm_from_altaz(tecinfo, altaz, position, hours[indices], date)
+    return RM
@@ -0,0 +1,327 @@
+import functools
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+from loguru import logger
+
+from simpleRM import engine
+from simpleRM import profiling
+from simpleRM.grid import _index
+
+# the field is evaluated directly unless enabled
+_tolerance = None
+_directory = None
+
+
+def enable(tolerance=2.0, directory=None):
+    """Use precomputed grids of the projected field in the native engine
+
+    Parameters
+    ----------
+    tolerance : float, optional
+        Maximum interpolation error of the grids (nT)
+    directory : str, optional
+        Directory to store the grids in, so they are reused by later runs
+        (they are always reused within a process)
+    """
+    global _tolerance, _directory
+    _tolerance = tolerance
+    _directory = directory
+    if directory is not None and not os.path.isdir(directory):
+        os.makedirs(directory, exist_ok=True)
+
+
+def disable():
+    """Evaluate the field directly again"""
+    global _tolerance, _directory
+    _tolerance = None
+    _directory = None
+
+
+def enabled():
+    """Whether the field grids are used
+
+    Returns
+    -------
+    enabled : bool
+    """
+    return _tolerance is not None
+
+
+def settings():
+    """The settings from :func:`enable`, to use the same grids in another process
+
+    Worker processes that are spawned rather than forked start with the grids disabled,
+    so pass these to :func:`use_settings` in the worker (e.g. as the `initializer` of the pool).
+
+    Returns
+    -------
+    settings : dict or None
+        arguments for :func:`enable`, or None if the grids are not used
+    """
+    if _tolerance is None:
+        return None
+    return {"tolerance": _tolerance, "directory": _directory}
+
+
+def use_settings(settings):
+    """Use (or not use) the grids according to the settings from :func:`settings`
+
+    Parameters
+    ----------
+    settings : dict or None
+    """
+    if settings is None:
+        disable()
+    else:
+        enable(**settings)
+
+
+def _evaluate(az, el, position, date):
+    """Projected field (nT) for az/el (deg) from a site"""
+    latpp, lonpp, lon, lat, _ = engine.pierce_points(
+        np.radians(az), np.radians(el), position
+    )
+    return engine.projected_field(latpp, lonpp, lon, lat, date)
+
+
+class FieldGrid:
+    """Geomagnetic field along the lines of sight from one site, on an azimuth/elevation grid
+
+    The field projected along the line of sight through the ionospheric pierce point only depends
+    on the site, the azimuth and elevation, and the date (the model changes very slowly),
+    so it can be computed once and interpolated (bilinearly) for every time and source.
+
+    Parameters
+    ----------
+    az : `numpy.ndarray`
+        uniformly-spaced azimuth from 0 to 360 deg
+    el : `numpy.ndarray`
+        uniformly-spaced elevation from 0 to 90 deg
+    Bpar : `numpy.ndarray`
+        field (nT) with shape (az, el), as for :func:`simpleRM.engine.projected_field`
+    error : float
+        maximum interpolation error (nT), estimated at the centers of the cells
+    metadata : dict, optional
+    """
+
+    def __init__(self, az, el, Bpar, error, metadata=None):
+        self.az = az
+        self.el = el
+        self.Bpar = Bpar
+        self.error = error
+        self.metadata = dict(metadata or {})
+
+    def __repr__(self):
+        return f"<FieldGrid: {self.Bpar.shape} with error {self.error:.3g} nT>"
+
+    @classmethod
+    def _evaluate(cls, position, date, resolution):
+        az = np.linspace(0, 360, int(round(360 / resolution)) + 1)
+        el = np.linspace(0, 90, int(round(90 / resolution)) + 1)
+        AZ, EL = np.meshgrid(az, el, indexing="ij")
+        return cls(az, el, _evaluate(AZ, EL, position, date), np.inf)
+
+    @classmethod
+    def build(cls, position, date, tolerance=2.0, resolution=1.0, min_resolution=0.125):
+        """Compute the field on a grid fine enough to interpolate within `tolerance`
+
+        Starting from `resolution`, the grid is halved until its error is within `tolerance`
+        (or `min_resolution` is reached).  The error of each grid is estimated from
+        the error of the grid twice as coarse at the centers of its cells (which are points of the finer grid),
+        since the error of bilinear interpolation falls as the square of the spacing.
+
+        Parameters
+        ----------
+        position : list
+            geocentric position of the site (m)
+        date : float
+            decimal year
+        tolerance : float, optional
+            maximum interpolation error (nT)
+        resolution : float, optional
+            initial grid spacing (deg)
+        min_resolution : float, optional
+            finest grid spacing (deg)
+
+        Returns
+        -------
+        grid : `FieldGrid`
+        """
+        coarse = cls._evaluate(position, date, resolution)
+        while True:
+            resolution /= 2
+            grid = cls._evaluate(position, date, resolution)
+            AZ, EL = np.meshgrid(grid.az[1::2], grid.el[1::2], indexing="ij")
+            grid.error = (
+                float(np.max(np.abs(coarse(AZ, EL) - grid.Bpar[1::2, 1::2]))) / 4
+            )
+            logger.debug(
+                f"Field grid with resolution {resolution} deg has error {grid.error:.3g} nT"
+            )
+            if grid.error <= tolerance or resolution / 2 < min_resolution:
+                break
+            coarse = grid
+        if grid.error > tolerance:
+            logger.warning(
+                f"Field grid error {grid.error:.3g} nT is more than the tolerance of {tolerance} nT"
+            )
+        grid.metadata = {
+            "position": list(position),
+            "date": date,
+            "resolution": resolution,
+            "tolerance": tolerance,
+        }
+        return grid
+
+    def __call__(self, az, el):
+        """Interpolate the field
+
+        Parameters
+        ----------
+        az : `numpy.ndarray`
+            azimuth (deg)
+        el : `numpy.ndarray`
+            elevation (deg), from 0 to 90
+
+        Returns
+        -------
+        Bpar : `numpy.ndarray`
+        """
+        ix, wx, _ = _index(self.az, az, periodic=True)
+        iy, wy, _ = _index(self.el, el)
+        return (
+            (1 - wx) * (1 - wy) * self.Bpar[ix, iy]
+            + wx * (1 - wy) * self.Bpar[ix + 1, iy]
+            + (1 - wx) * wy * self.Bpar[ix, iy + 1]
+            + wx * wy * self.Bpar[ix + 1, iy + 1]
+        )
+
+    def save(self, filename):
+        """Write the grid to an npz file
+
+        Parameters
+        ----------
+        filename : str
+        """
+        fd, tmpname = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(filename)), suffix=".tmp"
+        )
+        with os.fdopen(fd, "wb") as f:
+            np.savez(
+                f,
+                az=self.az,
+                el=self.el,
+                Bpar=self.Bpar,
+                error=self.error,
+                metadata=np.array(json.dumps(self.metadata)),
+            )
+        os.replace(tmpname, filename)
+
+    @classmethod
+    def load(cls, filename):
+        """Read a grid written by :meth:`save`
+
+        Parameters
+        ----------
+        filename : str
+
+        Returns
+        -------
+        grid : `FieldGrid`
+        """
+        with np.load(filename) as data:
+            return cls(
+                data["az"],
+                data["el"],
+                data["Bpar"],
+                float(data["error"]),
+                metadata=json.loads(str(data["metadata"])),
+            )
+
+
+@functools.lru_cache(maxsize=32)
+def _get_grid(position, date, tolerance, directory):
+    filename = None
+    if directory is not None:
+        key = json.dumps([position, f"{date:.6f}", tolerance])
+        filename = os.path.join(
+            directory, f"field_{hashlib.sha1(key.encode()).hexdigest()}.npz"
+        )
+        try:
+            grid = FieldGrid.load(filename)
+            logger.debug(f"Read field grid from {filename}")
+            return grid
+        except (FileNotFoundError, OSError, KeyError, ValueError):
+            pass
+    with profiling.stage("field_grid"):
+        grid = FieldGrid.build(list(position), date, tolerance=tolerance)
+    if filename is not None:
+        try:
+            grid.save(filename)
+        except OSError as e:
+            logger.warning(f"Unable to store field grid in {directory}: {e}")
+    return grid
+
+
+def get_grid(position, date, tolerance=2.0, directory=None):
+    """Field grid for a site and date, computed once per process (and once per `directory`)
+
+    Parameters
+    ----------
+    position : list
+        geocentric position of the site (m)
+    date : float
+        decimal year
+    tolerance : float, optional
+        maximum interpolation error (nT)
+    directory : str, optional
+
+    Returns
+    -------
+    grid : `FieldGrid`
+    """
+    # rounded so that the same site always gives the same grid
+    position = tuple(float(np.round(x)) for x in position)
+    return _get_grid(position, date, tolerance, directory)
+
+
+def projected_field(az, el, latpp, lonpp, lon, lat, position, date):
+    """Projected field, interpolated from a grid if enabled
+
+    Takes the directions and their pierce points (from :func:`simpleRM.engine.pierce_points`);
+    the field is evaluated directly if the grids are not enabled, and for points below the horizon.
+
+    Parameters
+    ----------
+    az : `numpy.ndarray`
+        azimuth (rad)
+    el : `numpy.ndarray`
+        elevation (rad)
+    latpp : `numpy.ndarray`
+    lonpp : `numpy.ndarray`
+    lon : `numpy.ndarray`
+    lat : `numpy.ndarray`
+    position : list
+        geocentric position of the site (m)
+    date : float
+        decimal year
+
+    Returns
+    -------
+    Bpar : `numpy.ndarray`
+    """
+    if not enabled():
+        return engine.projected_field(latpp, lonpp, lon, lat, date)
+    grid = get_grid(position, date, tolerance=_tolerance, directory=_directory)
+    el = np.degrees(el)
+    Bpar = grid(np.degrees(az), np.maximum(el, 0))
+    below = el < 0
+    if np.any(below):
+        Bpar[below] = engine.projected_field(
+            latpp[below], lonpp[below], lon[below], lat[below], date
+        )
+    return Bpar
@@ -0,0 +1,345 @@
+import json
+import os
+import tempfile
+
+import numpy as np
+from astropy import units as u
+from astropy.time import Time
+from astropy.coordinates import EarthLocation, SkyCoord, TETE
+from loguru import logger
+
+from simpleRM import engine
+from simpleRM import ionex
+from simpleRM import profiling
+from simpleRM import sites
+
+
+def _index(axis, values, periodic=False):
+    """Index and weight for linear interpolation on a uniform axis, and which values are outside it"""
+    step = (axis[-1] - axis[0]) / (len(axis) - 1)
+    if periodic:
+        values = np.remainder(values - axis[0], 360.0) + axis[0]
+    f = (values - axis[0]) / step
+    # allow for rounding at the ends
+    outside = ~((f > -1e-6) & (f < len(axis) - 1 + 1e-6))
+    f = np.clip(np.nan_to_num(f), 0, len(axis) - 1)
+    i = np.minimum(np.floor(f).astype(int), len(axis) - 2)
+    return i, f - i, outside
+
+
+def _azel(ra, dec, last, latitude):
+    """Azimuth and elevation (deg) from apparent hour angle, declination and site latitude (rad)"""
+    H = last - ra
+    sin_el = np.sin(latitude) * np.sin(dec) + np.cos(latitude) * np.cos(dec) * np.cos(H)
+    el = np.arcsin(np.clip(sin_el, -1, 1))
+    az = np.arctan2(
+        -np.cos(dec) * np.sin(H),
+        np.sin(dec) * np.cos(latitude) - np.cos(dec) * np.sin(latitude) * np.cos(H),
+    )
+    return np.remainder(np.degrees(az), 360), np.degrees(el)
+
+
+class RMGrid:
+    """RM precomputed for one site over a range of times and the whole sky
+
+    The grid covers (time, azimuth, elevation) or (time, RA, Dec), and is interpolated
+    (linearly in each axis) for any number of positions and times at once.
+    Positions below the minimum elevation of the grid, or times outside it, give NaN.
+
+    Build a grid with :meth:`build`, and store it with :meth:`save` and :meth:`load`:
+
+    >>> grid = RMGrid.build("CHIME", starttime, stoptime, frame="radec")
+    >>> RM = grid.query(ra, dec, times)
+
+    Parameters
+    ----------
+    frame : str
+        "altaz" or "radec"
+    mjd : `numpy.ndarray`
+        uniformly-spaced times of the grid (MJD, UTC)
+    x : `numpy.ndarray`
+        uniformly-spaced azimuth or RA from 0 to 360 deg
+    y : `numpy.ndarray`
+        uniformly-spaced elevation or Dec (deg)
+    RM : `numpy.ndarray`
+        RM with shape (time, x, y)
+    site : `astropy.coordinates.EarthLocation`
+    metadata : dict, optional
+    """
+
+    def __init__(self, frame, mjd, x, y, RM, site, metadata=None):
+        if frame not in ["altaz", "radec"]:
+            raise ValueError(f"Unknown frame '{frame}'")
+        self.frame = frame
+        self.mjd = np.asarray(mjd, dtype=np.float64)
+        self.x = np.asarray(x, dtype=np.float64)
+        self.y = np.asarray(y, dtype=np.float64)
+        self.RM = RM
+        self.site = site
+        self.metadata = dict(metadata or {})
+
+    def __repr__(self):
+        return f"<RMGrid ({self.frame}): {self.RM.shape} from MJD {self.mjd[0]} to {self.mjd[-1]}>"
+
+    @classmethod
+    def build(
+        cls,
+        site,
+        starttime,
+        stoptime,
+        timestep=300 * u.s,
+        frame="altaz",
+        resolution=1 * u.deg,
+        min_elevation=5 * u.deg,
+        ionexPath="./IONEXdata/",
+        server="http://ftp.aiub.unibe.ch/CODE/",
+    ):
+        """Compute RM over the sky for a site and a range of times
+
+        Uses the calculation from `simpleRM.engine`.
+        The pierce points and the geomagnetic field only depend on azimuth and elevation (and the day),
+        so they are computed once and only the TEC is interpolated for each time.
+        A "radec" grid is then resampled from the "altaz" grid.
+
+        Parameters
+        ----------
+        site : `astropy.coordinates.EarthLocation` or str
+        starttime : `astropy.time.Time`
+        stoptime : `astropy.time.Time`
+        timestep : `astropy.units.Quantity`, optional
+        frame : str, optional
+            "altaz" or "radec"
+        resolution : `astropy.units.Quantity`, optional
+            grid spacing on the sky
+        min_elevation : `astropy.units.Quantity`, optional
+        ionexPath : str, optional
+        server : str, optional
+
+        Returns
+        -------
+        grid : `RMGrid`
+        """
+        if isinstance(site, str):
+            site = sites.get_site(site)
+        position = [x.to_value(u.m) for x in site.to_geocentric()]
+        step = timestep.to_value(u.s)
+        n = int(np.ceil((stoptime - starttime).to_value(u.s) / step - 1e-6)) + 1
+        mjd = starttime.utc.mjd + np.arange(max(n, 2)) * step / 86400
+        res = resolution.to_value(u.deg)
+        min_el = min_elevation.to_value(u.deg)
+        az = np.linspace(0, 360, int(round(360 / res)) + 1)
+        el = np.linspace(min_el, 90, max(int(round((90 - min_el) / res)), 1) + 1)
+        logger.debug(
+            f"Building RM grid of {len(mjd)} times x {len(az)} azimuths x {len(el)} elevations"
+        )
+
+        AZ, EL = np.meshgrid(np.radians(az), np.radians(el), indexing="ij")
+        with profiling.stage("geometry"):
+            latpp, lonpp, lon, lat, airmass = engine.pierce_points(AZ, EL, position)
+        RM = np.zeros((len(mjd), len(az), len(el)), dtype=np.float32)
+        day = np.floor(mjd).astype(int)
+        hours = (mjd - day) * 24
+        ionex_files = []
+        for d in np.unique(day):
+            indices = np.nonzero(day == d)[0]
+            date = ionex.mjd_to_date(d)
+            ionexf = ionex.get_ionex_file(date, ionexPath, server)
+            ionex_files.append(os.path.basename(ionexf))
+            tecinfo = ionex.load_ionex(ionexf)
+            with profiling.stage("field"):
+                Bpar = engine.projected_field(
+                    latpp, lonpp, lon, lat, engine.decimal_year(date)
+                )
+            with profiling.stage("tec_interpolation"):
+                vTEC = ionex.interpolate_tec(
+                    tecinfo, hours[indices, None, None], latpp[None], lonpp[None]
+                )
+            RM[indices] = Bpar * vTEC * airmass * engine.RM_CONSTANT
+
+        grid = cls(
+            "altaz",
+            mjd,
+            az,
+            el,
+            RM,
+            site,
+            metadata={
+                "resolution": res,
+                "min_elevation": min_el,
+                "timestep": step,
+                "ionex_server": server,
+                "ionex_files": ionex_files,
+                "ionex": ionex.provenance(
+                    [ionex.mjd_to_date(d) for d in np.unique(day)], ionexPath
+                ),
+            },
+        )
+        if frame == "radec":
+            grid = grid.to_radec(resolution)
+        elif frame != "altaz":
+            raise ValueError(f"Unknown frame '{frame}'")
+        return grid
+
+    def _apparent_azel(self, coords, mjd):
+        """Azimuth and elevation (deg) of positions at times (broadcast together)
+
+        The positions are converted to apparent coordinates once (at the middle time)
+        and then to azimuth and elevation with the apparent sidereal time,
+        which is much faster than `astropy.coordinates.AltAz` for many times
+        """
+        middle = Time(np.mean(mjd), format="mjd", scale="utc")
+        apparent = coords.transform_to(TETE(obstime=middle))
+        lst = (
+            Time(mjd, format="mjd", scale="utc")
+            .sidereal_time("apparent", longitude=self.site.lon)
+            .rad
+        )
+        return _azel(apparent.ra.rad, apparent.dec.rad, lst, self.site.lat.rad)
+
+    def to_radec(self, resolution=None):
+        """Resample an "altaz" grid in RA and Dec
+
+        Parameters
+        ----------
+        resolution : `astropy.units.Quantity`, optional
+            grid spacing (default is the same as this grid)
+
+        Returns
+        -------
+        grid : `RMGrid`
+        """
+        if self.frame != "altaz":
+            raise ValueError("Only an altaz grid can be resampled")
+        res = (
+            resolution.to_value(u.deg)
+            if resolution is not None
+            else self.metadata.get("resolution", self.x[1] - self.x[0])
+        )
+        ra = np.linspace(0, 360, int(round(360 / res)) + 1)
+        dec = np.linspace(-90, 90, int(round(180 / res)) + 1)
+        RA, DEC = np.meshgrid(ra, dec, indexing="ij")
+        RM = np.zeros((len(self.mjd), len(ra), len(dec)), dtype=np.float32)
+        with profiling.stage("geometry"):
+            middle = Time(np.mean(self.mjd), format="mjd", scale="utc")
+            apparent = SkyCoord(RA * u.deg, DEC * u.deg).transform_to(
+                TETE(obstime=middle)
+            )
+            lst = (
+                Time(self.mjd, format="mjd", scale="utc")
+                .sidereal_time("apparent", longitude=self.site.lon)
+                .rad
+            )
+        for i in range(len(self.mjd)):
+            az, el = _azel(apparent.ra.rad, apparent.dec.rad, lst[i], self.site.lat.rad)
+            RM[i] = self.query(az, el, self.mjd[i])
+        return RMGrid(
+            "radec",
+            self.mjd,
+            ra,
+            dec,
+            RM,
+            self.site,
+            metadata=dict(self.metadata, resolution=res),
+        )
+
+    def query(self, x, y, times):
+        """Interpolate RM
+
+        Parameters
+        ----------
+        x : `numpy.ndarray` or float
+            azimuth or RA (deg, depending on the frame)
+        y : `numpy.ndarray` or float
+            elevation or Dec (deg, depending on the frame)
+        times : `astropy.time.Time` or `numpy.ndarray`
+            times (or MJD, UTC); broadcast with `x` and `y`
+
+        Returns
+        -------
+        RM : `numpy.ndarray`
+        """
+        mjd = times.utc.mjd if isinstance(times, Time) else times
+        t, x, y = np.broadcast_arrays(
+            np.asarray(mjd, dtype=float),
+            np.asarray(x, dtype=float),
+            np.asarray(y, dtype=float),
+        )
+        it, wt, outside_t = _index(self.mjd, t)
+        ix, wx, outside_x = _index(self.x, x, periodic=True)
+        iy, wy, outside_y = _index(self.y, y)
+        RM = np.zeros(t.shape)
+        for dt, ft in ((0, 1 - wt), (1, wt)):
+            for dx, fx in ((0, 1 - wx), (1, wx)):
+                for dy, fy in ((0, 1 - wy), (1, wy)):
+                    RM += ft * fx * fy * self.RM[it + dt, ix + dx, iy + dy]
+        RM[outside_t | outside_x | outside_y] = np.nan
+        return RM[()]
+
+    def query_coords(self, coords, times):
+        """Interpolate RM for sky positions
+
+        Parameters
+        ----------
+        coords : `astropy.coordinates.SkyCoord`
+        times : `astropy.time.Time`
+            broadcast with `coords`
+
+        Returns
+        -------
+        RM : `numpy.ndarray`
+        """
+        if self.frame == "radec":
+            icrs = coords.icrs
+            return self.query(icrs.ra.deg, icrs.dec.deg, times)
+        mjd = np.broadcast_to(
+            times.utc.mjd, np.broadcast(coords.ra.deg, times.jd).shape
+        )
+        az, el = self._apparent_azel(coords, mjd)
+        return self.query(az, el, mjd)
+
+    def save(self, filename):
+        """Write the grid to an (uncompressed) npz file
+
+        Parameters
+        ----------
+        filename : str
+        """
+        fd, tmpname = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(filename)), suffix=".tmp"
+        )
+        with os.fdopen(fd, "wb") as f:
+            np.savez(
+                f,
+                frame=np.array(self.frame),
+                mjd=self.mjd,
+                x=self.x,
+                y=self.y,
+                RM=self.RM,
+                site=np.array([x.to_value(u.m) for x in self.site.to_geocentric()]),
+                metadata=np.array(json.dumps(self.metadata)),
+            )
+        os.replace(tmpname, filename)
+        logger.debug(f"Wrote RM grid to {filename}")
+
+    @classmethod
+    def load(cls, filename):
+        """Read a grid written by :meth:`save`
+
+        Parameters
+        ----------
+        filename : str
+
+        Returns
+        -------
+        grid : `RMGrid`
+        """
+        with np.load(filename) as data:
+            return cls(
+                str(data["frame"]),
+                data["mjd"],
+                data["x"],
+                data["y"],
+                data["RM"],
+                EarthLocation.from_geocentric(*data["site"], unit=u.m),
+                metadata=json.loads(str(data["metadata"])),
+            )
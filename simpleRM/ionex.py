@@ -0,0 +1,577 @@
+import datetime
+import functools
+import hashlib
+import os
+import tempfile
+
+import numpy as np
+from loguru import logger
+
+from simpleRM import profiling
+
+# MJD 0
+_mjd_epoch = datetime.date(1858, 11, 17)
+# prefixes of the CODE IONEX products, best first
+products = {"final": "CODG", "rapid": "CORG", "predicted": "COPG"}
+
+
+def mjd_to_date(mjd):
+    """Calendar date for an integer MJD
+
+    Parameters
+    ----------
+    mjd : int
+
+    Returns
+    -------
+    date : `datetime.date`
+    """
+    return _mjd_epoch + datetime.timedelta(days=int(mjd))
+
+
+def ionex_filename(date, prefix="CODG"):
+    """Name of the IONEX file for a given day
+
+    Follows the naming used by RMextract for files in `ionexPath`
+
+    Parameters
+    ----------
+    date : `datetime.date`
+    prefix : str, optional
+
+    Returns
+    -------
+    filename : str
+    """
+    doy = date.timetuple().tm_yday
+    return f"{prefix.upper()}{doy:03d}0.{date.year % 100:02d}I"
+
+
+def ionex_dates(starttime, stoptime, timestep=None):
+    """Days needed to cover a range of times
+
+    Parameters
+    ----------
+    starttime : `astropy.time.Time`
+    stoptime : `astropy.time.Time`
+    timestep : `astropy.units.Quantity`, optional
+        if supplied, include the one timestep of padding that RMextract adds at each end
+
+    Returns
+    -------
+    dates : list
+        list of `datetime.date`
+    """
+    step = timestep.to_value("d") if timestep is not None else 0
+    return [
+        mjd_to_date(mjd)
+        for mjd in range(
+            int(np.floor(starttime.mjd - step)),
+            int(np.floor(stoptime.mjd + step)) + 1,
+        )
+    ]
+
+
+def find_ionex_file(date, ionexPath):
+    """Best IONEX product already in `ionexPath` for a single day
+
+    Parameters
+    ----------
+    date : `datetime.date`
+    ionexPath : str
+
+    Returns
+    -------
+    ionexf : str or None
+    product : str or None
+        "final", "rapid" or "predicted" (see `products`)
+    """
+    for product, prefix in products.items():
+        ionexf = os.path.join(ionexPath, ionex_filename(date, prefix))
+        if os.path.exists(ionexf):
+            return ionexf, product
+    return None, None
+
+
+def ionex_product(filename):
+    """Product of an IONEX file from its name
+
+    Parameters
+    ----------
+    filename : str
+
+    Returns
+    -------
+    product : str or None
+        "final", "rapid" or "predicted", or None if the prefix is not known
+    """
+    prefix = os.path.basename(filename)[:4].upper()
+    for product, p in products.items():
+        if p == prefix:
+            return product
+    return None
+
+
+@functools.lru_cache(maxsize=64)
+def _file_hash(filename, size, mtime):
+    h = hashlib.sha256()
+    with open(filename, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def file_hash(filename):
+    """SHA-256 of a file (remembered until the file changes)
+
+    Parameters
+    ----------
+    filename : str
+
+    Returns
+    -------
+    sha256 : str
+    """
+    st = os.stat(filename)
+    return _file_hash(os.path.abspath(filename), st.st_size, st.st_mtime_ns)
+
+
+def provenance(dates, ionexPath):
+    """Describe the IONEX files used for a set of days
+
+    Parameters
+    ----------
+    dates : list
+        list of `datetime.date`
+    ionexPath : str
+
+    Returns
+    -------
+    ionex : list
+        dict for each day with "date" (ISO), "file", "product" and "sha256"
+        (the file and product are None if there is no file for that day)
+    """
+    result = []
+    for date in dates:
+        ionexf, product = find_ionex_file(date, ionexPath)
+        result.append(
+            {
+                "date": date.isoformat(),
+                "file": os.path.basename(ionexf) if ionexf is not None else None,
+                "product": product,
+                "sha256": file_hash(ionexf) if ionexf is not None else None,
+            }
+        )
+    return result
+
+
+@profiling.timed("ionex_download")
+def get_ionex_file(date, ionexPath, server, prefix="codg"):
+    """Locate (and download if needed) the IONEX file for a single day
+
+    Uses the best product already in `ionexPath` (see `products`),
+    and otherwise downloads the one given by `prefix` with :func:`simpleRM.prefetch.fetch_ionex`
+    (so `server` can also be a local mirror directory or a "file://" URL)
+
+    Parameters
+    ----------
+    date : `datetime.date` or tuple
+        date, or (year, month, day, fraction) as returned by `RMextract.PosTools.obtain_observation_year_month_day_fraction`
+    ionexPath : str
+    server : str
+    prefix : str, optional
+
+    Returns
+    -------
+    ionexf : str
+    """
+    # imported here since prefetch imports this module
+    from simpleRM import prefetch
+
+    profiling.count("ionex_files")
+    if not isinstance(date, datetime.date):
+        date = datetime.date(*[int(x) for x in date[:3]])
+    ionexf, _ = find_ionex_file(date, ionexPath)
+    if ionexf is not None:
+        return ionexf
+    return prefetch.fetch_ionex(
+        date, ionexPath=ionexPath, server=server, prefix=prefix.upper()
+    )
+
+
+def _read_header(lines):
+    """Parse the header of an IONEX file
+
+    Parameters
+    ----------
+    lines : list
+        lines of the file
+
+    Returns
+    -------
+    header : dict
+    nheader : int
+        number of header lines
+    """
+    header = {"exponent": -1}
+    for i, line in enumerate(lines):
+        label = line[60:].strip()
+        if label == "END OF HEADER":
+            break
+        if label == "EPOCH OF FIRST MAP":
+            header["start"] = datetime.datetime(
+                *(int(float(x)) for x in line[:60].split())
+            )
+        elif label == "EPOCH OF LAST MAP":
+            header["stop"] = datetime.datetime(
+                *(int(float(x)) for x in line[:60].split())
+            )
+        elif label == "INTERVAL":
+            header["interval"] = float(line[:60].split()[0])
+        elif label == "EXPONENT":
+            header["exponent"] = int(line[:60].split()[0])
+        elif label == "# OF MAPS IN FILE":
+            header["nmaps"] = int(line[:60].split()[0])
+        elif label == "LAT1 / LAT2 / DLAT":
+            header["lat"] = [float(x) for x in line[:60].split()[:3]]
+        elif label == "LON1 / LON2 / DLON":
+            header["lon"] = [float(x) for x in line[:60].split()[:3]]
+    return header, i + 1
+
+
+def _axes(header):
+    """Construct the coordinate axes from an IONEX header
+
+    Parameters
+    ----------
+    header : dict
+
+    Returns
+    -------
+    lons : `numpy.ndarray`
+        longitudes (deg)
+    lats : `numpy.ndarray`
+        latitudes (deg)
+    hours : `numpy.ndarray`
+        times of the maps (hours from the start of the day of the first map)
+    """
+    lon1, lon2, dlon = header["lon"]
+    lat1, lat2, dlat = header["lat"]
+    lons = lon1 + dlon * np.arange(int(round((lon2 - lon1) / dlon)) + 1)
+    lats = lat1 + dlat * np.arange(int(round((lat2 - lat1) / dlat)) + 1)
+    start = header["start"]
+    interval = header.get("interval", 0)
+    if interval <= 0:
+        # interval of 0 means maps are irregular: assume they span the file evenly
+        interval = (header["stop"] - start).total_seconds() / (header["nmaps"] - 1)
+    hours = (
+        start.hour + start.minute / 60 + start.second / 3600
+    ) + interval / 3600 * np.arange(header["nmaps"])
+    return lons, lats, hours
+
+
+def _window_slice(axis, low, high):
+    """Indices of a uniform axis needed to interpolate between `low` and `high`
+
+    Includes the samples on either side (at least 2), so interpolation within the
+    window gives the same values as on the whole axis.
+    """
+    f = (np.array([low, high], dtype=float) - axis[0]) / (axis[1] - axis[0])
+    start = max(int(np.floor(f.min())), 0)
+    stop = min(int(np.floor(f.max())) + 2, len(axis))
+    start = max(min(start, stop - 2), 0)
+    return slice(start, max(stop, start + 2))
+
+
+def window_slices(lons, lats, hours, window):
+    """Slices of the TEC maps needed for a window of times and positions
+
+    Parameters
+    ----------
+    lons : `numpy.ndarray`
+    lats : `numpy.ndarray`
+    hours : `numpy.ndarray`
+    window : tuple
+        ((hour1, hour2), (lat1, lat2), (lon1, lon2)) ranges of the times and pierce points
+
+    Returns
+    -------
+    slices : tuple
+        slices of the (time, lat, lon) axes
+    """
+    (hour1, hour2), (lat1, lat2), (lon1, lon2) = window
+    return (
+        _window_slice(hours, hour1, hour2),
+        _window_slice(lats, lat1, lat2),
+        _window_slice(lons, lon1, lon2),
+    )
+
+
+@profiling.timed("ionex_parse")
+def read_ionex(filename, window=None):
+    """Read the TEC maps from an IONEX file into arrays
+
+    All of the values are converted at once, rather than line by line.
+    With a `window`, only the maps and rows within it are converted
+    and the rest of the file after the last map needed is skipped.
+
+    Parameters
+    ----------
+    filename : str
+    window : tuple, optional
+        ((hour1, hour2), (lat1, lat2), (lon1, lon2)) ranges to read (see :func:`window_slices`)
+
+    Returns
+    -------
+    tec : `numpy.ndarray`
+        TEC (TECU) with shape (time, lat, lon)
+    lons : `numpy.ndarray`
+        longitudes (deg)
+    lats : `numpy.ndarray`
+        latitudes (deg)
+    hours : `numpy.ndarray`
+        times of the maps (hours from the start of the day of the first map)
+    """
+    logger.debug(f"Reading IONEX file {filename}")
+    with open(filename, "r") as f:
+        lines = f.read().splitlines()
+    header, nheader = _read_header(lines)
+    lons, lats, hours = _axes(header)
+    if window is None:
+        tslice, latslice, lonslice = slice(None), slice(None), slice(None)
+    else:
+        tslice, latslice, lonslice = window_slices(lons, lats, hours, window)
+    maps = range(len(hours))[tslice]
+    rows = range(len(lats))[latslice]
+
+    data = []
+    tecdata = False
+    imap = -1
+    for line in lines[nheader:]:
+        label = line[60:].strip()
+        if label and label[0].isalpha():
+            if label == "START OF TEC MAP":
+                imap += 1
+                tecdata = imap in maps
+                ilat = -1
+            elif label == "END OF TEC MAP":
+                tecdata = False
+                if imap >= maps[-1]:
+                    break
+            elif label == "LAT/LON1/LON2/DLON/H":
+                ilat += 1
+            continue
+        if tecdata and ilat in rows:
+            data.append(line)
+    # values are fixed-width and negative values may not be separated by a space
+    values = np.array(" ".join(data).replace("-", " -").split(), dtype=float)
+    tec = values.reshape(-1, len(rows), len(lons))[:, :, lonslice]
+    tec = tec * 10.0 ** header["exponent"]
+    if window is not None:
+        logger.debug(
+            f"Read TEC maps with shape {tec.shape} of {len(hours)} x {len(lats)} x {len(lons)}"
+        )
+    else:
+        logger.debug(f"Read TEC maps with shape {tec.shape}")
+    return (
+        tec,
+        lons[lonslice],
+        lats[latslice],
+        hours[tslice][: tec.shape[0]],
+    )
+
+
+def _sidecar_names(filename):
+    return f"{filename}.tec.npy", f"{filename}.axes.npz"
+
+
+def convert_ionex(filename):
+    """Write the parsed TEC maps from an IONEX file to binary sidecar files
+
+    The TEC maps go to `<filename>.tec.npy` (which can be memory-mapped) and
+    the lon/lat/time axes to `<filename>.axes.npz`.
+    Both are written to temporary files first and then renamed, so concurrent readers
+    never see partial files.
+
+    Parameters
+    ----------
+    filename : str
+
+    Returns
+    -------
+    tec : `numpy.ndarray`
+    lons : `numpy.ndarray`
+    lats : `numpy.ndarray`
+    hours : `numpy.ndarray`
+    """
+    tecinfo = read_ionex(filename)
+    tec, lons, lats, hours = tecinfo
+    tecfile, axesfile = _sidecar_names(filename)
+    directory = os.path.dirname(os.path.abspath(filename))
+    # the axes go first, since the TEC file marks a complete conversion
+    for outname, writer in (
+        (axesfile, lambda f: np.savez(f, lons=lons, lats=lats, hours=hours)),
+        (tecfile, lambda f: np.save(f, tec)),
+    ):
+        fd, tmpname = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            writer(f)
+        os.replace(tmpname, outname)
+    logger.debug(f"Wrote {tecfile}")
+    return tecinfo
+
+
+def read_ionex_binary(filename):
+    """Read the TEC maps from an IONEX file via its binary sidecar
+
+    The sidecar is created (or replaced, if it is older than the IONEX file) as needed,
+    and the TEC maps are memory-mapped read-only so that processes on the same node share them
+
+    Parameters
+    ----------
+    filename : str
+
+    Returns
+    -------
+    tec : `numpy.ndarray`
+    lons : `numpy.ndarray`
+    lats : `numpy.ndarray`
+    hours : `numpy.ndarray`
+    """
+    tecfile, axesfile = _sidecar_names(filename)
+    try:
+        mtime = os.stat(filename).st_mtime
+        if os.stat(tecfile).st_mtime >= mtime and os.stat(axesfile).st_mtime >= mtime:
+            with np.load(axesfile) as axes:
+                lons, lats, hours = axes["lons"], axes["lats"], axes["hours"]
+            tec = np.load(tecfile, mmap_mode="r")
+            logger.debug(f"Memory-mapped {tecfile}")
+            return tec, lons, lats, hours
+    except (OSError, ValueError, KeyError):
+        pass
+    try:
+        return convert_ionex(filename)
+    except OSError as e:
+        logger.warning(f"Unable to write binary copy of {filename}: {e}")
+        return read_ionex(filename)
+
+
+@functools.lru_cache(maxsize=16)
+def _load_ionex(filename, mtime, binary):
+    if binary:
+        return read_ionex_binary(filename)
+    return read_ionex(filename)
+
+
+def _fresh_sidecar(filename):
+    tecfile, axesfile = _sidecar_names(filename)
+    try:
+        mtime = os.stat(filename).st_mtime
+        return (
+            os.stat(tecfile).st_mtime >= mtime and os.stat(axesfile).st_mtime >= mtime
+        )
+    except OSError:
+        return False
+
+
+@functools.lru_cache(maxsize=16)
+def _load_ionex_window(filename, mtime, binary, window):
+    if binary and _fresh_sidecar(filename):
+        tec, lons, lats, hours = _load_ionex(filename, mtime, binary)
+        tslice, latslice, lonslice = window_slices(lons, lats, hours, window)
+        # a copy, so that only the window is kept
+        return (
+            np.array(tec[tslice, latslice, lonslice]),
+            lons[lonslice],
+            lats[latslice],
+            hours[tslice],
+        )
+    return read_ionex(filename, window=window)
+
+
+@profiling.timed("ionex_load")
+def load_ionex(filename, binary=True, window=None):
+    """Read the TEC maps from an IONEX file, reusing them within a process
+
+    Parameters
+    ----------
+    filename : str
+    binary : bool, optional
+        Whether to use (and create) the memory-mapped binary sidecar
+    window : tuple, optional
+        ((hour1, hour2), (lat1, lat2), (lon1, lon2)) ranges of the times and pierce points needed.
+        Only the maps and area covering them are kept: they are sliced from the sidecar if it exists,
+        and otherwise parsed from the IONEX file (without writing the sidecar).
+
+    Returns
+    -------
+    tec : `numpy.ndarray`
+    lons : `numpy.ndarray`
+    lats : `numpy.ndarray`
+    hours : `numpy.ndarray`
+    """
+    if window is not None:
+        return _load_ionex_window(
+            os.path.abspath(filename), os.stat(filename).st_mtime_ns, binary, window
+        )
+    return _load_ionex(os.path.abspath(filename), os.stat(filename).st_mtime_ns, binary)
+
+
+def interpolate_tec(tecinfo, hours, lat, lon):
+    """Interpolate vertical TEC at a set of times and positions
+
+    Linear in time and bilinear in latitude/longitude, as in RMextract
+    (without correcting for the rotation of the Earth).
+    Longitudes wrap if the maps cover the full circle.
+
+    Parameters
+    ----------
+    tecinfo : tuple
+        (tec, lons, lats, hours) as returned by :func:`read_ionex`
+    hours : `numpy.ndarray`
+        times (hours of the day)
+    lat : `numpy.ndarray`
+        latitudes (deg)
+    lon : `numpy.ndarray`
+        longitudes (deg)
+
+    Returns
+    -------
+    vTEC : `numpy.ndarray`
+        vertical TEC (TECU)
+    """
+    tec, lons, lats, maphours = tecinfo
+
+    def index_weight(axis, x):
+        # axes are uniformly spaced (but may be decreasing)
+        f = np.clip((x - axis[0]) / (axis[1] - axis[0]), 0, len(axis) - 1)
+        i = np.minimum(np.floor(f).astype(int), len(axis) - 2)
+        return i, f - i
+
+    it, wt = index_weight(maphours, np.asarray(hours, dtype=float))
+    ilat, wlat = index_weight(lats, np.asarray(lat, dtype=float))
+
+    dlon = lons[1] - lons[0]
+    full_circle = np.remainder(lons[0] - lons[-1], 360.0) <= 1.1 * np.abs(dlon)
+    if full_circle:
+        nlon = (
+            len(lons) - 1
+            if np.isclose(np.remainder(lons[-1] - lons[0], 360), 0)
+            else len(lons)
+        )
+        f = np.remainder((np.asarray(lon, dtype=float) - lons[0]) / dlon, nlon)
+        ilon = np.floor(f).astype(int)
+        wlon = f - ilon
+        ilon2 = np.remainder(ilon + 1, nlon)
+    else:
+        ilon, wlon = index_weight(lons, np.asarray(lon, dtype=float))
+        ilon2 = ilon + 1
+
+    def bilinear(t):
+        return (1 - wlat) * (
+            (1 - wlon) * tec[t, ilat, ilon] + wlon * tec[t, ilat, ilon2]
+        ) + wlat * (
+            (1 - wlon) * tec[t, ilat + 1, ilon] + wlon * tec[t, ilat + 1, ilon2]
+        )
+
+    return (1 - wt) * bilinear(it) + wt * bilinear(it + 1)
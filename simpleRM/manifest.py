@@ -0,0 +1,256 @@
+import csv
+import re
+
+import numpy as np
+from astropy import units as u
+from astropy.time import Time
+from astropy.coordinates import SkyCoord
+from loguru import logger
+
+from simpleRM import simpleRM
+from simpleRM import sites
+
+# columns of a manifest; "stop" and "source" are optional, and "site" can come from a default
+columns = ["source", "ra", "dec", "start", "stop", "site"]
+_numeric = re.compile(r"^[+\-]?(\d+\.?\d*|\.\d+)$")
+
+
+def read_manifest(filename):
+    """Read the columns of an observation list
+
+    The file is CSV with a header line naming the columns (see `columns`, in any order).
+    Blank lines and lines starting with "#" are skipped.
+
+    Parameters
+    ----------
+    filename : str
+
+    Returns
+    -------
+    manifest : dict
+        `numpy.ndarray` of str for each column that is present
+    """
+    with open(filename, "r", newline="") as f:
+        lines = [
+            line for line in f if line.strip() and not line.lstrip().startswith("#")
+        ]
+    rows = list(csv.reader(lines))
+    if len(rows) == 0:
+        raise ValueError(f"Manifest '{filename}' is empty")
+    header = [name.strip().lower() for name in rows[0]]
+    unknown = [name for name in header if name not in columns]
+    if len(unknown) > 0:
+        raise ValueError(f"Unknown columns in manifest '{filename}': {unknown}")
+    for name in ["ra", "dec", "start"]:
+        if name not in header:
+            raise ValueError(f"Manifest '{filename}' has no '{name}' column")
+    data = np.full((len(rows) - 1, len(header)), "", dtype=object)
+    for i, row in enumerate(rows[1:]):
+        if len(row) > len(header):
+            raise ValueError(
+                f"Line {i + 2} of manifest '{filename}' has {len(row)} values but there are {len(header)} columns"
+            )
+        data[i, : len(row)] = [value.strip() for value in row]
+    logger.debug(f"Read {len(data)} rows from {filename}")
+    return {name: data[:, j].astype(str) for j, name in enumerate(header)}
+
+
+def parse_coords(ra, dec):
+    """Parse many positions at once
+
+    Each position is degrees if both values are plain numbers, and otherwise
+    sexagesimal (with units, or hours and degrees), as for :func:`simpleRM.service.parse_coord`.
+    All positions of each kind are parsed in one call.
+
+    Parameters
+    ----------
+    ra : `numpy.ndarray`
+    dec : `numpy.ndarray`
+
+    Returns
+    -------
+    coords : `astropy.coordinates.SkyCoord`
+    """
+    numeric = np.array(
+        [
+            _numeric.match(r) is not None and _numeric.match(d) is not None
+            for r, d in zip(ra, dec)
+        ],
+        dtype=bool,
+    )
+    ra_deg = np.zeros(len(ra))
+    dec_deg = np.zeros(len(dec))
+    ra_deg[numeric] = ra[numeric].astype(float)
+    dec_deg[numeric] = dec[numeric].astype(float)
+    if not np.all(numeric):
+        try:
+            coords = SkyCoord(list(ra[~numeric]), list(dec[~numeric]))
+        except (ValueError, u.core.UnitsError):
+            coords = SkyCoord(
+                list(ra[~numeric]), list(dec[~numeric]), unit=("hour", "deg")
+            )
+        coords = coords.icrs
+        ra_deg[~numeric] = coords.ra.deg
+        dec_deg[~numeric] = coords.dec.deg
+    return SkyCoord(ra_deg * u.deg, dec_deg * u.deg)
+
+
+def parse_times(values):
+    """Parse many times at once, given as MJD or any format `astropy.time.Time` understands
+
+    Parameters
+    ----------
+    values : `numpy.ndarray`
+
+    Returns
+    -------
+    times : `astropy.time.Time`
+    """
+    numeric = np.array([_numeric.match(v) is not None for v in values], dtype=bool)
+    mjd = np.zeros(len(values))
+    mjd[numeric] = values[numeric].astype(float)
+    if not np.all(numeric):
+        try:
+            mjd[~numeric] = Time(list(values[~numeric])).utc.mjd
+        except ValueError:
+            # mixed formats
+            mjd[~numeric] = [Time(v).utc.mjd for v in values[~numeric]]
+    return Time(mjd, format="mjd")
+
+
+def resolve_sites(names):
+    """Look up each distinct site once
+
+    Parameters
+    ----------
+    names : `numpy.ndarray`
+        names known to :func:`simpleRM.sites.get_site`,
+        or geocentric "X Y Z" in m (separated by spaces or commas)
+
+    Returns
+    -------
+    sites : dict
+        `astropy.coordinates.EarthLocation` for each name
+    """
+    return {name: sites.get_site(name) for name in np.unique(names)}
+
+
+def sample_times(starttimes, stoptimes, interval):
+    """Times at which to compute each row
+
+    Each row is sampled every `interval` from its start, plus its stop
+    (so a row that stops when it starts is computed only at the start).
+
+    Parameters
+    ----------
+    starttimes : `astropy.time.Time`
+    stoptimes : `astropy.time.Time`
+    interval : `astropy.units.Quantity`
+
+    Returns
+    -------
+    rows : `numpy.ndarray`
+        row index of each sample
+    times : `astropy.time.Time`
+    """
+    step = interval.to_value(u.s)
+    duration = (stoptimes.mjd - starttimes.mjd) * 86400
+    if np.any(duration < 0):
+        raise ValueError(f"Stop before start in rows {np.nonzero(duration < 0)[0] + 1}")
+    # allow for rounding in the MJDs, so a stop on the grid does not add a sample
+    n = np.maximum(np.ceil((duration - 1e-3) / step).astype(int), 0) + 1
+    rows = np.repeat(np.arange(len(n)), n)
+    k = np.arange(len(rows)) - np.repeat(np.cumsum(n) - n, n)
+    offsets = np.minimum(k * step, duration[rows])
+    return rows, starttimes[rows] + offsets * u.s
+
+
+def load_manifest(filename, site=None):
+    """Read and parse an observation list
+
+    Coordinates and times are parsed with a few vectorized calls, and each distinct site is looked up once.
+
+    Parameters
+    ----------
+    filename : str
+    site : str, optional
+        Site for rows that do not give one
+
+    Returns
+    -------
+    manifest : dict
+        "source" (`numpy.ndarray`, the row number if not given), "pointing" (`astropy.coordinates.SkyCoord`),
+        "start" and "stop" (`astropy.time.Time`, the same for rows without a stop), "site" (`numpy.ndarray`),
+        and "sites" (dict of `astropy.coordinates.EarthLocation` for each site)
+    """
+    columns = read_manifest(filename)
+    nrows = len(columns["ra"])
+    sources = columns.get("source", np.full(nrows, "", dtype=str))
+    sources = np.where(
+        sources == "", np.arange(1, nrows + 1).astype(str), sources
+    ).astype(str)
+    site_names = columns.get("site", np.full(nrows, "", dtype=str))
+    if np.any(site_names == ""):
+        if site is None:
+            raise ValueError(
+                f"No site for rows {np.nonzero(site_names == '')[0] + 1} of manifest '{filename}'"
+            )
+        site_names = np.where(site_names == "", site, site_names).astype(str)
+    stops = columns.get("stop", np.full(nrows, "", dtype=str))
+    has_stop = stops != ""
+    starttimes = parse_times(columns["start"])
+    # rows without a stop are only computed at the start
+    mjd = starttimes.mjd.copy()
+    mjd[has_stop] = parse_times(stops[has_stop]).mjd
+    return {
+        "source": sources,
+        "pointing": parse_coords(columns["ra"], columns["dec"]),
+        "start": starttimes,
+        "stop": Time(mjd, format="mjd"),
+        "site": site_names,
+        "sites": resolve_sites(site_names),
+    }
+
+
+def compute_manifest(
+    manifest,
+    interval=100 * u.s,
+    ionexPath="./IONEXdata/",
+    server="http://ftp.aiub.unibe.ch/CODE/",
+    engine="rmextract",
+):
+    """Compute RM for all of the rows of an observation list
+
+    The samples for all rows at each site are computed together with :func:`simpleRM.simpleRM.simpleRM_samples`,
+    which groups them by IONEX day.
+
+    Parameters
+    ----------
+    manifest : dict
+        from :func:`load_manifest`
+    interval : `astropy.units.Quantity`, optional
+    ionexPath : str, optional
+    server : str, optional
+    engine : str, optional
+
+    Returns
+    -------
+    rows : `numpy.ndarray`
+        row index of each value
+    times : `astropy.time.Time`
+    RM : `numpy.ndarray`
+    """
+    rows, times = sample_times(manifest["start"], manifest["stop"], interval)
+    RM = np.zeros(len(times))
+    for name, site in manifest["sites"].items():
+        indices = np.nonzero(manifest["site"][rows] == name)[0]
+        logger.debug(f"Computing {len(indices)} values for site {name}")
+        RM[indices] = simpleRM.simpleRM_samples(
+            manifest["pointing"][rows[indices]],
+            site,
+            times[indices],
+            ionexPath=ionexPath,
+            server=server,
+            engine=engine,
+        )
+    return rows, times, RM
@@ -0,0 +1,251 @@
+import json
+import os
+import tempfile
+
+import numpy as np
+from astropy import units as u
+from loguru import logger
+
+from simpleRM import ionex
+
+# output formats and the file extensions that imply them
+formats = {"npz": [".npz"], "hdf5": [".h5", ".hdf5"], "parquet": [".parquet"]}
+
+
+def source_metadata(pointing, site, name=None):
+    """Describe a source and site for the output metadata
+
+    Parameters
+    ----------
+    pointing : `astropy.coordinates.SkyCoord`
+    site : `astropy.coordinates.EarthLocation` or str
+        site, or telescope name
+    name : str, optional
+        source name
+
+    Returns
+    -------
+    metadata : dict
+    """
+    icrs = pointing.icrs
+    if not isinstance(site, str):
+        site = [x.to_value(u.m) for x in site.to_geocentric()]
+    return {"source": name, "ra": icrs.ra.deg, "dec": icrs.dec.deg, "site": site}
+
+
+def ionex_provenance(times, ionexPath):
+    """Product and hash of the IONEX files covering a set of times
+
+    Parameters
+    ----------
+    times : `astropy.time.Time`
+    ionexPath : str
+
+    Returns
+    -------
+    ionex : list
+        see :func:`simpleRM.ionex.provenance`
+    """
+    times = np.atleast_1d(times.mjd)
+    return ionex.provenance(
+        [ionex.mjd_to_date(mjd) for mjd in np.unique(np.floor(times).astype(int))],
+        ionexPath,
+    )
+
+
+def ionex_metadata(times, ionexPath):
+    """IONEX files and products used for a set of times, for the output metadata
+
+    Parameters
+    ----------
+    times : `astropy.time.Time`
+    ionexPath : str
+
+    Returns
+    -------
+    metadata : dict
+        "ionex" (see :func:`ionex_provenance`), and the names ("ionex_files")
+        and prefixes ("ionex_prefix", comma-separated if the days used different products)
+        of the files used
+    """
+    provenance = ionex_provenance(times, ionexPath)
+    files = [entry["file"] for entry in provenance if entry["file"] is not None]
+    prefixes = []
+    for filename in files:
+        if filename[:4].upper() not in prefixes:
+            prefixes.append(filename[:4].upper())
+    return {
+        "ionex_prefix": ",".join(prefixes) if len(prefixes) > 0 else None,
+        "ionex_files": files,
+        "ionex": provenance,
+    }
+
+
+def format_text(times, RM, outfmt="mjd", prefix="", precision=3):
+    """Format RM as text lines, with the times converted all at once
+
+    Parameters
+    ----------
+    times : `astropy.time.Time`
+    RM : `numpy.ndarray`
+    outfmt : str, optional
+        "mjd" or "iso"
+    prefix : str or `numpy.ndarray`, optional
+        added to the start of each line (or different for each line)
+    precision : int, optional
+        number of decimals for MJD
+
+    Returns
+    -------
+    text : str
+    """
+    RM = np.asarray(RM).reshape(-1)
+    if outfmt == "mjd":
+        t = np.char.mod(f"%.{precision}f", np.atleast_1d(times.mjd))
+    else:
+        t = np.atleast_1d(times.iso)
+    if len(t) == 0:
+        return ""
+    lines = np.char.add(np.char.add(t, "\t\t"), np.char.mod("%.3f", RM))
+    if not isinstance(prefix, str) or prefix:
+        lines = np.char.add(prefix, lines)
+    return "\n".join(lines) + "\n"
+
+
+def _guess_format(filename):
+    ext = os.path.splitext(filename)[1].lower()
+    for format, extensions in formats.items():
+        if ext in extensions:
+            return format
+    raise ValueError(f"Unable to determine output format for '{filename}'")
+
+
+def write_table(
+    filename, times, RM, files=None, metadata=None, format=None, files_column="filename"
+):
+    """Write times and RM as full-precision columns in a single write
+
+    The columns are "mjd" and "RM" (and `files_column` if `files` is given).
+    The metadata are stored as a JSON string: a "metadata" entry for npz,
+    a file attribute for hdf5, and in the schema metadata for parquet.
+
+    Parameters
+    ----------
+    filename : str
+    times : `astropy.time.Time`
+    RM : `numpy.ndarray`
+    files : `numpy.ndarray`, optional
+        file name for each row
+    metadata : dict, optional
+    format : str, optional
+        "npz", "hdf5", or "parquet" (default is from the extension of `filename`)
+    files_column : str, optional
+        name of the column for `files`
+    """
+    if format is None:
+        format = _guess_format(filename)
+    metadata = dict(metadata or {})
+    metadata["time_scale"] = times.scale
+    columns = {
+        "mjd": np.atleast_1d(times.mjd).astype(np.float64),
+        "RM": np.asarray(RM, dtype=np.float64).reshape(-1),
+    }
+    if files is not None:
+        columns[files_column] = np.asarray(files, dtype=str)
+    logger.debug(f"Writing {len(columns['RM'])} rows to {filename} as {format}")
+
+    if format == "npz":
+        # write to a temporary file and rename, since np.savez would add .npz
+        fd, tmpname = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(filename)), suffix=".tmp"
+        )
+        with os.fdopen(fd, "wb") as f:
+            np.savez(f, metadata=np.array(json.dumps(metadata)), **columns)
+        os.replace(tmpname, filename)
+    elif format == "hdf5":
+        try:
+            import h5py
+        except ImportError:
+            raise ImportError("Writing hdf5 requires h5py")
+        with h5py.File(filename, "w") as f:
+            for name, values in columns.items():
+                if name == files_column:
+                    values = values.astype(h5py.string_dtype())
+                f.create_dataset(name, data=values)
+            f.attrs["metadata"] = json.dumps(metadata)
+    elif format == "parquet":
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError("Writing parquet requires pyarrow")
+        table = pyarrow.table(columns)
+        table = table.replace_schema_metadata({"metadata": json.dumps(metadata)})
+        pyarrow.parquet.write_table(table, filename)
+    else:
+        raise ValueError(f"Unknown output format '{format}'")
+
+
+def read_table(filename, format=None):
+    """Read a file written by :func:`write_table`
+
+    Parameters
+    ----------
+    filename : str
+    format : str, optional
+        "npz", "hdf5", or "parquet" (default is from the extension of `filename`)
+
+    Returns
+    -------
+    table : dict
+        "times" (`astropy.time.Time`), "RM" (`numpy.ndarray`), "files" (`numpy.ndarray`,
+        or None if there is no "filename" or "source" column), "files_column" and "metadata"
+    """
+    from astropy.time import Time
+
+    if format is None:
+        format = _guess_format(filename)
+    if format == "npz":
+        with np.load(filename) as data:
+            columns = {name: data[name] for name in data.files}
+        metadata = json.loads(str(columns.pop("metadata")))
+    elif format == "hdf5":
+        try:
+            import h5py
+        except ImportError:
+            raise ImportError("Reading hdf5 requires h5py")
+        with h5py.File(filename, "r") as f:
+            columns = {
+                name: (
+                    f[name].asstr()[()]
+                    if name in ["filename", "source"]
+                    else f[name][()]
+                )
+                for name in f.keys()
+            }
+            metadata = json.loads(f.attrs["metadata"])
+    elif format == "parquet":
+        try:
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError("Reading parquet requires pyarrow")
+        table = pyarrow.parquet.read_table(filename)
+        columns = {name: table[name].to_numpy() for name in table.column_names}
+        metadata = json.loads(table.schema.metadata[b"metadata"])
+    else:
+        raise ValueError(f"Unknown output format '{format}'")
+    files = None
+    files_column = None
+    for name in ["filename", "source"]:
+        if name in columns:
+            files = np.asarray(columns[name], dtype=str)
+            files_column = name
+    return {
+        "times": Time(
+            columns["mjd"], format="mjd", scale=metadata.get("time_scale", "utc")
+        ),
+        "RM": columns["RM"],
+        "files": files,
+        "files_column": files_column,
+        "metadata": metadata,
+    }
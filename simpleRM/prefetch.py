@@ -0,0 +1,184 @@
+import gzip
+import os
+import pathlib
+import subprocess
+import tempfile
+import time
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from loguru import logger
+
+from simpleRM import ionex
+
+# magic numbers at the start of compressed files
+_gzip_magic = b"\x1f\x8b"
+_compress_magic = b"\x1f\x9d"
+
+
+def ionex_url(date, server="http://ftp.aiub.unibe.ch/CODE/", prefix="CODG"):
+    """URL of the (compressed) IONEX file for a single day
+
+    Known servers use the same URLs as RMextract, which adds the path on the server
+    (so "http://ftp.aiub.unibe.ch/CODE/" and "http://ftp.aiub.unibe.ch" are the same).
+    Anything else (including "file://" URLs and local directories) is treated as a mirror
+    laid out as `<server>/<year>/<PREFIX><doy>0.<yy>I.Z`.
+
+    Parameters
+    ----------
+    date : `datetime.date`
+    server : str, optional
+    prefix : str, optional
+
+    Returns
+    -------
+    url : str
+    """
+    from RMextract.formatters import KNOWN_FORMATTERS
+
+    doy = date.timetuple().tm_yday
+    for known_server, formatter in KNOWN_FORMATTERS.items():
+        if known_server in server:
+            parts = urllib.parse.urlsplit(server)
+            return formatter(
+                server=f"{parts.scheme}://{parts.netloc}",
+                prefix=prefix,
+                year=date.year,
+                dayofyear=doy,
+            )
+    if "://" not in server:
+        # a local directory
+        server = pathlib.Path(server).resolve().as_uri()
+    return f"{server.rstrip('/')}/{date.year:4d}/{ionex.ionex_filename(date, prefix)}.Z"
+
+
+def _decompress(data, outfile):
+    """Write IONEX data to a file, decompressing it if needed
+
+    Parameters
+    ----------
+    data : bytes
+        gzip, Unix compress or uncompressed contents
+    outfile : file
+        opened in binary mode
+    """
+    if data.startswith(_gzip_magic):
+        outfile.write(gzip.decompress(data))
+    elif data.startswith(_compress_magic):
+        # python has no LZW decoder, but gunzip understands .Z (as used by RMextract)
+        subprocess.run(["gunzip", "-c"], input=data, stdout=outfile, check=True)
+    else:
+        outfile.write(data)
+
+
+def fetch_ionex(
+    date,
+    ionexPath="./IONEXdata/",
+    server="http://ftp.aiub.unibe.ch/CODE/",
+    prefix="CODG",
+    retries=3,
+    timeout=30,
+    overwrite=False,
+):
+    """Download the IONEX file for a single day into `ionexPath`
+
+    The file is downloaded and decompressed into a temporary file in `ionexPath`
+    and then renamed, so other processes never see a partial file.
+
+    Parameters
+    ----------
+    date : `datetime.date`
+    ionexPath : str, optional
+    server : str, optional
+    prefix : str, optional
+    retries : int, optional
+        number of attempts before giving up
+    timeout : float, optional
+        timeout for each attempt [sec]
+    overwrite : bool, optional
+        replace an existing file
+
+    Returns
+    -------
+    filename : str
+    """
+    filename = os.path.join(ionexPath, ionex.ionex_filename(date, prefix))
+    if not overwrite and os.path.exists(filename):
+        logger.debug(f"{filename} exists")
+        return filename
+    url = ionex_url(date, server=server, prefix=prefix)
+    os.makedirs(ionexPath, exist_ok=True)
+    for attempt in range(retries):
+        try:
+            logger.debug(f"Downloading {url}")
+            with urllib.request.urlopen(url, timeout=timeout) as response:
+                data = response.read()
+            fd, tmpname = tempfile.mkstemp(dir=ionexPath, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    _decompress(data, f)
+                os.replace(tmpname, filename)
+            except BaseException:
+                os.remove(tmpname)
+                raise
+            logger.info(f"Downloaded {url} to {filename}")
+            return filename
+        except (OSError, subprocess.CalledProcessError) as e:
+            logger.warning(
+                f"Unable to download {url} (attempt {attempt + 1}/{retries}): {e}"
+            )
+            if attempt < retries - 1:
+                time.sleep(2**attempt)
+    raise RuntimeError(f"Unable to download {url}")
+
+
+def prefetch(
+    dates,
+    ionexPath="./IONEXdata/",
+    server="http://ftp.aiub.unibe.ch/CODE/",
+    prefix="CODG",
+    jobs=4,
+    retries=3,
+    overwrite=False,
+):
+    """Download the IONEX files for a set of days concurrently
+
+    Parameters
+    ----------
+    dates : list
+        list of `datetime.date`
+    ionexPath : str, optional
+    server : str, optional
+    prefix : str, optional
+    jobs : int, optional
+        maximum number of simultaneous downloads
+    retries : int, optional
+        number of attempts for each file
+    overwrite : bool, optional
+        replace existing files
+
+    Returns
+    -------
+    filenames : dict
+        file name for each date, or None if it could not be downloaded
+    """
+    dates = sorted(set(dates))
+    logger.info(f"Fetching IONEX files for {len(dates)} days")
+
+    def fetch(date):
+        try:
+            return fetch_ionex(
+                date,
+                ionexPath=ionexPath,
+                server=server,
+                prefix=prefix,
+                retries=retries,
+                overwrite=overwrite,
+            )
+        except RuntimeError as e:
+            logger.error(e)
+            return None
+
+    with ThreadPoolExecutor(max_workers=max(jobs, 1)) as pool:
+        return dict(zip(dates, pool.map(fetch, dates)))
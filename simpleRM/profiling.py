@@ -0,0 +1,212 @@
+import collections
+import contextlib
+import functools
+import json
+import sys
+import threading
+import time
+
+from loguru import logger
+
+# instrumentation is off unless enabled, and then stages only cost a couple of perf_counter calls
+_enabled = False
+_start = None
+_times = collections.defaultdict(float)
+_calls = collections.defaultdict(int)
+_counters = collections.defaultdict(int)
+# the totals are shared between threads (such as those of simpleRM.aio),
+# but each thread has its own stages in progress
+_lock = threading.Lock()
+_local = threading.local()
+_profiler = None
+_profile_depth = 0
+
+
+def enable(cprofile=False):
+    """Start recording stage timings and counters
+
+    Parameters
+    ----------
+    cprofile : bool, optional
+        Also run `cProfile` during the stages that ask for it (the RM computation)
+    """
+    global _enabled, _start, _profiler
+    _enabled = True
+    _start = time.perf_counter()
+    if cprofile and _profiler is None:
+        import cProfile
+
+        _profiler = cProfile.Profile()
+
+
+def enabled():
+    """Whether instrumentation is on
+
+    Returns
+    -------
+    enabled : bool
+    """
+    return _enabled
+
+
+def reset():
+    """Clear the recorded timings and counters (but leave instrumentation on or off)"""
+    global _start
+    with _lock:
+        _times.clear()
+        _calls.clear()
+        _counters.clear()
+        _start = time.perf_counter()
+
+
+def _active():
+    """Names of the stages in progress in this thread"""
+    try:
+        return _local.active
+    except AttributeError:
+        _local.active = set()
+        return _local.active
+
+
+@contextlib.contextmanager
+def stage(name, profile=False):
+    """Time a stage of the calculation
+
+    Stages can be nested, in which case the time of the inner stage is also included in the outer one.
+    A stage nested inside itself (in the same thread) is only timed once.
+    Stages in different threads are each timed, and added to the same totals.
+
+    >>> with profiling.stage("ionex_parse"):
+    ...     tecinfo = ionex.read_ionex(filename)
+
+    Parameters
+    ----------
+    name : str
+    profile : bool, optional
+        Run `cProfile` during this stage, if it was enabled
+    """
+    global _profile_depth
+    active = _active()
+    if not _enabled or name in active:
+        yield
+        return
+    active.add(name)
+    profile = profile and _profiler is not None
+    if profile:
+        with _lock:
+            if _profile_depth == 0:
+                _profiler.enable()
+            _profile_depth += 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        active.discard(name)
+        with _lock:
+            _times[name] += elapsed
+            _calls[name] += 1
+            if profile:
+                _profile_depth -= 1
+                if _profile_depth == 0:
+                    _profiler.disable()
+
+
+def timed(name, profile=False):
+    """Decorator to time every call of a function as a stage
+
+    Parameters
+    ----------
+    name : str
+    profile : bool, optional
+        Run `cProfile` during the function, if it was enabled
+    """
+
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with stage(name, profile=profile):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def count(name, n=1):
+    """Increment a counter
+
+    Parameters
+    ----------
+    name : str
+    n : int, optional
+    """
+    if _enabled:
+        with _lock:
+            _counters[name] += n
+
+
+def summary():
+    """Timings and counters recorded so far
+
+    Returns
+    -------
+    summary : dict
+        "wall_time" since instrumentation was enabled [sec],
+        "stages" with the total "time" [sec] and number of "calls" for each stage,
+        and "counters"
+    """
+    with _lock:
+        return {
+            "wall_time": time.perf_counter() - _start if _start is not None else 0,
+            "stages": {
+                name: {"time": _times[name], "calls": _calls[name]} for name in _times
+            },
+            "counters": dict(_counters),
+        }
+
+
+def merge(other):
+    """Add the stages and counters from another summary (such as from a worker process)
+
+    Parameters
+    ----------
+    other : dict
+        as returned by :func:`summary`
+    """
+    with _lock:
+        for name, values in other["stages"].items():
+            _times[name] += values["time"]
+            _calls[name] += values["calls"]
+        for name, n in other["counters"].items():
+            _counters[name] += n
+
+
+def write_summary(filename=None):
+    """Write the summary as JSON
+
+    Parameters
+    ----------
+    filename : str, optional
+        Output file (default is stderr)
+    """
+    text = json.dumps(summary(), indent=2)
+    if filename is None:
+        print(text, file=sys.stderr)
+    else:
+        with open(filename, "w") as f:
+            f.write(text + "\n")
+        logger.info(f"Wrote profiling summary to {filename}")
+
+
+def write_profile(filename):
+    """Write the `cProfile` statistics (readable with `pstats`)
+
+    Parameters
+    ----------
+    filename : str
+    """
+    if _profiler is None:
+        raise ValueError("cProfile was not enabled")
+    _profiler.dump_stats(filename)
+    logger.info(f"Wrote cProfile statistics to {filename}")
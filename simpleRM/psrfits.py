@@ -0,0 +1,498 @@
+import os
+import tempfile
+
+import numpy as np
+from astropy import units as u
+from astropy.coordinates import SkyCoord
+from loguru import logger
+
+FITS_BLOCK = 2880
+FITS_CARD = 80
+
+# bytes per element for binary table TFORM codes
+_tform_sizes = {
+    "L": 1,
+    "B": 1,
+    "I": 2,
+    "J": 4,
+    "K": 8,
+    "A": 1,
+    "E": 4,
+    "D": 8,
+    "C": 8,
+    "M": 16,
+    "P": 8,
+    "Q": 16,
+}
+# numpy (big-endian) types for binary table TFORM codes
+_tform_dtypes = {
+    "L": "S1",
+    "B": "u1",
+    "I": ">i2",
+    "J": ">i4",
+    "K": ">i8",
+    "E": ">f4",
+    "D": ">f8",
+    "C": ">c8",
+    "M": ">c16",
+}
+# speed of light (m/s)
+_c = 299792458.0
+# rows of the SUBINT table are read and written in chunks of about this many bytes
+CHUNK_SIZE = 16 * 2**20
+
+
+def _parse_value(value):
+    """Convert the value part of a FITS header card
+
+    Parameters
+    ----------
+    value : str
+        card contents after "= "
+
+    Returns
+    -------
+    value : str, int, float, bool or None
+    """
+    value = value.strip()
+    if value.startswith("'"):
+        # string: quotes are escaped by doubling
+        end = 1
+        while True:
+            end = value.find("'", end)
+            if end < 0 or value[end : end + 2] != "''":
+                break
+            end += 2
+        return value[1:end].replace("''", "'").rstrip()
+    value = value.split("/")[0].strip()
+    if value == "T":
+        return True
+    if value == "F":
+        return False
+    if len(value) == 0:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    try:
+        return float(value.replace("D", "E"))
+    except ValueError:
+        return value
+
+
+def read_header(f):
+    """Read a single FITS header starting at the current position
+
+    Parameters
+    ----------
+    f : file
+        opened in binary mode, positioned at the start of a header
+
+    Returns
+    -------
+    header : dict
+        None if there are no more headers
+    """
+    header = {}
+    while True:
+        block = f.read(FITS_BLOCK)
+        if len(block) < FITS_BLOCK:
+            return None if len(header) == 0 else header
+        for i in range(0, FITS_BLOCK, FITS_CARD):
+            card = block[i : i + FITS_CARD].decode("ascii", errors="replace")
+            keyword = card[:8].strip()
+            if keyword == "END":
+                return header
+            if card[8:10] == "= ":
+                header[keyword] = _parse_value(card[10:])
+
+
+def _data_size(header):
+    """Size in bytes of the (padded) data following a header"""
+    naxis = header.get("NAXIS", 0)
+    if naxis == 0:
+        return 0
+    size = 1
+    for i in range(1, naxis + 1):
+        size *= header[f"NAXIS{i}"]
+    size = header.get("GCOUNT", 1) * (header.get("PCOUNT", 0) + size)
+    size *= abs(header["BITPIX"]) // 8
+    return FITS_BLOCK * ((size + FITS_BLOCK - 1) // FITS_BLOCK)
+
+
+def _column_format(tform):
+    """Parse a binary table TFORM
+
+    Parameters
+    ----------
+    tform : str
+
+    Returns
+    -------
+    repeat : int
+    code : str
+    """
+    tform = tform.strip()
+    i = 0
+    while i < len(tform) and tform[i].isdigit():
+        i += 1
+    repeat = int(tform[:i]) if i > 0 else 1
+    return repeat, tform[i]
+
+
+class PSRFITSHeader:
+    """Read the headers of a PSRFITS file without loading the data
+
+    Only the primary header and the SUBINT header are read,
+    by skipping over the data of any other extensions.
+    Individual SUBINT columns (such as TSUBINT) are read on request via a memory map.
+
+    Provides the same accessors as `pypulse.Archive` that are used here,
+    so it can be used in place of an archive loaded with `onlyheader=True`.
+
+    Parameters
+    ----------
+    filename : str
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.subint_header = None
+        with open(filename, "rb") as f:
+            self.header = read_header(f)
+            if self.header is None or not self.header.get("SIMPLE", False):
+                raise ValueError(f"'{filename}' is not a FITS file")
+            f.seek(_data_size(self.header), os.SEEK_CUR)
+            while True:
+                offset = f.tell()
+                header = read_header(f)
+                if header is None:
+                    break
+                if header.get("EXTNAME") == "SUBINT":
+                    self.subint_header = header
+                    self._subint_header_offset = offset
+                    self._subint_offset = f.tell()
+                    break
+                f.seek(_data_size(header), os.SEEK_CUR)
+        if self.subint_header is None:
+            raise ValueError(f"No SUBINT table in '{filename}'")
+        self._columns = self._get_columns()
+        logger.debug(
+            f"Read PSRFITS header for {self.header.get('SRC_NAME')} with {self.subint_header['NAXIS2']} subints"
+        )
+
+    def _get_columns(self):
+        columns = {}
+        offset = 0
+        for i in range(1, self.subint_header["TFIELDS"] + 1):
+            repeat, code = _column_format(self.subint_header[f"TFORM{i}"])
+            if code == "X":
+                size = (repeat + 7) // 8
+            else:
+                size = repeat * _tform_sizes[code]
+            columns[self.subint_header[f"TTYPE{i}"]] = (offset, repeat, code)
+            offset += size
+        return columns
+
+    def _dtype(self, columns):
+        """Row dtype with just some of the columns of the SUBINT table (as big-endian values)"""
+        formats = []
+        for column in columns:
+            offset, repeat, code = self._columns[column]
+            formats.append(
+                (_tform_dtypes[code], (repeat,)) if repeat > 1 else _tform_dtypes[code]
+            )
+        return np.dtype(
+            {
+                "names": list(columns),
+                "formats": formats,
+                "offsets": [self._columns[column][0] for column in columns],
+                "itemsize": self.subint_header["NAXIS1"],
+            }
+        )
+
+    def getSubintinfo(self, column):
+        """Values of a column of the SUBINT table
+
+        Parameters
+        ----------
+        column : str
+            e.g., "TSUBINT" or "OFFS_SUB"
+
+        Returns
+        -------
+        values : `numpy.ndarray`
+        """
+        nrows = self.subint_header["NAXIS2"]
+        if nrows == 0:
+            return np.zeros(0)
+        data = np.memmap(
+            self.filename,
+            dtype=self._dtype([column]),
+            mode="r",
+            offset=self._subint_offset,
+            shape=(nrows,),
+        )
+        return np.array(data[column]).astype(data[column].dtype.newbyteorder("="))
+
+    def getPulsarCoords(self):
+        """Position of the source
+
+        Returns
+        -------
+        pointing : `astropy.coordinates.SkyCoord`
+        """
+        return SkyCoord(
+            self.header["RA"], self.header["DEC"], unit=(u.hourangle, u.deg)
+        )
+
+    def getName(self):
+        """Source name
+
+        Returns
+        -------
+        name : str
+        """
+        return self.header.get("SRC_NAME")
+
+    def getTelescope(self):
+        """Telescope name
+
+        Returns
+        -------
+        telescope : str
+        """
+        return self.header["TELESCOP"]
+
+    def getTelescopeCoords(self):
+        """Telescope ITRF position
+
+        Returns
+        -------
+        xyz : tuple
+            (ANT_X, ANT_Y, ANT_Z) in m
+        """
+        return self.header["ANT_X"], self.header["ANT_Y"], self.header["ANT_Z"]
+
+    def getMJD(self, full=False):
+        """Start MJD
+
+        Parameters
+        ----------
+        full : bool, optional
+            Include the fractional day
+
+        Returns
+        -------
+        mjd : int or float
+        """
+        if full:
+            return (
+                self.header["STT_IMJD"]
+                + (self.header["STT_SMJD"] + self.header["STT_OFFS"]) / 86400.0
+            )
+        return self.header["STT_IMJD"]
+
+    def getDuration(self):
+        """Total duration of the subintegrations
+
+        Returns
+        -------
+        duration : float
+            seconds
+        """
+        return np.sum(self.getSubintinfo("TSUBINT"))
+
+
+def _copy(fin, fout, size=None):
+    """Copy `size` bytes (or the rest of the file) between open files in bounded blocks"""
+    while size is None or size > 0:
+        block = fin.read(CHUNK_SIZE if size is None else min(CHUNK_SIZE, size))
+        if len(block) == 0:
+            break
+        fout.write(block)
+        if size is not None:
+            size -= len(block)
+
+
+def _add_history(header, text):
+    """Add a HISTORY card to a raw FITS header, keeping it padded to whole blocks"""
+    cards = [header[i : i + FITS_CARD] for i in range(0, len(header), FITS_CARD)]
+    end = [card[:8].strip() for card in cards].index(b"END")
+    cards.insert(end, f"HISTORY {text}"[:FITS_CARD].ljust(FITS_CARD).encode("ascii"))
+    header = b"".join(cards[: end + 2])
+    return header + b" " * (-len(header) % FITS_BLOCK)
+
+
+def _rotated_pols(pol_type, basis):
+    """Indices of the polarization products that change when Q/U are rotated"""
+    if pol_type == "IQUV":
+        return [1, 2]
+    if pol_type == "AABBCRCI" and basis == "LIN":
+        return [0, 1, 2]
+    if pol_type == "AABBCRCI" and basis == "CIRC":
+        return [2, 3]
+    raise ValueError(
+        f"Cannot rotate Q/U for POL_TYPE '{pol_type}' with FD_POLN '{basis}'"
+    )
+
+
+def _rotate(values, pol_type, basis, angle):
+    """Rotate Q + iU by exp(-i angle) in place
+
+    Parameters
+    ----------
+    values : `numpy.ndarray`
+        the products from :func:`_rotated_pols`, with shape (subint, pol, chan, bin)
+    pol_type : str
+    basis : str
+    angle : `numpy.ndarray`
+        with shape (subint, chan)
+    """
+    cos = np.cos(angle)[:, :, None]
+    sin = np.sin(angle)[:, :, None]
+    linear = pol_type == "AABBCRCI" and basis == "LIN"
+    if linear:
+        # I = AA + BB, Q = AA - BB, U = 2 CR
+        I = values[:, 0] + values[:, 1]
+        Q = values[:, 0] - values[:, 1]
+        U = 2 * values[:, 2]
+    else:
+        # Stokes Q and U, or 2 CR and 2 CI for circular feeds (the factor of 2 cancels)
+        Q = values[:, 0]
+        U = values[:, 1]
+    Q, U = Q * cos + U * sin, U * cos - Q * sin
+    if linear:
+        values[:, 0] = (I + Q) / 2
+        values[:, 1] = (I - Q) / 2
+        values[:, 2] = U / 2
+    else:
+        values[:, 0] = Q
+        values[:, 1] = U
+
+
+def _derotate_rows(rows, RM, shape, pols, pol_type, basis):
+    """De-rotate a chunk of SUBINT rows in place
+
+    Integer data are rescaled (new DAT_SCL and DAT_OFFS) for the products that change,
+    since the rotated values can have a different range.
+    """
+    n = len(rows)
+    data = np.array(rows["DATA"]).reshape(n, *shape)
+    scale = np.array(rows["DAT_SCL"], dtype=float).reshape(n, *shape[:2])
+    offset = np.array(rows["DAT_OFFS"], dtype=float).reshape(n, *shape[:2])
+    # physical values are DATA * DAT_SCL + DAT_OFFS
+    values = data[:, pols] * scale[:, pols, :, None] + offset[:, pols, :, None]
+    wavelength = _c / (np.array(rows["DAT_FREQ"], dtype=float).reshape(n, -1) * 1e6)
+    _rotate(values, pol_type, basis, 2 * RM[:, None] * wavelength**2)
+
+    if np.issubdtype(data.dtype, np.integer):
+        info = np.iinfo(data.dtype)
+        low = values.min(axis=-1)
+        high = values.max(axis=-1)
+        # stored as the column type, so the data are quantized with the same values that are written
+        new_scale = np.where(high > low, (high - low) / (info.max - info.min), 1.0)
+        new_scale = new_scale.astype(rows["DAT_SCL"].dtype)
+        new_offset = (low - info.min * new_scale).astype(rows["DAT_OFFS"].dtype)
+        data[:, pols] = np.clip(
+            np.rint((values - new_offset[..., None]) / new_scale[..., None]),
+            info.min,
+            info.max,
+        )
+        scale[:, pols] = new_scale
+        offset[:, pols] = new_offset
+        rows["DAT_SCL"] = scale.reshape(n, -1)
+        rows["DAT_OFFS"] = offset.reshape(n, -1)
+    else:
+        data[:, pols] = (values - offset[:, pols, :, None]) / scale[:, pols, :, None]
+    rows["DATA"] = data.reshape(n, -1)
+
+
+def apply_rm(filename, outname, RM, chunk_size=CHUNK_SIZE):
+    """Write a copy of a fold-mode PSRFITS file with Faraday rotation by `RM` removed
+
+    Q + iU of each subintegration and channel is multiplied by exp(-2i RM lambda^2),
+    with lambda from DAT_FREQ, so position angles are referred to infinite frequency.
+    Q and U are as defined by POL_TYPE ("IQUV", or "AABBCRCI" for FD_POLN "LIN" or "CIRC");
+    no other feed conventions are applied.
+
+    The SUBINT table is read through a memory map and rotated and written `chunk_size` bytes
+    of rows at a time, so the whole data cube is never in memory.  Everything else is copied as is,
+    apart from a HISTORY card added to the SUBINT header.  The copy is written to a temporary file
+    that is then renamed to `outname`.
+
+    Parameters
+    ----------
+    filename : str
+    outname : str
+    RM : `numpy.ndarray`
+        RM (rad/m^2) for each subintegration
+    chunk_size : int, optional
+        approximate size in bytes of the rows rotated at once
+
+    Returns
+    -------
+    outname : str
+    """
+    header = PSRFITSHeader(filename)
+    subint = header.subint_header
+    nrows = subint["NAXIS2"]
+    rowsize = subint["NAXIS1"]
+    RM = np.asarray(RM, dtype=float).reshape(-1)
+    if len(RM) != nrows:
+        raise ValueError(
+            f"Number of RM values ({len(RM)}) and subintegrations ({nrows}) differ"
+        )
+    if not np.all(np.isfinite(RM)):
+        raise ValueError("RM values must be finite")
+    if header.header.get("OBS_MODE") == "SEARCH":
+        raise ValueError(f"'{filename}' is a search-mode file")
+    pol_type = str(subint.get("POL_TYPE", "")).strip().upper()
+    basis = str(header.header.get("FD_POLN", "")).strip().upper()
+    pols = _rotated_pols(pol_type, basis)
+    shape = (subint["NPOL"], subint["NCHAN"], subint["NBIN"])
+    dtype = header._dtype(["DATA", "DAT_SCL", "DAT_OFFS", "DAT_FREQ"])
+    step = max(chunk_size // rowsize, 1)
+    logger.debug(
+        f"De-rotating {nrows} subints of {filename} ({pol_type}) in chunks of {step}"
+    )
+
+    table = np.memmap(
+        filename,
+        dtype=np.uint8,
+        mode="r",
+        offset=header._subint_offset,
+        shape=(nrows, rowsize),
+    )
+    fd, tmpname = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(outname)), suffix=".tmp"
+    )
+    try:
+        with open(filename, "rb") as fin, os.fdopen(fd, "wb") as fout:
+            _copy(fin, fout, header._subint_header_offset)
+            fout.write(
+                _add_history(
+                    fin.read(header._subint_offset - header._subint_header_offset),
+                    f"simpleRM: Q/U de-rotated by RM {RM.min():.4f} to {RM.max():.4f} rad/m^2",
+                )
+            )
+            for start in range(0, nrows, step):
+                block = np.array(table[start : start + step])
+                _derotate_rows(
+                    block.reshape(-1).view(dtype),
+                    RM[start : start + step],
+                    shape,
+                    pols,
+                    pol_type,
+                    basis,
+                )
+                fout.write(memoryview(block))
+            # the heap, padding and any later extensions
+            fin.seek(header._subint_offset + nrows * rowsize)
+            _copy(fin, fout)
+        os.replace(tmpname, outname)
+    except BaseException:
+        os.remove(tmpname)
+        raise
+    return outname
@@ -3,12 +3,22 @@ from astropy.coordinates import SkyCoord
 from astropy.time import Time
 import struct
 import re
-import pkg_resources
+import json
+import importlib.resources
+import importlib.util
 import os
+import sys
+import numpy as np
 
 from loguru import logger
 
-data_lengths = {"int": 4, "float": 4, "double": 8, "uint32_t": 32}
+data_lengths = {"int": 4, "float": 4, "double": 8, "uint32_t": 4}
+# struct format codes (big-endian, no padding)
+# other types are kept as raw bytes
+struct_codes = {"int": "i", "float": "f", "double": "d"}
+numpy_codes = {"int": ">i4", "float": ">f4", "double": ">f8"}
+
+_layout = None
 
 
 def stripcomments(text):
@@ -18,43 +28,174 @@ def stripcomments(text):
     return re.sub("//.*?\n|/\*.*?\*/", "", text, flags=re.S)
 
 
+def compile_layout(keywords):
+    """Compile a Timer header definition into a single struct format
+
+    Parameters
+    ----------
+    keywords : dict
+        dictionary of keywords with each entry being [`type`, `size`], as returned by :meth:`TimerHeader.get_definition`
+
+    Returns
+    -------
+    layout : dict
+        with entries "names", "types", "sizes" (lists) and "format" (str)
+    """
+    fmt = ">"
+    for varname in keywords:
+        vartype, length = keywords[varname][:2]
+        if vartype in struct_codes:
+            fmt += struct_codes[vartype]
+        else:
+            fmt += f"{length}s"
+    return {
+        "names": list(keywords.keys()),
+        "types": [keywords[varname][0] for varname in keywords],
+        "sizes": [keywords[varname][1] for varname in keywords],
+        "format": fmt,
+    }
+
+
+def _read_data(name):
+    """Contents of a file in the package "data" directory, or None if it is not there"""
+    try:
+        if hasattr(importlib.resources, "files"):
+            return (importlib.resources.files(__package__) / "data" / name).read_text()
+        return importlib.resources.read_text(f"{__package__}.data", name)
+    except (OSError, ModuleNotFoundError):
+        return None
+
+
+def _external_definition():
+    """Contents of "timer.h" from the separate `read_Timer` package, or None if it is not installed"""
+    spec = importlib.util.find_spec("read_Timer")
+    if spec is None or spec.origin is None:
+        return None
+    # not this module, if its directory is on the path
+    if os.path.abspath(spec.origin) == os.path.abspath(__file__):
+        return None
+    try:
+        with open(os.path.join(os.path.dirname(spec.origin), "data", "timer.h")) as fh:
+            return fh.read()
+    except OSError:
+        return None
+
+
+def get_layout():
+    """Get the compiled Timer header layout
+
+    The layout is read from the packaged "data/timer_layout.json" (see :func:`write_layout`).
+    Without that it is compiled from the packaged "data/timer.h",
+    or from the "timer.h" of the separate `read_Timer` package, and nothing is written.
+    Within a process it is only loaded once (see also :func:`use_definition`).
+
+    Returns
+    -------
+    names : list
+    types : list
+    sizes : list
+    layout : `struct.Struct`
+    """
+    global _layout
+    if _layout is not None:
+        return _layout
+
+    compiled = _read_data("timer_layout.json")
+    if compiled is not None:
+        layout = json.loads(compiled)
+    else:
+        logger.debug("No compiled Timer header layout: compiling from 'timer.h'")
+        layout = compile_layout(TimerHeader.get_definition())
+    _layout = (
+        layout["names"],
+        layout["types"],
+        layout["sizes"],
+        struct.Struct(layout["format"]),
+    )
+    return _layout
+
+
+def use_definition(definition):
+    """Use the Timer header layout from a given copy of "timer.h" for the rest of the process
+
+    Parameters
+    ----------
+    definition : str
+        file name of the header definition
+
+    Returns
+    -------
+    names : list
+    types : list
+    sizes : list
+    layout : `struct.Struct`
+    """
+    global _layout
+    layout = compile_layout(TimerHeader.get_definition(definition))
+    _layout = (
+        layout["names"],
+        layout["types"],
+        layout["sizes"],
+        struct.Struct(layout["format"]),
+    )
+    return _layout
+
+
+def write_layout(definition, outname):
+    """Compile a copy of "timer.h" into the JSON layout read by :func:`get_layout`
+
+    This is how "data/timer_layout.json" is made when "data/timer.h" is updated:
+
+        python -m simpleRM.read_Timer simpleRM/data/timer.h simpleRM/data/timer_layout.json
+
+    Parameters
+    ----------
+    definition : str
+        file name of the header definition
+    outname : str
+        file name for the layout
+    """
+    layout = compile_layout(TimerHeader.get_definition(definition))
+    with open(outname, "w") as f:
+        json.dump(layout, f, indent=1)
+        f.write("\n")
+    logger.info(f"Wrote Timer header layout to '{outname}'")
+
+
 class TimerHeader:
     """Read a PSRCHIVE Timer header
     the header is a struct defined in "data/timer.h"
     which is a copy of "psrchive/Base/Formats/Timer/timer.h"
 
     This reads all of the header keywords it can and puts them into self.keywords
+    (each entry is [`type`, `size`, `value`])
     It also extracts a few of particular importance:
     telescope
     mjd
     duration
     position
-    """
 
-    keywords = None
+    The header is read with a single read and a single unpack using the layout from :func:`get_layout`
+    """
 
     def __init__(self, filename):
-        if TimerHeader.keywords is None:
-            TimerHeader.keywords = self.__class__.get_definition()
-        keywords = TimerHeader.keywords
-
-        f = open(filename, "rb")
-        for varname in keywords:
-            out = f.read(keywords[varname][1])
-            if keywords[varname][0] == "char":
+        names, types, sizes, layout = get_layout()
+
+        with open(filename, "rb") as f:
+            data = f.read(layout.size)
+        if len(data) < layout.size:
+            raise ValueError(f"'{filename}' is too short to be a Timer file")
+
+        self.keywords = {}
+        for varname, vartype, length, result in zip(
+            names, types, sizes, layout.unpack(data)
+        ):
+            if vartype == "char":
                 try:
-                    result = out.decode().rstrip("\x00")
+                    result = result.decode().rstrip("\x00")
                 except UnicodeDecodeError:
-                    # ???
                     pass
-            elif keywords[varname][0] == "int":
-                result = struct.unpack(">i", out)[0]
-            elif keywords[varname][0] == "float":
-                result = struct.unpack(">f", out)[0]
-            elif keywords[varname][0] == "double":
-                result = struct.unpack(">d", out)[0]
-            keywords[varname].append(result)
-        self.keywords = keywords
+            self.keywords[varname] = [vartype, length, result]
 
         self.mjd = Time(
             self.keywords["mjd"][-1] + self.keywords["fracmjd"][-1], format="mjd"
@@ -76,29 +217,57 @@ class TimerHeader:
         self.duration = (
             self.keywords["nsub_int"][-1] * self.keywords["sub_int_time"][-1] * u.s
         )
-        self.telescope = self.keywords["telid"][-1]
         self.psrname = self.keywords["psrname"][-1]
         logger.debug(f"Telescope = {self.telescope}")
         logger.debug(f"Pulsar = {self.psrname}")
         logger.debug(f"Start = {self.mjd.mjd} = {self.mjd.iso}")
         logger.debug(f"Duration = {self.duration}")
 
+    def subint_times(self):
+        """Mid-times of the subintegrations
+
+        Assumes the `nsub_int` subintegrations of `sub_int_time` are contiguous from the start
+
+        Returns
+        -------
+        times : `astropy.time.Time`
+        """
+        return (
+            self.mjd
+            + (np.arange(self.keywords["nsub_int"][-1]) + 0.5)
+            * self.keywords["sub_int_time"][-1]
+            * u.s
+        )
+
     @staticmethod
-    def get_definition():
+    def get_definition(definition=None):
         """get Timer file header definition
-        
+
+        Parameters
+        ----------
+        definition : str, optional
+            file name of the header definition (default is the packaged "data/timer.h",
+            or that of the separate `read_Timer` package)
+
         Returns
         -------
         keywords : dict
         dictionary of keywords with each entry being [`type`, `size`]
         """
 
-        fh = open(
-            os.path.join(pkg_resources.resource_filename(__name__, "data/"), "timer.h"),
-            "r",
-        )
+        if definition is None:
+            text = _read_data("timer.h")
+            if text is None:
+                text = _external_definition()
+            if text is None:
+                raise FileNotFoundError(
+                    "No Timer header definition: copy psrchive/Base/Formats/Timer/timer.h to simpleRM/data/ or install read_Timer"
+                )
+        else:
+            with open(definition, "r") as fh:
+                text = fh.read()
 
-        lines = stripcomments("".join(fh.readlines())).split("\n")
+        lines = stripcomments(text).split("\n")
 
         keywords = {}
 
@@ -130,3 +299,133 @@ class TimerHeader:
                 length = data_lengths[vartype]
             keywords[varname] = [vartype, length]
         return keywords
+
+
+def header_dtype():
+    """NumPy dtype matching the Timer header layout
+
+    Returns
+    -------
+    dtype : `numpy.dtype`
+        structured (big-endian, unpadded) dtype with one field per header keyword
+    """
+    names, types, sizes, layout = get_layout()
+    formats = []
+    for vartype, length in zip(types, sizes):
+        if vartype in numpy_codes:
+            formats.append(numpy_codes[vartype])
+        else:
+            formats.append(f"S{length}")
+    dtype = np.dtype({"names": names, "formats": formats})
+    assert dtype.itemsize == layout.size
+    return dtype
+
+
+def scan_headers(paths):
+    """Read the headers of many Timer files into a single record array
+
+    Only the fixed-size header at the start of each file is read.
+    Files that cannot be read are logged and skipped.
+
+    Parameters
+    ----------
+    paths : list
+        file names
+
+    Returns
+    -------
+    files : list
+        names of the files that were read
+    headers : `numpy.ndarray`
+        structured array with one row per file and one field per header keyword
+    """
+    dtype = header_dtype()
+    buffer = bytearray(len(paths) * dtype.itemsize)
+    view = memoryview(buffer)
+    files = []
+    for filename in paths:
+        try:
+            with open(filename, "rb") as f:
+                start = len(files) * dtype.itemsize
+                n = f.readinto(view[start : start + dtype.itemsize])
+        except OSError as e:
+            logger.warning(f"Unable to read '{filename}': {e}")
+            continue
+        if n < dtype.itemsize:
+            logger.warning(f"'{filename}' is too short to be a Timer file")
+            continue
+        files.append(filename)
+    headers = np.frombuffer(buffer, dtype=dtype, count=len(files))
+    logger.debug(f"Read {len(files)} Timer headers")
+    return files, headers
+
+
+def header_times(headers):
+    """Start times for an array of Timer headers
+
+    Parameters
+    ----------
+    headers : `numpy.ndarray`
+        as returned by :func:`scan_headers`
+
+    Returns
+    -------
+    mjd : `astropy.time.Time`
+    """
+    return Time(headers["mjd"].astype(float), headers["fracmjd"], format="mjd")
+
+
+def header_durations(headers):
+    """Durations for an array of Timer headers
+
+    Parameters
+    ----------
+    headers : `numpy.ndarray`
+        as returned by :func:`scan_headers`
+
+    Returns
+    -------
+    duration : `astropy.units.Quantity`
+    """
+    return headers["nsub_int"] * headers["sub_int_time"].astype(float) * u.s
+
+
+def header_positions(headers):
+    """Source positions for an array of Timer headers
+
+    Galactic positions are converted to ICRS.
+    Positions with an unknown coordinate type are NaN.
+
+    Parameters
+    ----------
+    headers : `numpy.ndarray`
+        as returned by :func:`scan_headers`
+
+    Returns
+    -------
+    position : `astropy.coordinates.SkyCoord`
+        ICRS positions
+    """
+    ra = np.full(len(headers), np.nan)
+    dec = np.full(len(headers), np.nan)
+    coord_type = headers["coord_type"]
+    equatorial = coord_type == b"05"
+    ra[equatorial] = np.degrees(headers["ra"][equatorial])
+    dec[equatorial] = np.degrees(headers["dec"][equatorial])
+    galactic = coord_type == b"04"
+    if np.any(galactic):
+        icrs = SkyCoord(
+            headers["l"][galactic].astype(float) * u.deg,
+            headers["b"][galactic].astype(float) * u.deg,
+            frame="galactic",
+        ).icrs
+        ra[galactic] = icrs.ra.deg
+        dec[galactic] = icrs.dec.deg
+    return SkyCoord(ra * u.deg, dec * u.deg)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Usage: python -m simpleRM.read_Timer <timer.h> <timer_layout.json>")
+        sys.exit(1)
+    write_layout(sys.argv[1], sys.argv[2])
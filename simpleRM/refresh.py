@@ -0,0 +1,173 @@
+import datetime
+
+import numpy as np
+from astropy import units as u
+from astropy.coordinates import SkyCoord, EarthLocation
+from loguru import logger
+
+from simpleRM import ionex
+from simpleRM import output
+from simpleRM import simpleRM
+from simpleRM import sites
+
+
+def _rank(product):
+    # lower is better; unknown products are worst
+    products = list(ionex.products)
+    return products.index(product) if product in products else len(products)
+
+
+def superseded_days(recorded, ionexPath):
+    """Days whose IONEX file has been superseded by what is now in `ionexPath`
+
+    A day is superseded if a better product is there (e.g. a final one for a result computed
+    from a rapid one), or if the same file has changed (its hash differs).
+
+    Parameters
+    ----------
+    recorded : list
+        IONEX files used for a result (from :func:`simpleRM.ionex.provenance`)
+    ionexPath : str
+
+    Returns
+    -------
+    days : set
+        ISO dates of the superseded days
+    """
+    days = set()
+    for entry in recorded:
+        date = datetime.date.fromisoformat(entry["date"])
+        ionexf, product = ionex.find_ionex_file(date, ionexPath)
+        if ionexf is None:
+            continue
+        if _rank(product) < _rank(entry.get("product")):
+            logger.debug(
+                f"{entry['date']}: {entry.get('product')} product superseded by {product}"
+            )
+            days.add(entry["date"])
+        elif product == entry.get("product") and ionex.file_hash(ionexf) != entry.get(
+            "sha256"
+        ):
+            logger.debug(f"{entry['date']}: {entry.get('file')} has changed")
+            days.add(entry["date"])
+    return days
+
+
+def _sources(table):
+    """Source metadata for each row of a result table"""
+    metadata = table["metadata"]
+    # single-source tables keep the source at the top level
+    sources = metadata.get("sources", [metadata])
+    if len(sources) == 1 or table["files"] is None:
+        return sources, np.zeros(len(table["RM"]), dtype=int)
+    labels = {}
+    for i, source in enumerate(sources):
+        label = source.get("file", source.get("source"))
+        if label in labels and (
+            sources[labels[label]]["ra"],
+            sources[labels[label]]["dec"],
+            sources[labels[label]]["site"],
+        ) != (source["ra"], source["dec"], source["site"]):
+            raise ValueError(f"More than one source is labeled '{label}'")
+        labels.setdefault(label, i)
+    return sources, np.array([labels[f] for f in table["files"]], dtype=int)
+
+
+def _site(site):
+    if isinstance(site, str):
+        return sites.get_site(site)
+    return EarthLocation.from_geocentric(*site, unit=u.m)
+
+
+def refresh_table(
+    filename,
+    ionexPath="./IONEXdata/",
+    server="http://ftp.aiub.unibe.ch/CODE/",
+    engine=None,
+    dry_run=False,
+):
+    """Recompute the rows of a result table whose IONEX files have been superseded
+
+    The table is one written by the scripts (see :func:`simpleRM.output.write_table`),
+    whose metadata record the IONEX product and hash used for each day ("ionex").
+    Only the rows on superseded days (see :func:`superseded_days`) are recomputed,
+    all together for each site with :func:`simpleRM.simpleRM.simpleRM_samples`
+    (which computes each value as the scripts do with the same engine: for "rmextract",
+    as `RMextract.getRM` does), and the table is rewritten with the new values and IONEX records.
+    Tables that do not record their IONEX files are recomputed for every day that has a file.
+
+    Parameters
+    ----------
+    filename : str
+    ionexPath : str, optional
+    server : str, optional
+    engine : str, optional
+        RM engine (default is the one that made the table)
+    dry_run : bool, optional
+        Only find the rows to recompute
+
+    Returns
+    -------
+    rows : `numpy.ndarray`
+        indices of the rows that were (or would be) recomputed
+    """
+    table = output.read_table(filename)
+    metadata = table["metadata"]
+    times = table["times"]
+    RM = np.array(table["RM"], dtype=float)
+    sources, index = _sources(table)
+    days = np.array(
+        [
+            ionex.mjd_to_date(mjd).isoformat()
+            for mjd in np.floor(times.utc.mjd).astype(int)
+        ]
+    )
+
+    stale = np.zeros(len(RM), dtype=bool)
+    for i, source in enumerate(sources):
+        recorded = source.get("ionex", metadata.get("ionex"))
+        if recorded is None:
+            recorded = [{"date": day} for day in np.unique(days[index == i])]
+        superseded = superseded_days(recorded, ionexPath)
+        stale |= (index == i) & np.isin(days, list(superseded))
+    rows = np.nonzero(stale)[0]
+    logger.info(
+        f"{filename}: {len(rows)} of {len(RM)} rows on {len(np.unique(days[rows]))} days to recompute"
+    )
+    if dry_run or len(rows) == 0:
+        return rows
+
+    engine = engine or metadata.get("engine", "rmextract")
+    pointings = SkyCoord(
+        [s["ra"] for s in sources] * u.deg, [s["dec"] for s in sources] * u.deg
+    )
+    site_keys = np.array([str(s["site"]) for s in sources])
+    for key in np.unique(site_keys[index[rows]]):
+        indices = rows[site_keys[index[rows]] == key]
+        site = _site(sources[index[indices[0]]]["site"])
+        RM[indices] = simpleRM.simpleRM_samples(
+            pointings[index[indices]],
+            site,
+            times[indices],
+            ionexPath=ionexPath,
+            server=server,
+            engine=engine,
+        )
+
+    # record the files now used
+    for i, source in enumerate(sources):
+        if "ionex" in source or "ionex" not in metadata:
+            source.update(output.ionex_metadata(times[index == i], ionexPath))
+    if "ionex" in metadata:
+        metadata.update(output.ionex_metadata(times, ionexPath))
+    metadata["engine"] = engine
+    metadata.pop("time_scale", None)
+    output.write_table(
+        filename,
+        times,
+        RM,
+        files=table["files"],
+        metadata=metadata,
+        files_column=table["files_column"] or "filename",
+    )
+    return rows
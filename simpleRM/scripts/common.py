@@ -0,0 +1,279 @@
+import glob
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from loguru import logger
+
+from simpleRM import profiling
+
+
+def expand_files(names):
+    """Expand file names, glob patterns and directories into a list of files
+
+    Parameters
+    ----------
+    names : list
+        file names, glob patterns, or directories (all files directly inside are used)
+
+    Returns
+    -------
+    files : list
+    """
+    files = []
+    for name in names:
+        if os.path.isdir(name):
+            files += sorted(
+                os.path.join(name, f)
+                for f in os.listdir(name)
+                if os.path.isfile(os.path.join(name, f))
+            )
+        elif glob.has_magic(name):
+            matches = sorted(glob.glob(name))
+            if len(matches) == 0:
+                logger.warning(f"No files match '{name}'")
+            files += matches
+        else:
+            files.append(name)
+    return files
+
+
+def _run_one(function, filename, profile=False):
+    if profile:
+        # instrument this file in the worker, and send the summary back to be merged
+        profiling.enable()
+        profiling.reset()
+        return _run_one(function, filename), profiling.summary()
+    profiling.count("files")
+    try:
+        return function(filename)
+    except Exception as e:
+        logger.error(f"Unable to process '{filename}': {e}")
+        profiling.count("failed_files")
+        return None
+
+
+def run_files(function, files, jobs=1, initializer=None, initargs=()):
+    """Apply a function to each of a list of files, optionally with a pool of processes
+
+    A file that fails is logged and gives a result of None, without stopping the others.
+    If `simpleRM.profiling` is enabled, the timings from the workers are added to those of this process
+    (`cProfile` only covers this process, though).
+
+    Parameters
+    ----------
+    function : callable
+        called as function(filename); must be picklable if `jobs` > 1
+    files : list
+    jobs : int, optional
+        number of worker processes
+    initializer : callable, optional
+        called once in each worker (or once in this process if `jobs` is 1)
+    initargs : tuple, optional
+
+    Yields
+    ------
+    filename : str
+    result :
+        return value of `function`, or None if it failed
+    """
+    if jobs <= 1 or len(files) <= 1:
+        if initializer is not None:
+            initializer(*initargs)
+        for filename in files:
+            yield filename, _run_one(function, filename)
+        return
+
+    with ProcessPoolExecutor(
+        max_workers=jobs, initializer=initializer, initargs=initargs
+    ) as pool:
+        profile = profiling.enabled()
+        futures = [
+            pool.submit(_run_one, function, filename, profile) for filename in files
+        ]
+        for filename, future in zip(files, futures):
+            result = future.result()
+            if profile:
+                result, summary = result
+                profiling.merge(summary)
+            yield filename, result
+
+
+def write_results(
+    results, outfmt="mjd", out=None, multiple=False, precision=3, metadata=None
+):
+    """Write the RM results for a set of files
+
+    Text formats are written as the results arrive;
+    binary formats collect all of the results and write them in one go.
+
+    Parameters
+    ----------
+    results : iterable
+        (filename, result) pairs, with result (times, RM, metadata) or None if the file failed
+    outfmt : str, optional
+        "mjd", "iso", or a binary format from `simpleRM.output.formats`
+    out : str, optional
+        output file (required for binary formats; default is stdout)
+    multiple : bool, optional
+        add a column for the file name
+    precision : int, optional
+        number of decimals for MJD in text output
+    metadata : dict, optional
+        metadata for binary formats; the metadata for each file are added as "sources"
+    """
+    import numpy as np
+    from astropy.time import Time
+    from simpleRM import output
+
+    if outfmt in output.formats:
+        mjd = []
+        RM = []
+        files = []
+        sources = []
+        for filename, result in results:
+            if result is None:
+                continue
+            times, rm, file_metadata = result
+            mjd.append(np.atleast_1d(Time(times).mjd))
+            RM.append(np.asarray(rm, dtype=float).reshape(-1))
+            files += [filename] * len(mjd[-1])
+            sources.append(dict(file_metadata, file=filename))
+        metadata = dict(metadata or {}, sources=sources)
+        with profiling.stage("output"):
+            output.write_table(
+                out,
+                Time(np.concatenate(mjd) if len(mjd) > 0 else [], format="mjd"),
+                np.concatenate(RM) if len(RM) > 0 else [],
+                files=files if multiple else None,
+                metadata=metadata,
+                format=outfmt,
+            )
+        return
+
+    fout = open(out, "w") if out is not None else sys.stdout
+    # with more than one file, add a column for the file name
+    prefix = "# FILE\t" if multiple else "# "
+    if outfmt == "mjd":
+        print(f"{prefix}TIME(mjd)\t\tRM (rad/m^2)", file=fout)
+    else:
+        print(f"{prefix}TIME\t\tRM (rad/m^2)", file=fout)
+    for filename, result in results:
+        if result is None:
+            continue
+        times, RM, _ = result
+        with profiling.stage("output"):
+            fout.write(
+                output.format_text(
+                    Time(times),
+                    RM,
+                    outfmt=outfmt,
+                    prefix=f"{filename}\t" if multiple else "",
+                    precision=precision,
+                )
+            )
+    if out is not None:
+        fout.close()
+
+
+def add_profile_arguments(parser):
+    """Add the options for :mod:`simpleRM.profiling` to a script
+
+    Parameters
+    ----------
+    parser : `argparse.ArgumentParser`
+    """
+    parser.add_argument(
+        "--profile",
+        default=False,
+        action="store_true",
+        help="Time each stage and write a JSON summary",
+    )
+    parser.add_argument(
+        "--profile-out",
+        default=None,
+        type=str,
+        help="Output file for the profiling summary [default=stderr]",
+    )
+    parser.add_argument(
+        "--cprofile",
+        default=None,
+        type=str,
+        help="Also run cProfile during the RM computation and write its statistics to this file",
+    )
+
+
+def start_profiling(args):
+    """Enable profiling if requested by the options from :func:`add_profile_arguments`
+
+    Parameters
+    ----------
+    args : `argparse.Namespace`
+    """
+    if args.profile or args.cprofile is not None:
+        profiling.enable(cprofile=args.cprofile is not None)
+        if args.cprofile is not None and getattr(args, "jobs", 1) > 1:
+            logger.warning("cProfile only covers files processed in the main process")
+
+
+def finish_profiling(args):
+    """Write the profiling output requested by the options from :func:`add_profile_arguments`
+
+    Parameters
+    ----------
+    args : `argparse.Namespace`
+    """
+    if args.profile:
+        profiling.write_summary(args.profile_out)
+    if args.cprofile is not None:
+        profiling.write_profile(args.cprofile)
+
+
+def add_field_arguments(parser):
+    """Add the option for :mod:`simpleRM.field` to a script
+
+    Parameters
+    ----------
+    parser : `argparse.ArgumentParser`
+    """
+    parser.add_argument(
+        "--field-cache",
+        default=None,
+        type=str,
+        help="Directory for precomputed geomagnetic field grids, reused between runs (native engine only)",
+    )
+
+
+def start_field(args):
+    """Use field grids if requested by the option from :func:`add_field_arguments`
+
+    Parameters
+    ----------
+    args : `argparse.Namespace`
+    """
+    if args.field_cache is None:
+        return
+    if args.engine != "native":
+        logger.warning("--field-cache only applies to the native engine")
+    from simpleRM import field
+
+    field.enable(directory=args.field_cache)
+
+
+def field_settings(args):
+    """Field grid settings from the option from :func:`add_field_arguments`, for worker processes
+
+    Parameters
+    ----------
+    args : `argparse.Namespace`
+
+    Returns
+    -------
+    settings : dict or None
+        as returned by :func:`simpleRM.field.settings`
+    """
+    if args.field_cache is None:
+        return None
+    from simpleRM import field
+
+    return field.settings()
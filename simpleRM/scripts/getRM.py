@@ -4,27 +4,90 @@ import os
 import argparse
 import logging
 import re
-import numpy as np
-from astropy import units as u
-from astropy.time import Time
-from astropy.coordinates import SkyCoord, EarthLocation
-import astropy.coordinates
 
 from loguru import logger
 
 fmt = "{name}:{level} - <level>{message}</level>"
 logger.remove()
 logger.add(sys.stderr, level="WARNING", colorize=True, format=fmt)
-from simpleRM import simpleRM
+# numpy, astropy and RMextract are only imported when needed, so that
+# --help and argument errors are quick
+from simpleRM import profiling
+from simpleRM.scripts.common import (
+    add_profile_arguments,
+    start_profiling,
+    finish_profiling,
+    add_field_arguments,
+    start_field,
+)
+
+
+def run_manifest(args):
+    """Compute and write RM for all of the observations in a manifest"""
+    import numpy as np
+    from astropy import units as u
+    from simpleRM import manifest
+    from simpleRM import output
+
+    try:
+        observations = manifest.load_manifest(args.manifest, site=args.site)
+    except Exception as e:
+        logger.error(f"Unable to read manifest '{args.manifest}': {e}")
+        sys.exit(1)
+    rows, times, RM = manifest.compute_manifest(
+        observations,
+        interval=args.interval * u.s,
+        ionexPath=args.ionex,
+        server=args.server,
+        engine=args.engine,
+    )
+    sources = observations["source"]
+    with profiling.stage("output"):
+        if args.outfmt in output.formats:
+            output.write_table(
+                args.out,
+                times,
+                RM,
+                files=sources[rows],
+                files_column="source",
+                metadata={
+                    "timestep": args.interval,
+                    "engine": args.engine,
+                    "ionex_server": args.server,
+                    **output.ionex_metadata(times, args.ionex),
+                    "sources": [
+                        output.source_metadata(
+                            observations["pointing"][i],
+                            observations["site"][i],
+                            name=sources[i],
+                        )
+                        for i in range(len(sources))
+                    ],
+                },
+                format=args.outfmt,
+            )
+            return
+        fout = open(args.out, "w") if args.out is not None else sys.stdout
+        if args.outfmt == "mjd":
+            print("# SOURCE\tTIME(mjd)\t\tRM (rad/m^2)", file=fout)
+        else:
+            print("# SOURCE\tTIME\t\tRM (rad/m^2)", file=fout)
+        fout.write(
+            output.format_text(
+                times, RM, outfmt=args.outfmt, prefix=np.char.add(sources[rows], "\t")
+            )
+        )
+        if args.out is not None:
+            fout.close()
 
 
 def main():
     parser = argparse.ArgumentParser(
         formatter_class=argparse.ArgumentDefaultsHelpFormatter
     )
-    parser.add_argument("coord", nargs="+", help="Coordinates for computation")
+    parser.add_argument("coord", nargs="*", help="Coordinates for computation")
     parser.add_argument(
-        "--start", type=str, required=True, help="Start time (MJD or parsable)"
+        "--start", type=str, default=None, help="Start time (MJD or parsable)"
     )
     parser.add_argument(
         "--stop",
@@ -39,12 +102,14 @@ def main():
     parser.add_argument(
         "--site",
         default=None,
-        required=True,
         type=str,
-        help="Site (see EarthLocation.get_site_names())",
+        help="Site (see simpleRM.sites, or EarthLocation.get_site_names()), or geocentric X,Y,Z [m]",
     )
     parser.add_argument(
-        "--outfmt", default="mjd", choices=["mjd", "iso"], help="Output time format"
+        "--outfmt",
+        default="mjd",
+        choices=["mjd", "iso", "npz", "hdf5", "parquet"],
+        help="Output time format for text, or binary output format (requires --out)",
     )
     parser.add_argument("--out", default=None, type=str, help="Output file")
     parser.add_argument(
@@ -59,6 +124,38 @@ def main():
         type=str,
         help="IONEX server",
     )
+    parser.add_argument(
+        "--engine",
+        default=None,
+        choices=["rmextract", "native"],
+        help="RM calculation engine (None for native with --serve and rmextract otherwise)",
+    )
+    parser.add_argument(
+        "--cache", default=None, type=str, help="Directory for cached RM results"
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        default=1,
+        type=int,
+        help="Number of processes for a time range spanning more than one day (one day each)",
+    )
+    parser.add_argument(
+        "--serve",
+        default=False,
+        action="store_true",
+        help="Run as a service answering HTTP queries (--site is the default site)",
+    )
+    parser.add_argument("--host", default="127.0.0.1", type=str, help="Service host")
+    parser.add_argument("--port", default=8765, type=int, help="Service port")
+    parser.add_argument(
+        "--manifest",
+        default=None,
+        type=str,
+        help="CSV list of observations (columns source,ra,dec,start,stop,site) to compute instead of coord (--site is the default site)",
+    )
+    add_profile_arguments(parser)
+    add_field_arguments(parser)
 
     parser.add_argument(
         "-v", "--verbosity", default=0, action="count", help="Increase output verbosity"
@@ -70,6 +167,46 @@ def main():
     elif args.verbosity >= 2:
         logger.remove()
         logger.add(sys.stderr, level="DEBUG", colorize=True, format=fmt)
+    start_profiling(args)
+    start_field(args)
+    if args.engine is None:
+        # the service keeps the IONEX maps in memory only with the native engine
+        args.engine = "native" if args.serve else "rmextract"
+
+    if args.serve:
+        from simpleRM import service
+
+        service.serve(
+            service.RMService(
+                ionexPath=args.ionex,
+                server=args.server,
+                engine=args.engine,
+                site=args.site,
+            ),
+            host=args.host,
+            port=args.port,
+        )
+        return
+    if args.outfmt not in ["mjd", "iso"] and args.out is None:
+        parser.error(f"--outfmt {args.outfmt} requires --out")
+    if args.manifest is not None:
+        if len(args.coord) > 0 or args.start is not None or args.stop is not None:
+            parser.error("--manifest cannot be combined with coord, --start or --stop")
+        run_manifest(args)
+        finish_profiling(args)
+        return
+    if len(args.coord) == 0 or args.start is None or args.site is None:
+        parser.error("coord, --start and --site are required")
+
+    from astropy import units as u
+    from astropy.time import Time
+    from astropy.coordinates import SkyCoord
+    import astropy.coordinates
+
+    from simpleRM import simpleRM
+    from simpleRM import output
+    from simpleRM import sites
+    from simpleRM.cache import RMCache
 
     if len(args.coord) == 2:
         ra, dec = args.coord
@@ -96,7 +233,7 @@ def main():
             sys.exit(1)
 
     try:
-        site = EarthLocation.of_site(args.site)
+        site = sites.get_site(args.site)
     except astropy.coordinates.errors.UnknownSiteException as e:
         logger.error(e)
         sys.exit(1)
@@ -122,35 +259,64 @@ def main():
         logger.error(f"Unable to parse stop time '{args.stop}'")
         sys.exit(1)
 
-    times, RM = simpleRM.simpleRM(
-        coord,
-        starttime,
-        stoptime,
-        site,
-        timestep=args.interval * u.s,
-        ionexPath=args.ionex,
-        server=args.server,
-    )
-    if args.out is not None:
-        fout = open(args.out, "w")
-    else:
-        fout = sys.stdout
-
+    cache = RMCache(args.cache) if args.cache is not None else None
     if args.stop is None:
         # just the single time
-        RM_out = np.interp(starttime.mjd, times.mjd, RM.flatten())
+        RM_out = simpleRM.simpleRM_batch(
+            coord,
+            site,
+            starttime,
+            ionexPath=args.ionex,
+            server=args.server,
+            engine=args.engine,
+        )[0, 0, 0]
         times = [starttime]
         RM = [[RM_out]]
+    else:
+        times, RM = simpleRM.simpleRM(
+            coord,
+            starttime,
+            stoptime,
+            site,
+            timestep=args.interval * u.s,
+            ionexPath=args.ionex,
+            server=args.server,
+            cache=cache,
+            engine=args.engine,
+            workers=args.jobs,
+        )
+    times = Time(times)
+    if args.outfmt in output.formats:
+        with profiling.stage("output"):
+            output.write_table(
+                args.out,
+                times,
+                RM,
+                metadata=dict(
+                    output.source_metadata(coord, site),
+                    site_name=args.site,
+                    timestep=None if args.stop is None else args.interval,
+                    engine=args.engine,
+                    ionex_server=args.server,
+                    **output.ionex_metadata(times, args.ionex),
+                ),
+                format=args.outfmt,
+            )
+        finish_profiling(args)
+        return
+
+    if args.out is not None:
+        fout = open(args.out, "w")
+    else:
+        fout = sys.stdout
 
     if args.outfmt == "mjd":
         print("# TIME(mjd)\t\tRM (rad/m^2)", file=fout)
     else:
         print("# TIME\t\tRM (rad/m^2)", file=fout)
-    for tm, rm in zip(times, RM):
-        if args.outfmt == "mjd":
-            print(f"{tm.mjd:.3f}\t\t{rm[0]:.3f}", file=fout)
-        else:
-            print(f"{tm.iso}\t\t{rm[0]:.3f}", file=fout)
+    with profiling.stage("output"):
+        fout.write(output.format_text(times, RM, outfmt=args.outfmt))
+    finish_profiling(args)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+import sys
+import argparse
+
+from loguru import logger
+
+fmt = "{name}:{level} - <level>{message}</level>"
+logger.remove()
+logger.add(sys.stderr, level="WARNING", colorize=True, format=fmt)
+
+# numpy, astropy and RMextract are only imported when needed, so that
+# --help and argument errors are quick
+from simpleRM.scripts.common import expand_files
+
+
+def parse_time(value):
+    from astropy.time import Time
+
+    try:
+        return Time(float(value), format="mjd")
+    except ValueError:
+        return Time(value)
+
+
+def file_times(files, timer=False):
+    """Start and stop times of a set of PSRFITS or Timer files
+
+    Parameters
+    ----------
+    files : list
+    timer : bool, optional
+        Whether the files are Timer (rather than PSRFITS) files
+
+    Returns
+    -------
+    starttimes : list
+    stoptimes : list
+    """
+    from astropy import units as u
+    from astropy.time import Time
+
+    starttimes = []
+    stoptimes = []
+    if timer:
+        from simpleRM import read_Timer
+
+        files, headers = read_Timer.scan_headers(files)
+        if len(files) > 0:
+            start = read_Timer.header_times(headers)
+            starttimes += list(start)
+            stoptimes += list(start + read_Timer.header_durations(headers))
+        return starttimes, stoptimes
+
+    from simpleRM import psrfits
+
+    for filename in files:
+        try:
+            header = psrfits.PSRFITSHeader(filename)
+        except (OSError, ValueError, KeyError) as e:
+            logger.error(f"Unable to read '{filename}': {e}")
+            continue
+        start = Time(header.getMJD(full=True), format="mjd")
+        starttimes.append(start)
+        stoptimes.append(start + header.getDuration() * u.s)
+    return starttimes, stoptimes
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Download the IONEX files needed for a range of times or a set of observations",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "file",
+        nargs="*",
+        help="PSRFITS (or Timer, with --timer) file(s) to cover (file names, glob patterns or directories)",
+    )
+    parser.add_argument(
+        "--start", type=str, default=None, help="Start time (MJD or parsable)"
+    )
+    parser.add_argument(
+        "--stop",
+        type=str,
+        default=None,
+        help="Stop time (MJD or parsable) [default=start time]",
+    )
+    parser.add_argument(
+        "--timer", default=False, action="store_true", help="Files are Timer files"
+    )
+    parser.add_argument(
+        "--interval",
+        default=100,
+        type=float,
+        help="Computation interval (padding at each end) [sec]",
+    )
+    parser.add_argument(
+        "--ionex",
+        default="./IONEXdata",
+        type=str,
+        help="IONEX data destination directory",
+    )
+    parser.add_argument(
+        "--server",
+        default="http://ftp.aiub.unibe.ch/CODE/",
+        type=str,
+        help="IONEX server (or mirror URL/directory)",
+    )
+    parser.add_argument("--prefix", default="CODG", type=str, help="IONEX file prefix")
+    parser.add_argument(
+        "-j", "--jobs", default=4, type=int, help="Number of simultaneous downloads"
+    )
+    parser.add_argument(
+        "--retries", default=3, type=int, help="Number of attempts for each file"
+    )
+    parser.add_argument(
+        "--overwrite",
+        default=False,
+        action="store_true",
+        help="Download files even if they exist",
+    )
+
+    parser.add_argument(
+        "-v", "--verbosity", default=0, action="count", help="Increase output verbosity"
+    )
+    args = parser.parse_args()
+    if args.verbosity == 1:
+        logger.remove()
+        logger.add(sys.stderr, level="INFO", colorize=True, format=fmt)
+    elif args.verbosity >= 2:
+        logger.remove()
+        logger.add(sys.stderr, level="DEBUG", colorize=True, format=fmt)
+
+    from astropy import units as u
+    from simpleRM import ionex
+    from simpleRM import prefetch
+
+    starttimes, stoptimes = file_times(expand_files(args.file), timer=args.timer)
+    if args.start is not None:
+        starttime = parse_time(args.start)
+        starttimes.append(starttime)
+        stoptimes.append(parse_time(args.stop) if args.stop is not None else starttime)
+    if len(starttimes) == 0:
+        logger.error("Supply a start time or files to cover")
+        sys.exit(1)
+
+    dates = set()
+    for starttime, stoptime in zip(starttimes, stoptimes):
+        dates.update(ionex.ionex_dates(starttime, stoptime, args.interval * u.s))
+
+    filenames = prefetch.prefetch(
+        dates,
+        ionexPath=args.ionex,
+        server=args.server,
+        prefix=args.prefix,
+        jobs=args.jobs,
+        retries=args.retries,
+        overwrite=args.overwrite,
+    )
+    for date in sorted(filenames):
+        if filenames[date] is not None:
+            print(filenames[date])
+    if any(filename is None for filename in filenames.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
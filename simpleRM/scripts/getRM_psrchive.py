@@ -1,31 +1,138 @@
 #!/usr/bin/env python
 import sys
 import os
+import functools
 import argparse
 import logging
 import re
-import numpy as np
-from astropy import units as u
-from astropy.time import Time
-from astropy.coordinates import SkyCoord, EarthLocation
-import astropy.coordinates
 
 from loguru import logger
 
-from simpleRM import read_Timer
- 
 fmt = "{name}:{level} - <level>{message}</level>"
 logger.remove()
 logger.add(sys.stderr, level="WARNING", colorize=True, format=fmt)
 
-from simpleRM import simpleRM
+# numpy, astropy and RMextract are only imported when needed, so that
+# --help and argument errors are quick
+from simpleRM.scripts.common import (
+    expand_files,
+    run_files,
+    write_results,
+    add_profile_arguments,
+    start_profiling,
+    finish_profiling,
+    add_field_arguments,
+    start_field,
+    field_settings,
+)
+
+
+def _init_worker(settings=None):
+    # import RMextract and load the Timer header layout once per worker
+    # rather than once per file
+    import RMextract.getRM
+    from simpleRM import simpleRM
+    from simpleRM import read_Timer
+    from simpleRM import field
+
+    read_Timer.get_layout()
+    # spawned workers do not inherit the field grid settings
+    field.use_settings(settings)
+
+
+def _metadata(header, times, ionexPath):
+    from astropy.time import Time
+    from simpleRM import output
+
+    metadata = output.source_metadata(
+        header.position, header.telescope, name=header.psrname
+    )
+    metadata.update(output.ionex_metadata(Time(times), ionexPath))
+    return metadata
+
+
+def process_file(
+    filename,
+    interval=100,
+    ionexPath="./IONEXdata",
+    server="http://ftp.aiub.unibe.ch/CODE/",
+    cache=None,
+    engine="rmextract",
+    only=None,
+    subint=False,
+):
+    """Compute RM for a single PSRCHIVE Timer file
+
+    Parameters
+    ----------
+    filename : str
+    interval : float, optional
+        Computation interval [sec]
+    ionexPath : str, optional
+    server : str, optional
+    cache : `simpleRM.cache.RMCache`, optional
+    engine : str, optional
+    only : str, optional
+        Only return the value for the "start", "stop", or "mid" time of the file
+    subint : bool, optional
+        Return the value for the mid-time of each subintegration
+
+    Returns
+    -------
+    times : list or `astropy.time.Time`
+    RM : list or `numpy.ndarray`
+    metadata : dict
+        source, site and IONEX files
+    """
+    from astropy import units as u
+    from simpleRM import simpleRM
+    from simpleRM.series import RMSeries
+
+    times, RM, header = simpleRM.simpleRM_from_psrchive(
+        filename,
+        timestep=interval * u.s,
+        ionexPath=ionexPath,
+        server=server,
+        cache=cache,
+        engine=engine,
+        subint=subint,
+    )
+    if subint:
+        return times, RM, _metadata(header, times, ionexPath)
+    series = RMSeries(times, RM)
+
+    if only == "start":
+        logger.debug("Returning RM for start only")
+        # just the single time
+        RM_out = series(header.mjd)
+        times = [header.mjd]
+        RM = [[RM_out]]
+    elif only == "stop":
+        logger.debug("Returning RM for stop only")
+        stoptime = header.mjd + header.duration
+        # just the single time
+        RM_out = series(stoptime)
+        times = [stoptime]
+        RM = [[RM_out]]
+    elif only == "mid":
+        logger.debug("Returning RM for midpoint only")
+        midpoint = header.mjd + header.duration / 2
+        # just the single time
+        RM_out = series(midpoint)
+        times = [midpoint]
+        RM = [[RM_out]]
+    return times, RM, _metadata(header, times, ionexPath)
 
 
 def main():
     parser = argparse.ArgumentParser(
         formatter_class=argparse.ArgumentDefaultsHelpFormatter
     )
-    parser.add_argument("file", help="PSRCHIVE Timer file to process")
+    parser.add_argument(
+        "file",
+        nargs="+",
+        help="PSRCHIVE Timer file(s) to process (file names, glob patterns or directories)",
+    )
     parser.add_argument(
         "--interval", default=100, type=float, help="Computation interval [sec]"
     )
@@ -39,7 +146,16 @@ def main():
         "--mid", default=False, action="store_true",help="Only return value for midpoint time of file"
     )
     parser.add_argument(
-        "--outfmt", default="mjd", choices=["mjd", "iso"], help="Output time format"
+        "--subint",
+        default=False,
+        action="store_true",
+        help="Return values for the mid-time of each subintegration",
+    )
+    parser.add_argument(
+        "--outfmt",
+        default="mjd",
+        choices=["mjd", "iso", "npz", "hdf5", "parquet"],
+        help="Output time format for text, or binary output format (requires --out)",
     )
     parser.add_argument("--out", default=None, type=str, help="Output file")
     parser.add_argument(
@@ -48,12 +164,30 @@ def main():
         type=str,
         help="IONEX data destination directory",
     )
-   parser.add_argument(
+    parser.add_argument(
         "--server",
         default="http://ftp.aiub.unibe.ch/CODE/",
         type=str,
         help="IONEX server",
     )
+    parser.add_argument(
+        "--engine",
+        default="rmextract",
+        choices=["rmextract", "native"],
+        help="RM calculation engine",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        default=1,
+        type=int,
+        help="Number of files to process in parallel",
+    )
+    parser.add_argument(
+        "--cache", default=None, type=str, help="Directory for cached RM results"
+    )
+    add_profile_arguments(parser)
+    add_field_arguments(parser)
 
     parser.add_argument(
         "-v", "--verbosity", default=0, action="count", help="Increase output verbosity"
@@ -65,48 +199,55 @@ def main():
     elif args.verbosity >= 2:
         logger.remove()
         logger.add(sys.stderr, level="DEBUG", colorize=True, format=fmt)
+    start_profiling(args)
+    start_field(args)
 
-    times, RM, header = simpleRM.simpleRM_from_psrchive(
-        args.file,
-        timestep=args.interval * u.s,
-        ionexPath=args.ionex,
-        server=args.server,
-    )
-    if args.out is not None:
-        fout = open(args.out, "w")
-    else:
-        fout = sys.stdout
+    if args.outfmt not in ["mjd", "iso"] and args.out is None:
+        parser.error(f"--outfmt {args.outfmt} requires --out")
+    from simpleRM.cache import RMCache
 
+    cache = RMCache(args.cache) if args.cache is not None else None
+    only = None
     if args.start:
-        logger.debug("Returning RM for start only")
-        # just the single time
-        RM_out = np.interp(header.mjd.mjd, times.mjd, RM.flatten())
-        times = [header.mjd]
-        RM = [[RM_out]]
+        only = "start"
     elif args.stop:
-        logger.debug("Returning RM for stop only")
-        stoptime = header.mjd+header.duration
-        # just the single time
-        RM_out = np.interp(stoptime.mjd, times.mjd, RM.flatten())
-        times = [stoptime]
-        RM = [[RM_out]]
+        only = "stop"
     elif args.mid:
-        logger.debug("Returning RM for midpoint only")
-        midpoint = header.mjd+header.duration/2
-        # just the single time
-        RM_out = np.interp(midpoint.mjd, times.mjd, RM.flatten())
-        times = [midpoint]
-        RM = [[RM_out]]
+        only = "mid"
+    if args.subint and only is not None:
+        parser.error("--subint cannot be combined with --start, --stop or --mid")
+    files = expand_files(args.file)
+    function = functools.partial(
+        process_file,
+        interval=args.interval,
+        ionexPath=args.ionex,
+        server=args.server,
+        cache=cache,
+        engine=args.engine,
+        only=only,
+        subint=args.subint,
+    )
 
-    if args.outfmt == "mjd":
-        print("# TIME(mjd)\t\tRM (rad/m^2)", file=fout)
-    else:
-        print("# TIME\t\tRM (rad/m^2)", file=fout)
-    for tm, rm in zip(times, RM):
-        if args.outfmt == "mjd":
-            print(f"{tm.mjd:.3f}\t\t{rm[0]:.3f}", file=fout)
-        else:
-            print(f"{tm.iso}\t\t{rm[0]:.3f}", file=fout)
+    write_results(
+        run_files(
+            function,
+            files,
+            jobs=args.jobs,
+            initializer=_init_worker,
+            initargs=(field_settings(args),),
+        ),
+        outfmt=args.outfmt,
+        out=args.out,
+        multiple=len(files) > 1,
+        # subintegrations need more precision to be distinguished
+        precision=6 if args.subint else 3,
+        metadata={
+            "timestep": None if args.subint else args.interval,
+            "engine": args.engine,
+            "ionex_server": args.server,
+        },
+    )
+    finish_profiling(args)
 
 
 if __name__ == "__main__":
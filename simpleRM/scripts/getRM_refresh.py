@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+import sys
+import argparse
+
+from loguru import logger
+
+fmt = "{name}:{level} - <level>{message}</level>"
+logger.remove()
+logger.add(sys.stderr, level="WARNING", colorize=True, format=fmt)
+
+# numpy, astropy and RMextract are only imported when needed, so that
+# --help and argument errors are quick
+from simpleRM.scripts.common import (
+    expand_files,
+    add_profile_arguments,
+    start_profiling,
+    finish_profiling,
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Recompute stored RM results whose IONEX files have been superseded (e.g. rapid products by final ones)",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "file",
+        nargs="+",
+        help="Result file(s) written with --out (npz, hdf5 or parquet; file names, glob patterns or directories)",
+    )
+    parser.add_argument(
+        "--ionex",
+        default="./IONEXdata",
+        type=str,
+        help="IONEX data directory",
+    )
+    parser.add_argument(
+        "--server",
+        default="http://ftp.aiub.unibe.ch/CODE/",
+        type=str,
+        help="IONEX server",
+    )
+    parser.add_argument(
+        "--engine",
+        default=None,
+        choices=["rmextract", "native"],
+        help="RM calculation engine [default=the one that made each file]",
+    )
+    parser.add_argument(
+        "--dry-run",
+        default=False,
+        action="store_true",
+        help="Only report what would be recomputed",
+    )
+    add_profile_arguments(parser)
+
+    parser.add_argument(
+        "-v", "--verbosity", default=0, action="count", help="Increase output verbosity"
+    )
+    args = parser.parse_args()
+    if args.verbosity == 1:
+        logger.remove()
+        logger.add(sys.stderr, level="INFO", colorize=True, format=fmt)
+    elif args.verbosity >= 2:
+        logger.remove()
+        logger.add(sys.stderr, level="DEBUG", colorize=True, format=fmt)
+    start_profiling(args)
+
+    from simpleRM import refresh
+
+    failed = False
+    for filename in expand_files(args.file):
+        try:
+            rows = refresh.refresh_table(
+                filename,
+                ionexPath=args.ionex,
+                server=args.server,
+                engine=args.engine,
+                dry_run=args.dry_run,
+            )
+        except Exception as e:
+            logger.error(f"Unable to refresh '{filename}': {e}")
+            failed = True
+            continue
+        print(f"{filename}\t{len(rows)}")
+    finish_profiling(args)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+import numpy as np
+from astropy import units as u
+from loguru import logger
+
+
+class RMSeries:
+    """RM computed on a grid of times, which can be evaluated at any time
+
+    Iterating gives `times, RM`, so it can be unpacked like the tuple returned previously:
+
+    >>> times, RM = simpleRM.simpleRM(pointing, starttime, stoptime, site)
+
+    Calling it interpolates RM with a cubic spline,
+    and :meth:`refine` adds grid points where the spline is not accurate enough.
+
+    Parameters
+    ----------
+    times : `astropy.time.Time`
+        Times of the grid (increasing)
+    RM : `numpy.ndarray`
+        RM with shape (time, 1)
+    evaluator : callable, optional
+        Computes RM at new times: called as `evaluator(times)` with `astropy.time.Time`,
+        and returns a `numpy.ndarray` of the same length.
+        Needed for :meth:`refine`, which starts from the values in `RM`,
+        so it has to compute RM the same way as they were computed.
+    """
+
+    def __init__(self, times, RM, evaluator=None):
+        self.times = times
+        self.RM = np.asarray(RM).reshape((-1, 1))
+        self.evaluator = evaluator
+        self._spline = None
+
+    def __iter__(self):
+        return iter((self.times, self.RM))
+
+    def __repr__(self):
+        return f"<RMSeries: {len(self.times)} times from {self.times[0].mjd} to {self.times[-1].mjd}>"
+
+    def _x(self, times):
+        # seconds since the start of the grid
+        return (times - self.times[0]).to_value(u.s)
+
+    def __call__(self, times):
+        """Interpolate RM
+
+        Parameters
+        ----------
+        times : `astropy.time.Time`
+
+        Returns
+        -------
+        RM : `numpy.ndarray` or float
+            same shape as `times`
+        """
+        from scipy.interpolate import CubicSpline
+
+        if len(self.times) == 1:
+            return np.full(np.shape(times.jd), self.RM[0, 0])[()]
+        if self._spline is None:
+            self._spline = CubicSpline(self._x(self.times), self.RM[:, 0])
+        return self._spline(self._x(times))[()]
+
+    def refine(
+        self,
+        tolerance=0.001,
+        min_step=1 * u.s,
+        max_iterations=10,
+        start=None,
+        stop=None,
+    ):
+        """Add grid points where RM changes too quickly to interpolate accurately
+
+        Each interval of the grid is tested by computing RM at its midpoint;
+        where that differs from the interpolated value by more than `tolerance`
+        the midpoint is kept and both halves are tested in the next iteration.
+        Computing is only done where it is needed, and in one call to the evaluator per iteration.
+
+        Parameters
+        ----------
+        tolerance : float, optional
+            Maximum interpolation error [rad/m^2]
+        min_step : `astropy.units.Quantity`, optional
+            Intervals shorter than this are not split
+        max_iterations : int, optional
+        start : `astropy.time.Time`, optional
+            Only refine intervals after this
+        stop : `astropy.time.Time`, optional
+            Only refine intervals before this
+
+        Returns
+        -------
+        series : `RMSeries`
+            this series, updated
+        """
+        from scipy.interpolate import CubicSpline
+
+        if self.evaluator is None:
+            raise ValueError("Cannot refine an RMSeries without an evaluator")
+        evaluations = 0
+        x = self._x(self.times)
+        y = self.RM[:, 0]
+        a, b = x[:-1], x[1:]
+        if start is not None:
+            keep = b > self._x(start)
+            a, b = a[keep], b[keep]
+        if stop is not None:
+            keep = a < self._x(stop)
+            a, b = a[keep], b[keep]
+        min_step = min_step.to_value(u.s)
+        for iteration in range(max_iterations):
+            keep = (b - a) > 2 * min_step
+            a, b = a[keep], b[keep]
+            if len(a) == 0:
+                break
+            mid = (a + b) / 2
+            predicted = CubicSpline(x, y)(mid) if len(x) > 1 else y[0]
+            computed = np.asarray(self.evaluator(self.times[0] + mid * u.s))
+            evaluations += len(mid)
+            order = np.argsort(np.concatenate((x, mid)))
+            x = np.concatenate((x, mid))[order]
+            y = np.concatenate((y, computed))[order]
+            bad = np.abs(computed - predicted) > tolerance
+            a, b = (
+                np.concatenate((a[bad], mid[bad])),
+                np.concatenate((mid[bad], b[bad])),
+            )
+        logger.debug(
+            f"Refined RM with {evaluations} extra evaluations ({len(x)} total times)"
+        )
+        self.times = self.times[0] + x * u.s
+        self.RM = y[:, None]
+        self._spline = None
+        return self
@@ -0,0 +1,249 @@
+import json
+import re
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+from astropy import units as u
+from astropy.time import Time
+from astropy.coordinates import SkyCoord, AltAz
+from loguru import logger
+
+from simpleRM import simpleRM
+from simpleRM import sites
+
+
+def parse_coord(ra, dec):
+    """Parse a position given as separate RA and Dec strings
+
+    Parameters
+    ----------
+    ra : str
+        degrees, or sexagesimal hours
+    dec : str
+        degrees, or sexagesimal degrees
+
+    Returns
+    -------
+    coord : `astropy.coordinates.SkyCoord`
+    """
+    if (re.search(r"[^\d.+\-]", ra) is None) and (re.search(r"[^\d.+\-]", dec) is None):
+        return SkyCoord(ra, dec, unit="deg")
+    try:
+        return SkyCoord(ra, dec)
+    except (ValueError, u.core.UnitsError):
+        return SkyCoord(ra, dec, unit=("hour", "deg"))
+
+
+def parse_time(value):
+    """Parse a time given as MJD or any format `astropy.time.Time` understands
+
+    Parameters
+    ----------
+    value : str
+
+    Returns
+    -------
+    time : `astropy.time.Time`
+    """
+    try:
+        return Time(float(value), format="mjd")
+    except ValueError:
+        return Time(value)
+
+
+class RMService:
+    """Answer RM queries, keeping sites and IONEX data in memory between them
+
+    Parameters
+    ----------
+    ionexPath : str, optional
+    server : str, optional
+    engine : str, optional
+        "native" (the default, since it keeps the IONEX maps in memory) or "rmextract"
+    site : str, optional
+        Default site for queries that do not specify one
+    """
+
+    def __init__(
+        self,
+        ionexPath="./IONEXdata/",
+        server="http://ftp.aiub.unibe.ch/CODE/",
+        engine="native",
+        site=None,
+    ):
+        self.ionexPath = ionexPath
+        self.server = server
+        self.engine = engine
+        self.default_site = site
+
+    def warm(self):
+        """Set up the default site and the astropy frame machinery ahead of the first query"""
+        if self.default_site is None:
+            return
+        try:
+            location = self.get_site()
+            SkyCoord(0 * u.deg, 0 * u.deg).transform_to(
+                AltAz(obstime=Time.now(), location=location)
+            )
+        except Exception as e:
+            logger.warning(f"Unable to set up site '{self.default_site}': {e}")
+
+    def get_site(self, site=None):
+        """Look up a site (the result is remembered by :func:`simpleRM.sites.get_site`)
+
+        Parameters
+        ----------
+        site : str, optional
+            Name known to :func:`simpleRM.sites.get_site`,
+            or geocentric "X,Y,Z" in m
+
+        Returns
+        -------
+        site : `astropy.coordinates.EarthLocation`
+        """
+        if site is None:
+            site = self.default_site
+        if site is None:
+            raise ValueError("No site specified")
+        return sites.get_site(site)
+
+    def query(self, coord, site=None, times=None):
+        """Compute RM for a position, site and set of times
+
+        Parameters
+        ----------
+        coord : `astropy.coordinates.SkyCoord`
+        site : str, optional
+        times : `astropy.time.Time`, optional
+            Default is now
+
+        Returns
+        -------
+        times : `astropy.time.Time`
+        RM : `numpy.ndarray`
+        """
+        if times is None:
+            times = Time.now()
+        times = Time(np.atleast_1d(times))
+        RM = simpleRM.simpleRM_batch(
+            coord.reshape((1,)),
+            [self.get_site(site)],
+            times,
+            ionexPath=self.ionexPath,
+            server=self.server,
+            engine=self.engine,
+        )
+        return times, RM[0, 0]
+
+    def handle(self, params):
+        """Answer a query given as URL parameters
+
+        Parameters
+        ----------
+        params : dict
+            "ra" and "dec" (required), "site", and "time" (comma-separated, default now)
+
+        Returns
+        -------
+        result : dict
+        """
+        coord = parse_coord(params["ra"], params["dec"])
+        times = None
+        if "time" in params:
+            times = Time([parse_time(t) for t in params["time"].split(",")])
+        times, RM = self.query(coord, params.get("site"), times)
+        return {
+            "ra": coord.icrs.ra.deg,
+            "dec": coord.icrs.dec.deg,
+            "site": params.get("site", self.default_site),
+            "mjd": list(times.mjd),
+            "RM": list(RM),
+        }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    service = None
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} - {format % args}")
+
+    def _send_json(self, status, result):
+        body = (json.dumps(result) + "\n").encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urllib.parse.urlparse(self.path)
+        params = dict(urllib.parse.parse_qsl(url.query))
+        try:
+            if url.path == "/rm":
+                self._send_json(200, self.service.handle(params))
+            elif url.path == "/stream":
+                self._stream(params)
+            else:
+                self._send_json(404, {"error": f"Unknown endpoint '{url.path}'"})
+        except (KeyError, ValueError) as e:
+            self._send_json(400, {"error": f"Bad request: {e}"})
+        except Exception as e:
+            logger.error(f"Unable to answer {self.path}: {e}")
+            self._send_json(500, {"error": str(e)})
+
+    def _stream(self, params):
+        # newline-delimited JSON, one result every `cadence` seconds
+        # until the client disconnects (or `count` results have been sent)
+        cadence = float(params.pop("cadence", 10))
+        count = int(params.pop("count", 0))
+        params.pop("time", None)
+        # check the request before starting the stream
+        result = self.service.handle(params)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        sent = 0
+        while True:
+            try:
+                self.wfile.write((json.dumps(result) + "\n").encode())
+                self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                logger.debug("Stream closed by client")
+                return
+            sent += 1
+            if count > 0 and sent >= count:
+                return
+            time.sleep(cadence)
+            try:
+                result = self.service.handle(params)
+            except Exception as e:
+                logger.error(f"Unable to answer {self.path}: {e}")
+                result = {"error": str(e)}
+
+
+def serve(service, host="127.0.0.1", port=8765):
+    """Run an HTTP server answering RM queries until interrupted
+
+    Endpoints:
+
+    * `/rm?ra=...&dec=...&site=...&time=...` returns a single JSON result for the given times (default now)
+    * `/stream?ra=...&dec=...&site=...&cadence=...` returns newline-delimited JSON results for the current time every `cadence` seconds
+
+    Parameters
+    ----------
+    service : `RMService`
+    host : str, optional
+    port : int, optional
+    """
+    handler = type("Handler", (_Handler,), {"service": service})
+    server = ThreadingHTTPServer((host, port), handler)
+    service.warm()
+    logger.info(f"Serving RM on http://{host}:{server.server_address[1]}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
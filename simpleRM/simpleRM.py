@@ -1,11 +1,21 @@
+import datetime
+import functools
+from concurrent.futures import ProcessPoolExecutor
 from loguru import logger
 
-import RMextract.getRM as gt
+import numpy as np
 from astropy import units as u, constants as c
 from astropy.time import Time
 from astropy.coordinates import SkyCoord, EarthLocation, errors
 
+from simpleRM import engine as native_engine
+from simpleRM import ionex as ionex_tools
+from simpleRM import profiling
+from simpleRM import sites
+from simpleRM.series import RMSeries
 
+
+@profiling.timed("compute", profile=True)
 def simpleRM(
     pointing,
     starttime,
@@ -14,6 +24,9 @@ def simpleRM(
     timestep=100 * u.s,
     ionexPath="./IONEXdata/",
     server="http://ftp.aiub.unibe.ch/CODE/",
+    cache=None,
+    engine="rmextract",
+    workers=1,
 ):
     """Compute RM for a single position/site and a range of times
 
@@ -26,11 +39,22 @@ def simpleRM(
     timestep : `astropy.units.Quantity`, optional
     ionexPath : str, optional
     server : str, optional
+    cache : `simpleRM.cache.RMCache`, optional
+        If supplied, look up the result there first and store new results there
+    engine : str, optional
+        "rmextract" to use `RMextract.getRM` with the best IONEX product in `ionexPath` (see :func:`_compute_range`),
+        or "native" to use the vectorized calculation in `simpleRM.engine` (same time grid)
+    workers : int, optional
+        If more than 1, split the times at IONEX day boundaries and compute the days
+        in a pool of this many processes (see :func:`_compute_days`)
 
     Returns
     -------
-    times : `astropy.time.Times`
-    RM : `numpy.ndarray`
+    series : `simpleRM.series.RMSeries`
+        RM on the grid of times, which unpacks as `times, RM`
+        and can be interpolated or refined at other times.
+        Refining computes new times the same way as the grid (see :func:`_evaluate`),
+        so it starts from the values on the grid.
     """
 
     logger.debug(f"Computing for:")
@@ -38,8 +62,155 @@ def simpleRM(
     logger.debug(f"position={pointing}")
     logger.debug(f"times={starttime} - {stoptime}")
 
+    if engine not in ["native", "rmextract"]:
+        raise ValueError(f"Unknown RM engine '{engine}'")
+    evaluator = functools.partial(
+        _evaluate, pointing, site, ionexPath=ionexPath, server=server, engine=engine
+    )
+    if cache is not None:
+        key, _ = cache.key(
+            pointing,
+            starttime,
+            stoptime,
+            site,
+            timestep=timestep,
+            ionexPath=ionexPath,
+            server=server,
+            engine=engine,
+        )
+        times, RM = cache.get(key)
+        if RM is not None:
+            profiling.count("cache_hits")
+            return RMSeries(times, RM, evaluator=evaluator)
+
+    grid = _time_grid(starttime, stoptime, timestep)
+    if workers > 1 and len(np.unique(np.floor(grid.mjd))) > 1:
+        times, RM = _compute_days(
+            pointing,
+            site,
+            grid,
+            starttime,
+            stoptime,
+            timestep,
+            ionexPath=ionexPath,
+            server=server,
+            engine=engine,
+            workers=workers,
+        )
+    else:
+        times, RM = _compute_range(
+            pointing,
+            site,
+            starttime,
+            stoptime,
+            timestep,
+            ionexPath=ionexPath,
+            server=server,
+            engine=engine,
+        )
+    if RM is None:
+        logger.error("No RM results returned")
+        return None, None
+    profiling.count("rm_values", len(times))
+    if cache is not None:
+        # IONEX files may have been downloaded, so get the key again
+        key, ionex = cache.key(
+            pointing,
+            starttime,
+            stoptime,
+            site,
+            timestep=timestep,
+            ionexPath=ionexPath,
+            server=server,
+            engine=engine,
+        )
+        cache.put(
+            key,
+            times,
+            RM,
+            ionex=ionex,
+            provenance=ionex_tools.provenance(
+                ionex_tools.ionex_dates(starttime, stoptime, timestep), ionexPath
+            ),
+        )
+    return RMSeries(times, RM, evaluator=evaluator)
+
+
+def _compute_range(
+    pointing, site, starttime, stoptime, timestep, ionexPath, server, engine
+):
+    """RM on the grid of times from `_time_grid`, with a single call to the engine
+
+    Returns
+    -------
+    times : `astropy.time.Time` or None
+    RM : `numpy.ndarray` or None
+        RM with shape (time, 1)
+    """
+    if engine == "native":
+        times = _time_grid(starttime, stoptime, timestep)
+        RM = native_engine.compute_rm(
+            pointing.reshape((1,)),
+            [site],
+            times,
+            ionexPath=ionexPath,
+            server=server,
+            window=True,
+        )[0, 0][:, None]
+        return times, RM
+
+    # getRM reads a single IONEX product, so it is given the best one already in ionexPath
+    # (it downloads a final one for days without any)
+    prefixes = set(
+        _ionex_prefix(date, ionexPath)
+        for date in ionex_tools.ionex_dates(starttime, stoptime, timestep)
+    )
+    if len(prefixes) == 1:
+        return _getRM(
+            pointing,
+            site,
+            starttime,
+            stoptime,
+            timestep,
+            ionexPath,
+            server,
+            prefix=prefixes.pop(),
+        )
+    # with different products on different days, compute the same values
+    # with the best product for each day
+    logger.debug(f"IONEX products {sorted(prefixes)}: not using getRM")
+    times = _time_grid(starttime, stoptime, timestep)
+    RM = _rmextract_batch(
+        pointing.reshape((1,)), [site], times, ionexPath=ionexPath, server=server
+    )[0, 0][:, None]
+    return times, RM
+
+
+def _ionex_prefix(date, ionexPath):
+    """Prefix of the best IONEX product already in `ionexPath` for a day, or "codg" if there is none"""
+    _, product = ionex_tools.find_ionex_file(date, ionexPath)
+    if product is None:
+        return "codg"
+    return ionex_tools.products[product].lower()
+
+
+def _getRM(
+    pointing, site, starttime, stoptime, timestep, ionexPath, server, prefix="codg"
+):
+    """RM from `RMextract.getRM`, on the grid of times from :func:`_time_grid`
+
+    Returns
+    -------
+    times : `astropy.time.Time` or None
+    RM : `numpy.ndarray` or None
+        RM with shape (time, 1)
+    """
+    # imported here since it is slow to import (and warns about PyEphem)
+    import RMextract.getRM as gt
+
     RMdict = gt.getRM(
         server=server,
+        prefix=prefix,
         ionexPath=ionexPath,
         radec=[pointing.ra.rad, pointing.dec.rad],
         timestep=timestep.to_value(u.s),
@@ -47,14 +218,415 @@ def simpleRM(
             (starttime.mjd * u.d).to_value(u.s),
             (stoptime.mjd * u.d).to_value(u.s),
         ],
-        stat_positions=[[x.value for x in site.to_geocentric()],],
+        stat_positions=[[x.value for x in site.to_geocentric()]],
     )
     if RMdict is None:
-        logger.error("No RM results returned")
         return None, None
-    RM = RMdict["RM"]["st1"]
-    times = Time(RMdict["times"] / 3600 / 24, format="mjd")
-    return times, RM
+    return Time(RMdict["times"] / 3600 / 24, format="mjd"), RMdict["RM"]["st1"]
+
+
+def _compute_days(
+    pointing,
+    site,
+    grid,
+    starttime,
+    stoptime,
+    timestep,
+    ionexPath,
+    server,
+    engine,
+    workers,
+):
+    """RM on a grid of times, with each IONEX day computed in a separate process
+
+    Each day is computed over the part of the grid that falls in it
+    (:func:`_time_grid` pads the range it is given by one timestep, so it is given
+    the range shrunk by one timestep, and the ends of the whole range are unchanged),
+    and the days are joined keeping only the times in each day, so there are no duplicates where they meet.
+    Each worker only holds the IONEX maps for its own day.
+
+    Returns
+    -------
+    times : `astropy.time.Time` or None
+    RM : `numpy.ndarray` or None
+        RM with shape (time, 1)
+    """
+    day = np.floor(grid.mjd)
+    starts = np.nonzero(np.diff(day, prepend=-1))[0]
+    chunks = []
+    for k, first in enumerate(starts):
+        last = starts[k + 1] - 1 if k + 1 < len(starts) else len(grid) - 1
+        chunks.append(
+            (
+                starttime if k == 0 else grid[first] + timestep,
+                stoptime if last == len(grid) - 1 else grid[last] - timestep,
+            )
+        )
+    logger.debug(f"Computing {len(chunks)} days with {workers} processes")
+    # imported here since it uses the engine
+    from simpleRM import field
+
+    # spawned workers do not inherit the field grid settings
+    with ProcessPoolExecutor(
+        max_workers=min(workers, len(chunks)),
+        initializer=field.use_settings,
+        initargs=(field.settings(),),
+    ) as pool:
+        futures = [
+            pool.submit(
+                _compute_range,
+                pointing,
+                site,
+                chunk_start,
+                chunk_stop,
+                timestep,
+                ionexPath,
+                server,
+                engine,
+            )
+            for chunk_start, chunk_stop in chunks
+        ]
+        results = [future.result() for future in futures]
+    if any(RM is None for _, RM in results):
+        return None, None
+
+    mjd = []
+    RM = []
+    # allow for rounding in the times of each chunk
+    tolerance = 1e-3 / 86400
+    for k, (times, chunk_RM) in enumerate(results):
+        keep = np.ones(len(times), dtype=bool)
+        if k > 0:
+            keep &= times.mjd > grid[starts[k]].mjd - tolerance
+        if k + 1 < len(starts):
+            keep &= times.mjd < grid[starts[k + 1]].mjd - tolerance
+        mjd.append(times.mjd[keep])
+        RM.append(np.asarray(chunk_RM).reshape((-1, 1))[keep])
+    mjd = np.concatenate(mjd)
+    RM = np.concatenate(RM)
+    # and at the ends of each chunk
+    keep = np.concatenate(([True], np.diff(mjd) > tolerance))
+    return Time(mjd[keep], format="mjd"), RM[keep]
+
+
+def _evaluate(pointing, site, times, ionexPath, server, engine):
+    """RM for a single position and site at arbitrary times (for refining an `RMSeries`)
+
+    With the "rmextract" engine the values are computed as `RMextract.getRM` computes them
+    (see :func:`_rmextract_batch`), so they agree with a grid from :func:`_compute_range`
+    """
+    return simpleRM_batch(
+        pointing.reshape((1,)),
+        [site],
+        times,
+        ionexPath=ionexPath,
+        server=server,
+        engine=engine,
+    )[0, 0]
+
+
+def _subint_rm(
+    pointing, site, times, timestep, ionexPath, server, cache, engine, tolerance=0.001
+):
+    """RM at the mid-times of the subintegrations, with shape (time, 1)
+
+    RM is computed every `timestep` over the subintegrations (see :func:`simpleRM`),
+    refined to within `tolerance` (see :meth:`simpleRM.series.RMSeries.refine`)
+    and interpolated to `times`
+
+    Returns
+    -------
+    RM : `numpy.ndarray` or None
+    """
+    logger.debug(f"Computing for {len(times)} subintegrations")
+    series = simpleRM(
+        pointing,
+        times.min(),
+        times.max(),
+        site,
+        timestep=timestep,
+        ionexPath=ionexPath,
+        server=server,
+        cache=cache,
+        engine=engine,
+    )
+    if not isinstance(series, RMSeries):
+        return None
+    series.refine(tolerance=tolerance, start=times.min(), stop=times.max())
+    return np.reshape(series(times), (-1, 1))
+
+
+def _time_grid(starttime, stoptime, timestep):
+    """Times at which `RMextract.getRM` evaluates RM
+
+    One timestep of padding at each end, with the stop time added if the grid does not reach it
+
+    Parameters
+    ----------
+    starttime : `astropy.time.Time`
+    stopttime : `astropy.time.Time`
+    timestep : `astropy.units.Quantity`
+
+    Returns
+    -------
+    times : `astropy.time.Times`
+    """
+    step = timestep.to_value(u.s)
+    t0 = (starttime.mjd * u.d).to_value(u.s) - step
+    t1 = (stoptime.mjd * u.d).to_value(u.s) + step
+    grid = np.arange(t0, t1 + step, step)
+    if grid[-1] < t1:
+        grid = np.append(grid, t1)
+    return Time(grid / 3600 / 24, format="mjd")
+
+
+@profiling.timed("compute", profile=True)
+def simpleRM_batch(
+    pointings,
+    sites,
+    times,
+    ionexPath="./IONEXdata/",
+    server="http://ftp.aiub.unibe.ch/CODE/",
+    engine="rmextract",
+):
+    """Compute RM for many positions and sites at a common set of times
+
+    Requests are grouped by IONEX day and by site, so each IONEX file is read
+    once per day and shared by all of the sources and sites.
+
+    Parameters
+    ----------
+    pointings : `astropy.coordinates.SkyCoord`
+        Positions (scalar or 1-D array)
+    sites : `astropy.coordinates.EarthLocation` or list
+        Sites (scalar, 1-D array, or list of `astropy.coordinates.EarthLocation`)
+    times : `astropy.time.Time`
+        Times (scalar or 1-D array)
+    ionexPath : str, optional
+    server : str, optional
+    engine : str, optional
+        "rmextract" to use the `RMextract` functions for each time (see :func:`_rmextract_batch`),
+        or "native" to use the vectorized calculation in `simpleRM.engine`
+
+    Returns
+    -------
+    RM : `numpy.ndarray`
+        RM with shape (source, site, time)
+    """
+    if pointings.isscalar:
+        pointings = pointings.reshape((1,))
+    if isinstance(sites, EarthLocation):
+        sites = [sites] if sites.isscalar else list(sites)
+    if times.isscalar:
+        times = times.reshape((1,))
+
+    profiling.count("rm_values", len(pointings) * len(sites) * len(times))
+    if engine == "native":
+        return native_engine.compute_rm(
+            pointings, sites, times, ionexPath=ionexPath, server=server
+        )
+    elif engine != "rmextract":
+        raise ValueError(f"Unknown RM engine '{engine}'")
+    return _rmextract_batch(pointings, sites, times, ionexPath=ionexPath, server=server)
+
+
+def _rmextract_batch(pointings, sites, times, ionexPath, server):
+    """RM with the `RMextract` functions, with shape (source, site, time)
+
+    Every value is computed as `RMextract.getRM` computes it (including alt/az, see :func:`_rmextract_azel`),
+    but the IONEX file for each day is the best product available (see :func:`simpleRM.ionex.get_ionex_file`)
+    """
+    from RMextract import getIONEX as ionex
+    from RMextract.EMM import EMM
+
+    RM = np.zeros((len(pointings), len(sites), len(times)))
+    date_parms, days, part_of_day = _rmextract_days(times)
+    site_positions = [[x.value for x in site.to_geocentric()] for site in sites]
+    ra = pointings.icrs.ra.rad.reshape((-1, 1))
+    dec = pointings.icrs.dec.rad.reshape((-1, 1))
+
+    emm = EMM.WMM()
+    for day, indices in days.items():
+        logger.debug(f"Computing for {len(indices)} times on {day}")
+        ionexf = ionex_tools.get_ionex_file(date_parms[indices[0]], ionexPath, server)
+        with profiling.stage("ionex_parse"):
+            tecinfo = ionex.read_tec(ionexf)
+        dayofyear = datetime.date(*day).timetuple().tm_yday
+        emm.date = day[0] + float(dayofyear) / 365.0
+
+        for j, (site, position) in enumerate(zip(sites, site_positions)):
+            logger.debug(f"site={site}")
+            with profiling.stage("geometry"):
+                az, el = _rmextract_azel(ra, dec, times[indices], position)
+            for i in range(len(pointings)):
+                RM[i, j, indices] = _rmextract_rm(
+                    emm, az[i], el[i], position, part_of_day[indices], tecinfo
+                )
+
+    return RM
+
+
+def _rmextract_days(times):
+    """Split times into days the way `RMextract` does
+
+    Returns the (year, month, day, fraction) for each time,
+    a dict of the indices for each (year, month, day), and the hour of the day of each time
+    """
+    from RMextract import PosTools
+
+    # MJD seconds, as used by RMextract
+    mjd_seconds = times.mjd * 86400
+    date_parms = [
+        PosTools.obtain_observation_year_month_day_fraction(t) for t in mjd_seconds
+    ]
+    days = {}
+    for i, d in enumerate(date_parms):
+        days.setdefault(tuple(d[:3]), []).append(i)
+    days = {day: np.array(indices) for day, indices in days.items()}
+    part_of_day = np.array([d[3] for d in date_parms]) * 24
+    return date_parms, days, part_of_day
+
+
+def _rmextract_azel(ra, dec, times, position):
+    """Azimuth and elevation [rad] as `RMextract.getRM` computes them (with `RMextract.PosTools.getAzEl`)
+
+    `ra`, `dec` [rad] and `times` are broadcast together
+    """
+    from RMextract import PosTools
+
+    ra, dec, seconds = np.broadcast_arrays(ra, dec, times.mjd * 86400)
+    azel = np.array(
+        [
+            PosTools.getAzEl([r, d], t, position)
+            for r, d, t in zip(ra.ravel(), dec.ravel(), seconds.ravel())
+        ]
+    ).reshape((-1, 2))
+    return azel[:, 0].reshape(ra.shape), azel[:, 1].reshape(ra.shape)
+
+
+def _rmextract_rm(emm, az, el, position, hours, tecinfo):
+    """RM with the `RMextract` functions for 1-D arrays of az/el on a single day"""
+    from RMextract import PosTools
+    from RMextract import getIONEX as ionex
+
+    latpp = np.zeros(len(az))
+    lonpp = np.zeros(len(az))
+    Bpar = np.zeros(len(az))
+    airmass = np.zeros(len(az))
+    # pierce points and field are computed together for each time
+    with profiling.stage("field"):
+        for k in range(len(az)):
+            (
+                latpp[k],
+                lonpp[k],
+                height,
+                lon,
+                lat,
+                airmass[k],
+            ) = PosTools.getlonlatheight(az[k], el[k], position)
+            emm.lon = lonpp[k]
+            emm.lat = latpp[k]
+            emm.h = PosTools.ION_HEIGHT / 1.0e3
+            # minus sign since the radiation is towards the Earth
+            Bpar[k] = -1 * emm.getProjectedField(lon, lat)
+    with profiling.stage("tec_interpolation"):
+        vTEC = ionex.compute_tec_interpol(hours, latpp, lonpp, tecinfo)
+    # constant comes from VTEC in TECU, B in nT
+    return Bpar * vTEC * airmass * 2.62e-6
+
+
+@profiling.timed("compute", profile=True)
+def simpleRM_samples(
+    pointings,
+    site,
+    times,
+    ionexPath="./IONEXdata/",
+    server="http://ftp.aiub.unibe.ch/CODE/",
+    engine="rmextract",
+):
+    """Compute RM for a single site at a set of (position, time) pairs
+
+    Unlike :func:`simpleRM_batch`, which computes every combination of position and time,
+    each position goes with one time, so unrelated observations can be computed together.
+    The pairs are grouped by IONEX day, so each IONEX file is read once for all of them.
+
+    Parameters
+    ----------
+    pointings : `astropy.coordinates.SkyCoord`
+        Positions (1-D array)
+    site : `astropy.coordinates.EarthLocation`
+    times : `astropy.time.Time`
+        Times (1-D array, same length as `pointings`)
+    ionexPath : str, optional
+    server : str, optional
+    engine : str, optional
+        "rmextract" or "native" (see :func:`simpleRM_batch`)
+
+    Returns
+    -------
+    RM : `numpy.ndarray`
+        RM for each pair
+    """
+    from RMextract import getIONEX as ionex
+    from RMextract.EMM import EMM
+
+    if len(pointings) != len(times):
+        raise ValueError(
+            f"Number of positions ({len(pointings)}) and times ({len(times)}) differ"
+        )
+    profiling.count("rm_values", len(times))
+    if engine == "native":
+        return native_engine.compute_rm_samples(
+            pointings, site, times, ionexPath=ionexPath, server=server
+        )
+    elif engine != "rmextract":
+        raise ValueError(f"Unknown RM engine '{engine}'")
+
+    RM = np.zeros(len(times))
+    date_parms, days, part_of_day = _rmextract_days(times)
+    position = [x.value for x in site.to_geocentric()]
+
+    emm = EMM.WMM()
+    for day, indices in days.items():
+        logger.debug(f"Computing for {len(indices)} samples on {day}")
+        ionexf = ionex_tools.get_ionex_file(date_parms[indices[0]], ionexPath, server)
+        with profiling.stage("ionex_parse"):
+            tecinfo = ionex.read_tec(ionexf)
+        dayofyear = datetime.date(*day).timetuple().tm_yday
+        emm.date = day[0] + float(dayofyear) / 365.0
+        with profiling.stage("geometry"):
+            az, el = _rmextract_azel(
+                pointings[indices].icrs.ra.rad,
+                pointings[indices].icrs.dec.rad,
+                times[indices],
+                position,
+            )
+        RM[indices] = _rmextract_rm(
+            emm, az, el, position, part_of_day[indices], tecinfo
+        )
+    return RM
+
+
+def _read_psrfits(filename):
+    """Header, position, site and start time of a PSRFITS file"""
+    from simpleRM import psrfits
+
+    logger.debug(f"Reading PSRFITS file {filename}")
+    with profiling.stage("header"):
+        try:
+            ar = psrfits.PSRFITSHeader(filename)
+        except (ValueError, KeyError) as e:
+            logger.warning(
+                f"Unable to read '{filename}' directly ({e}): trying pypulse"
+            )
+            import pypulse
+
+            ar = pypulse.Archive(filename, onlyheader=True)
+    pointing = ar.getPulsarCoords()
+    telescope = ar.getTelescope()
+    # the position in the header is used if the telescope is not in the bundled table
+    site = sites.get_site(telescope, xyz=ar.getTelescopeCoords())
+    return ar, pointing, site, Time(ar.getMJD(full=True), format="mjd")
 
 
 def simpleRM_from_psrfits(
@@ -62,6 +634,9 @@ def simpleRM_from_psrfits(
     timestep=100 * u.s,
     ionexPath="./IONEXdata/",
     server="http://ftp.aiub.unibe.ch/CODE/",
+    cache=None,
+    engine="rmextract",
+    subint=False,
 ):
     """Compute RM for a single position/site and a range of times based on a PSRFITS file
 
@@ -72,40 +647,65 @@ def simpleRM_from_psrfits(
     timestep : `astropy.units.Quantity`, optional
     ionexPath : str, optional
     server : str, optional
+    cache : `simpleRM.cache.RMCache`, optional
+    engine : str, optional
+    subint : bool, optional
+        Compute RM at the mid-time of each subintegration (from OFFS_SUB in the SUBINT table)
+        instead of every `timestep` (see :func:`_subint_rm`)
 
     Returns
     -------
     times : `astropy.time.Times`
     RM : `numpy.ndarray`
-    ar : `pypulse` archive
+    ar : `simpleRM.psrfits.PSRFITSHeader` or `pypulse` archive
     """
-    import pypulse
-
-    logger.debug(f"Reading PSRFITS file {filename}")
-    ar = pypulse.Archive(filename, onlyheader=True)
-    pointing = ar.getPulsarCoords()
-    telescope = ar.getTelescope()
-    try:
-        site = EarthLocation.of_site(telescope)
-    except errors.UnknownSiteException:
-        xyz = ar.getTelescopeCoords()
-        site = EarthLocation.from_geocentric(*xyz, unit=u.m)
-
-    starttime = Time(ar.getMJD(full=True), format="mjd")
+    ar, pointing, site, starttime = _read_psrfits(filename)
+    if subint:
+        times = starttime + ar.getSubintinfo("OFFS_SUB") * u.s
+        RM = _subint_rm(
+            pointing, site, times, timestep, ionexPath, server, cache, engine
+        )
+        return times, RM, ar
     stoptime = starttime + ar.getDuration() * u.s
     return (
         *simpleRM(
-            pointing, starttime, stoptime, site, timestep=timestep, ionexPath=ionexPath
+            pointing,
+            starttime,
+            stoptime,
+            site,
+            timestep=timestep,
+            ionexPath=ionexPath,
+            server=server,
+            cache=cache,
+            engine=engine,
         ),
         ar,
     )
 
 
+def _read_psrchive(filename):
+    """Header, position and site (None if unknown) of a PSRCHIVE (Timer) file"""
+    from simpleRM import read_Timer
+
+    logger.debug(f"Reading Timer file {filename}")
+    with profiling.stage("header"):
+        t = read_Timer.TimerHeader(filename)
+    try:
+        site = sites.get_site(t.telescope)
+    except errors.UnknownSiteException:
+        logger.error(f"Unknown site '{t.telescope}'")
+        site = None
+    return t, t.position, site
+
+
 def simpleRM_from_psrchive(
     filename,
     timestep=100 * u.s,
     ionexPath="./IONEXdata/",
     server="http://ftp.aiub.unibe.ch/CODE/",
+    cache=None,
+    engine="rmextract",
+    subint=False,
 ):
     """Compute RM for a single position/site and a range of times based on a PSRCHIVE file
 
@@ -116,6 +716,11 @@ def simpleRM_from_psrchive(
     timestep : `astropy.units.Quantity`, optional
     ionexPath : str, optional
     server : str, optional
+    cache : `simpleRM.cache.RMCache`, optional
+    engine : str, optional
+    subint : bool, optional
+        Compute RM at the mid-time of each subintegration
+        instead of every `timestep` (see :func:`_subint_rm`)
 
     Returns
     -------
@@ -123,23 +728,29 @@ def simpleRM_from_psrchive(
     RM : `numpy.ndarray`
     header : `read_Timer.TimerHeader`
     """
-    import read_Timer
-
-    logger.debug(f"Reading Timer file {filename}")
-    t = read_Timer.TimerHeader(filename)
-    pointing = t.position
-    telescope = t.telescope
-    try:
-        site = EarthLocation.of_site(telescope)
-    except errors.UnknownSiteException:
-        logger.error(f"Unknown site '{telescope}'")
+    t, pointing, site = _read_psrchive(filename)
+    if site is None:
         return None
 
+    if subint:
+        times = t.subint_times()
+        RM = _subint_rm(
+            pointing, site, times, timestep, ionexPath, server, cache, engine
+        )
+        return times, RM, t
     starttime = t.mjd
     stoptime = starttime + t.duration
     return (
         *simpleRM(
-            pointing, starttime, stoptime, site, timestep=timestep, ionexPath=ionexPath
+            pointing,
+            starttime,
+            stoptime,
+            site,
+            timestep=timestep,
+            ionexPath=ionexPath,
+            server=server,
+            cache=cache,
+            engine=engine,
         ),
         t,
     )
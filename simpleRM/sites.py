@@ -0,0 +1,116 @@
+import difflib
+import functools
+import re
+
+from astropy import units as u
+from astropy.coordinates import EarthLocation
+from astropy.coordinates.errors import UnknownSiteException
+from loguru import logger
+
+# geocentric ITRF positions (m) of the common pulsar telescopes (from the tempo2 observatory list)
+positions = {
+    "GBT": (882589.65, -4924872.32, 3943729.348),
+    "Arecibo": (2390490.0, -5564764.0, 1994727.0),
+    "Parkes": (-4554231.5, 2816759.1, -3454036.3),
+    "Jodrell Bank": (3822626.04, -154105.65, 5086486.04),
+    "Effelsberg": (4033949.5, 486989.4, 4900430.8),
+    "VLA": (-1601192.0, -5041981.4, 3554871.4),
+    "WSRT": (3828445.659, 445223.6, 5064921.5677),
+    "Nancay": (4324165.81, 165927.11, 4670132.83),
+    "GMRT": (1656342.3, 5797947.77, 2073243.16),
+    "FAST": (-1668557.0, 5506838.0, 2744934.0),
+    "CHIME": (-2059166.313, -3621302.972, 4814304.113),
+    "MeerKAT": (5109360.133, 2006852.586, -3238948.127),
+    "LOFAR": (3826577.462, 461022.624, 5064892.526),
+    "MWA": (-2559454.08, 5095372.14, -2849057.18),
+}
+
+# other names for the sites: PSRFITS TELESCOP values, Timer telid values, tempo codes and astropy names
+aliases = {
+    "GBT": ["gbt", "green bank", "greenbank", "1", "gb"],
+    "Arecibo": ["arecibo", "ao", "3"],
+    "Parkes": ["parkes", "pks", "7", "pk", "murriyang"],
+    "Jodrell Bank": ["jodrell bank", "jodrell", "jb", "lovell", "8", "jbo"],
+    "Effelsberg": ["effelsberg", "eff", "g", "ef"],
+    "VLA": ["vla", "jvla", "6"],
+    "WSRT": ["wsrt", "westerbork", "i", "we"],
+    "Nancay": ["nancay", "ncy", "nrt", "f", "nc"],
+    "GMRT": ["gmrt", "r", "ugmrt"],
+    "FAST": ["fast", "k"],
+    "CHIME": ["chime", "y", "ch"],
+    "MeerKAT": ["meerkat", "mkt", "m", "mk"],
+    "LOFAR": ["lofar", "t", "lf"],
+    "MWA": ["mwa", "u"],
+}
+
+# index of every name (normalized) to its site
+_index = {_name.lower(): _name for _name in positions}
+for _name, _aliases in aliases.items():
+    _index.update({alias: _name for alias in _aliases})
+_number = re.compile(r"^[+\-]?(\d+\.?\d*|\.\d+)([eE][+\-]?\d+)?$")
+
+
+def _normalize(name):
+    return " ".join(name.replace("_", " ").split()).lower()
+
+
+@functools.lru_cache(maxsize=None)
+def _bundled(name):
+    return EarthLocation.from_geocentric(*positions[name], unit=u.m)
+
+
+@functools.lru_cache(maxsize=None)
+def _lookup(name, registry):
+    xyz = re.split(r"[\s,]+", name)
+    if len(xyz) == 3 and all(_number.match(x) is not None for x in xyz):
+        return EarthLocation.from_geocentric(*[float(x) for x in xyz], unit=u.m)
+    if registry:
+        try:
+            return EarthLocation.of_site(name)
+        except UnknownSiteException:
+            raise
+        except Exception as e:
+            logger.warning(f"Unable to use the astropy site registry for '{name}': {e}")
+    return None
+
+
+def get_site(name, xyz=None, registry=True):
+    """Look up a site by name, without needing the network for the common telescopes
+
+    The name is looked up in the bundled table (see `positions` and `aliases`; case-insensitive).
+    If it is not there, the geocentric position `xyz` is used if it is given
+    (such as from the header of a PSRFITS file), and otherwise the astropy site registry
+    (which may need to be downloaded).
+    Results are remembered for the rest of the process.
+
+    Parameters
+    ----------
+    name : str
+        Site name or alias, or geocentric "X,Y,Z" (or "X Y Z") in m
+    xyz : tuple, optional
+        Geocentric position (m) to use if the name is not known; ignored if it is all zero
+    registry : bool, optional
+        Whether to try the astropy site registry
+
+    Returns
+    -------
+    site : `astropy.coordinates.EarthLocation`
+
+    Raises
+    ------
+    `astropy.coordinates.errors.UnknownSiteException`
+        If the site cannot be found
+    """
+    name = name.strip() if name is not None else ""
+    if _normalize(name) in _index:
+        return _bundled(_index[_normalize(name)])
+    if xyz is not None and any(x != 0 for x in xyz):
+        logger.debug(f"Using position {xyz} for site '{name}'")
+        return EarthLocation.from_geocentric(*xyz, unit=u.m)
+    site = _lookup(name, registry) if name != "" else None
+    if site is None:
+        close = difflib.get_close_matches(_normalize(name), list(_index))
+        raise UnknownSiteException(
+            name, "get_site", close_names=sorted({_index[c] for c in close})
+        )
+    return site
@@ -0,0 +1,47 @@
+import os
+import sys
+
+# the synthetic input files are shared with the benchmarks
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks")
+)
+# RMextract logs every IONEX file it reads
+os.environ.setdefault("RMEXT_LOGLEVEL", "WARNING")
+
+import pytest
+from astropy import units as u
+from astropy.coordinates import SkyCoord
+
+import fixtures
+from simpleRM import ionex, field
+
+start_mjd = 59216
+# never contacted, since all of the IONEX files are already present
+server = "http://localhost/CODE/"
+
+
+@pytest.fixture(autouse=True)
+def reset_ionex():
+    """Forget any parsed IONEX data, since tests replace IONEX files"""
+    yield
+    ionex._load_ionex.cache_clear()
+    ionex._load_ionex_window.cache_clear()
+    field._get_grid.cache_clear()
+
+
+@pytest.fixture
+def ionexPath(tmp_path):
+    """Directory with synthetic final IONEX files for two days"""
+    path = str(tmp_path / "IONEXdata")
+    fixtures.write_ionex_days(path, start_mjd, 2)
+    return path
+
+
+@pytest.fixture
+def site():
+    return fixtures.site("CHIME")
+
+
+@pytest.fixture
+def pointing():
+    return SkyCoord(308.895 * u.deg, 36.879 * u.deg)
@@ -0,0 +1,106 @@
+import asyncio
+import gzip
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+from astropy.time import Time
+
+import fixtures
+from simpleRM import aio
+from simpleRM import ionex
+from simpleRM import prefetch
+from simpleRM import simpleRM
+from conftest import server
+
+starttime = Time(59216.9, format="mjd")
+stoptime = Time(59216.95, format="mjd")
+
+
+@pytest.fixture
+def archive(tmp_path):
+    filename = str(tmp_path / "test.fits")
+    fixtures.write_psrfits(filename)
+    return filename
+
+
+@pytest.mark.parametrize("own_executor", [False, True])
+def test_simpleRM(pointing, site, ionexPath, own_executor):
+    kwargs = dict(ionexPath=ionexPath, server=server)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        times, RM = asyncio.run(
+            aio.simpleRM(
+                pointing,
+                starttime,
+                stoptime,
+                site,
+                executor=executor if own_executor else None,
+                **kwargs,
+            )
+        )
+    expected_times, expected = simpleRM.simpleRM(
+        pointing, starttime, stoptime, site, **kwargs
+    )
+    assert np.array_equal(times.mjd, expected_times.mjd)
+    assert np.array_equal(RM, expected)
+
+
+@pytest.mark.parametrize("subint", [False, True])
+def test_from_file(archive, ionexPath, subint):
+    kwargs = dict(ionexPath=ionexPath, server=server, subint=subint)
+    times, RM, header = asyncio.run(aio.simpleRM_from_file(archive, **kwargs))
+    expected_times, expected, _ = simpleRM.simpleRM_from_psrfits(archive, **kwargs)
+    assert header.getTelescope() == "CHIME"
+    assert np.array_equal(times.mjd, expected_times.mjd)
+    assert np.array_equal(RM, expected)
+
+
+def test_shared_download(tmp_path, monkeypatch):
+    date = ionex.mjd_to_date(59216)
+    filename = str(tmp_path / "CODG0020.21I")
+    fixtures.write_ionex(filename, date)
+    os.makedirs(tmp_path / "mirror" / "2021")
+    with open(filename, "rb") as f, open(
+        tmp_path / "mirror" / "2021" / "CODG0020.21I.Z", "wb"
+    ) as out:
+        out.write(gzip.compress(f.read()))
+    ionexPath = str(tmp_path / "IONEXdata")
+
+    # hold the download until all of the requests have been made
+    release = threading.Event()
+    calls = []
+    fetch_ionex = prefetch.fetch_ionex
+
+    def fetch(*args, **kwargs):
+        calls.append(args[0])
+        release.wait(timeout=30)
+        return fetch_ionex(*args, **kwargs)
+
+    monkeypatch.setattr(prefetch, "fetch_ionex", fetch)
+
+    async def requests():
+        tasks = [
+            asyncio.ensure_future(
+                aio.get_ionex_file(
+                    date, ionexPath=ionexPath, server=str(tmp_path / "mirror")
+                )
+            )
+            for _ in range(4)
+        ]
+        await asyncio.sleep(0.2)
+        # cancelling one request leaves the download for the others
+        tasks[0].cancel()
+        release.set()
+        return await asyncio.gather(*tasks[1:])
+
+    filenames = asyncio.run(requests())
+    assert calls == [date]
+    assert filenames == [os.path.join(ionexPath, "CODG0020.21I")] * 3
+    assert aio._downloads == {}
+    # an existing file is not fetched again
+    assert asyncio.run(aio.get_ionex_files([date], ionexPath=ionexPath)) == {
+        date: os.path.join(ionexPath, "CODG0020.21I")
+    }
+    assert calls == [date]
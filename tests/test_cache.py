@@ -0,0 +1,155 @@
+import os
+
+import numpy as np
+import pytest
+from astropy.time import Time
+
+import fixtures
+from simpleRM import cache
+from simpleRM import ionex
+from simpleRM import simpleRM
+from conftest import server
+
+starttime = Time(59216.9, format="mjd")
+stoptime = Time(59216.95, format="mjd")
+
+
+@pytest.fixture
+def rmcache(tmp_path):
+    return cache.RMCache(str(tmp_path / "RMcache"))
+
+
+def test_key_depends_on_inputs(rmcache, pointing, site, ionexPath):
+    key, filenames = rmcache.key(
+        pointing, starttime, stoptime, site, ionexPath=ionexPath, server=server
+    )
+    assert filenames == ["CODG0020.21I"]
+    assert (
+        rmcache.key(
+            pointing, starttime, stoptime, site, ionexPath=ionexPath, server=server
+        )[0]
+        == key
+    )
+    assert (
+        rmcache.key(
+            pointing,
+            starttime,
+            stoptime,
+            site,
+            ionexPath=ionexPath,
+            server=server,
+            engine="native",
+        )[0]
+        != key
+    )
+    assert (
+        rmcache.key(
+            pointing,
+            starttime,
+            Time(59216.96, format="mjd"),
+            site,
+            ionexPath=ionexPath,
+            server=server,
+        )[0]
+        != key
+    )
+
+
+def test_cached_result(rmcache, pointing, site, ionexPath, monkeypatch):
+    times, RM = simpleRM.simpleRM(
+        pointing,
+        starttime,
+        stoptime,
+        site,
+        ionexPath=ionexPath,
+        server=server,
+        cache=rmcache,
+        engine="native",
+    )
+
+    def fail(*args, **kwargs):
+        raise AssertionError("Cached result was recomputed")
+
+    monkeypatch.setattr(simpleRM, "_compute_range", fail)
+    cached_times, cached_RM = simpleRM.simpleRM(
+        pointing,
+        starttime,
+        stoptime,
+        site,
+        ionexPath=ionexPath,
+        server=server,
+        cache=rmcache,
+        engine="native",
+    )
+    assert np.array_equal(cached_RM, RM)
+    assert np.array_equal(cached_times.mjd, times.mjd)
+    # a different engine is not a cache hit
+    with pytest.raises(AssertionError):
+        simpleRM.simpleRM(
+            pointing,
+            starttime,
+            stoptime,
+            site,
+            ionexPath=ionexPath,
+            server=server,
+            cache=rmcache,
+        )
+
+
+def test_better_product_changes_key(rmcache, pointing, site, tmp_path):
+    ionexPath = str(tmp_path / "rapid")
+    os.makedirs(ionexPath)
+    date = ionex.mjd_to_date(59216)
+    fixtures.write_ionex(
+        os.path.join(ionexPath, ionex.ionex_filename(date, "CORG")), date
+    )
+    key, filenames = rmcache.key(
+        pointing, starttime, stoptime, site, ionexPath=ionexPath, server=server
+    )
+    assert filenames == ["CORG0020.21I"]
+    fixtures.write_ionex(os.path.join(ionexPath, ionex.ionex_filename(date)), date)
+    new_key, new_filenames = rmcache.key(
+        pointing, starttime, stoptime, site, ionexPath=ionexPath, server=server
+    )
+    assert new_filenames == ["CODG0020.21I"]
+    assert new_key != key
+
+
+def test_invalidate(rmcache, pointing, site, ionexPath):
+    for mjd in [59216.5, 59217.5]:
+        simpleRM.simpleRM(
+            pointing,
+            Time(mjd, format="mjd"),
+            Time(mjd + 0.01, format="mjd"),
+            site,
+            ionexPath=ionexPath,
+            server=server,
+            cache=rmcache,
+            engine="native",
+        )
+    assert len(os.listdir(rmcache.directory)) == 2
+    assert rmcache.invalidate(os.path.join(ionexPath, "CODG0030.21I")) == 1
+    assert rmcache.invalidate("CODG0030.21I") == 0
+    assert rmcache.invalidate() == 1
+    assert os.listdir(rmcache.directory) == []
+
+
+def test_invalidate_names(rmcache):
+    times = Time([59216.9, 59216.91], format="mjd")
+    rmcache.put("lower", times, np.zeros((2, 1)), ionex=["codg0020.21i"])
+    rmcache.put("path", times, np.zeros((2, 1)), ionex=["/data/CODG0030.21I"])
+    assert rmcache.invalidate("CODG0020.21I") == 1
+    assert rmcache.invalidate("/other/codg0030.21i") == 1
+    assert os.listdir(rmcache.directory) == []
+
+
+def test_prune(tmp_path, pointing, site, ionexPath):
+    rmcache = cache.RMCache(str(tmp_path / "RMcache"), max_entries=2)
+    times = Time([59216.9, 59216.91], format="mjd")
+    for i in range(4):
+        rmcache.put(f"key{i}", times, np.full((2, 1), i))
+        # distinct modification times
+        os.utime(rmcache._path(f"key{i}"), (i, i))
+    assert sorted(os.listdir(rmcache.directory)) == ["key2.npz", "key3.npz"]
+    assert rmcache.get("key0") == (None, None)
+    assert np.array_equal(rmcache.get("key3")[1], np.full((2, 1), 3))
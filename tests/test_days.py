@@ -0,0 +1,43 @@
+import numpy as np
+from astropy import units as u
+from astropy.time import Time
+
+from simpleRM import ionex
+from simpleRM import simpleRM
+from conftest import server
+
+
+def test_days_joined_without_duplicates(pointing, site, ionexPath):
+    kwargs = dict(timestep=600 * u.s, ionexPath=ionexPath, server=server)
+    starttime = Time(59216.7, format="mjd")
+    stoptime = Time(59217.3, format="mjd")
+    times, RM = simpleRM.simpleRM(pointing, starttime, stoptime, site, **kwargs)
+    days_times, days_RM = simpleRM.simpleRM(
+        pointing, starttime, stoptime, site, workers=2, **kwargs
+    )
+    assert np.all(np.diff(days_times.mjd) > 0)
+    assert np.allclose(days_times.mjd, times.mjd, rtol=0, atol=1e-8)
+    assert np.array_equal(days_RM, RM)
+
+
+def test_days_native(pointing, site, ionexPath):
+    kwargs = dict(
+        timestep=300 * u.s, ionexPath=ionexPath, server=server, engine="native"
+    )
+    # a grid point exactly at midnight
+    starttime = Time(59216.75, format="mjd")
+    stoptime = Time(59217.25, format="mjd")
+    times, RM = simpleRM.simpleRM(pointing, starttime, stoptime, site, **kwargs)
+    days_times, days_RM = simpleRM.simpleRM(
+        pointing, starttime, stoptime, site, workers=2, **kwargs
+    )
+    assert len(days_times) == len(times)
+    assert np.allclose(days_times.mjd, times.mjd, rtol=0, atol=1e-8)
+    assert np.allclose(days_RM, RM, rtol=0, atol=1e-12)
+
+
+def test_ionex_dates_include_padding():
+    dates = ionex.ionex_dates(
+        Time(59216.01, format="mjd"), Time(59216.5, format="mjd"), 3600 * u.s
+    )
+    assert dates == [ionex.mjd_to_date(59215), ionex.mjd_to_date(59216)]
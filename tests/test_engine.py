@@ -0,0 +1,64 @@
+import numpy as np
+from astropy.time import Time
+
+from simpleRM import engine
+from simpleRM import simpleRM
+from conftest import server
+
+
+def test_engines_agree(pointing, site, ionexPath):
+    starttime = Time(59216.9, format="mjd")
+    stoptime = Time(59216.95, format="mjd")
+    times, RM = simpleRM.simpleRM(
+        pointing, starttime, stoptime, site, ionexPath=ionexPath, server=server
+    )
+    native_times, native_RM = simpleRM.simpleRM(
+        pointing,
+        starttime,
+        stoptime,
+        site,
+        ionexPath=ionexPath,
+        server=server,
+        engine="native",
+    )
+    assert RM.shape == native_RM.shape == (len(times), 1)
+    assert np.allclose(times.mjd, native_times.mjd, rtol=0, atol=1e-8)
+    # the engines only differ in the alt/az calculation
+    assert np.allclose(RM, native_RM, rtol=0, atol=0.005)
+
+
+def test_batch_matches_series(pointing, site, ionexPath):
+    times, RM = simpleRM.simpleRM(
+        pointing,
+        Time(59216.9, format="mjd"),
+        Time(59216.95, format="mjd"),
+        site,
+        ionexPath=ionexPath,
+        server=server,
+        engine="native",
+    )
+    batch = simpleRM.simpleRM_batch(
+        pointing, site, times, ionexPath=ionexPath, server=server, engine="native"
+    )
+    assert batch.shape == (1, 1, len(times))
+    assert np.allclose(batch[0, 0], RM[:, 0], rtol=0, atol=1e-12)
+
+
+def test_projected_field_matches_rmextract():
+    from RMextract.EMM import EMM
+
+    rng = np.random.default_rng(0)
+    latpp = rng.uniform(-80, 80, 50)
+    lonpp = rng.uniform(-180, 180, 50)
+    lon, lat = np.radians(-119.6), np.radians(49.3)
+    date = 2021 + 2 / 365.0
+    emm = EMM.WMM()
+    emm.date = date
+    expected = np.zeros(len(latpp))
+    for k in range(len(latpp)):
+        emm.lat = latpp[k]
+        emm.lon = lonpp[k]
+        emm.h = engine.ION_HEIGHT / 1.0e3
+        expected[k] = -emm.getProjectedField(lon, lat)
+    Bpar = engine.projected_field(latpp, lonpp, lon, lat, date)
+    assert np.allclose(Bpar, expected, rtol=0, atol=0.01)
@@ -0,0 +1,80 @@
+import argparse
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pytest
+from astropy.time import Time
+
+from simpleRM import field
+from simpleRM import simpleRM
+from simpleRM.scripts import common
+from simpleRM.scripts import getRM_psrfits
+from conftest import server
+
+date = 2021 + 2 / 365.0
+
+
+@pytest.fixture
+def position(site):
+    return [x.value for x in site.to_geocentric()]
+
+
+@pytest.fixture
+def disabled():
+    yield
+    field.disable()
+
+
+@pytest.mark.parametrize("tolerance", [2.0, 0.5])
+def test_grid_tolerance(position, tolerance):
+    grid = field.FieldGrid.build(position, date, tolerance=tolerance)
+    assert grid.error <= tolerance
+    rng = np.random.default_rng(0)
+    az = rng.uniform(0, 360, 2000)
+    el = rng.uniform(0, 90, 2000)
+    Bpar = field._evaluate(az, el, position, date)
+    assert np.max(np.abs(grid(az, el) - Bpar)) <= tolerance
+    # the grid points themselves are exact
+    AZ, EL = np.meshgrid(grid.az[::7], grid.el[::7], indexing="ij")
+    assert np.allclose(grid(AZ, EL), grid.Bpar[::7, ::7], rtol=0, atol=1e-9)
+
+
+def test_grid_directory(tmp_path, position, disabled):
+    directory = str(tmp_path / "fieldcache")
+    field.enable(directory=directory)
+    grid = field.get_grid(position, date, directory=directory)
+    (filename,) = os.listdir(directory)
+    loaded = field.FieldGrid.load(os.path.join(directory, filename))
+    assert np.array_equal(loaded.Bpar, grid.Bpar)
+    assert loaded.error == grid.error
+    assert loaded.metadata["tolerance"] == 2.0
+
+
+def test_rm_with_grid(pointing, site, ionexPath, disabled):
+    kwargs = dict(ionexPath=ionexPath, server=server, engine="native")
+    starttime = Time(59216.9, format="mjd")
+    stoptime = Time(59216.95, format="mjd")
+    _, RM = simpleRM.simpleRM(pointing, starttime, stoptime, site, **kwargs)
+    field.enable(tolerance=2.0)
+    _, grid_RM = simpleRM.simpleRM(pointing, starttime, stoptime, site, **kwargs)
+    # 2 nT of about 50000 nT
+    assert np.allclose(grid_RM, RM, rtol=1e-4, atol=0)
+    assert not np.array_equal(grid_RM, RM)
+
+
+def test_spawned_workers(tmp_path, disabled):
+    args = argparse.Namespace(field_cache=str(tmp_path / "fieldcache"), engine="native")
+    common.start_field(args)
+    assert field.settings() == {"tolerance": 2.0, "directory": args.field_cache}
+    # spawned processes start without the settings of this one
+    with ProcessPoolExecutor(
+        max_workers=1,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=getRM_psrfits._init_worker,
+        initargs=(common.field_settings(args),),
+    ) as pool:
+        assert pool.submit(field.settings).result() == field.settings()
+    field.disable()
+    assert common.field_settings(argparse.Namespace(field_cache=None)) is None
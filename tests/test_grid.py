@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+from astropy import units as u
+from astropy.coordinates import SkyCoord
+from astropy.time import Time
+
+from simpleRM import simpleRM
+from simpleRM.grid import RMGrid
+from conftest import server
+
+starttime = Time(59216.9, format="mjd")
+stoptime = Time(59216.95, format="mjd")
+
+
+@pytest.fixture
+def grid(site, ionexPath):
+    return RMGrid.build(
+        site,
+        starttime,
+        stoptime,
+        timestep=600 * u.s,
+        resolution=2 * u.deg,
+        ionexPath=ionexPath,
+        server=server,
+    )
+
+
+def test_grid_points(grid):
+    assert grid.RM.shape == (9, 181, 43)
+    assert grid.metadata["ionex_files"] == ["CODG0020.21I"]
+    # the grid itself is given back exactly
+    T, X, Y = np.meshgrid(grid.mjd, grid.x[::5], grid.y[::5], indexing="ij")
+    assert np.allclose(grid.query(X, Y, T), grid.RM[:, ::5, ::5], rtol=1e-6, atol=1e-6)
+    # azimuth wraps around
+    assert grid.query(361.0, 45.0, grid.mjd[0]) == pytest.approx(
+        grid.query(1.0, 45.0, grid.mjd[0])
+    )
+
+
+def test_outside(grid):
+    assert np.isnan(grid.query(100.0, 2.0, grid.mjd[0]))
+    assert np.isnan(grid.query(100.0, 45.0, grid.mjd[0] - 0.01))
+    assert np.isnan(grid.query(100.0, 45.0, grid.mjd[-1] + 0.01))
+    assert np.isfinite(grid.query(100.0, 5.0, grid.mjd[-1]))
+
+
+@pytest.mark.parametrize("frame", ["altaz", "radec"])
+def test_query_coords(grid, frame, pointing, site, ionexPath):
+    if frame == "radec":
+        grid = grid.to_radec()
+    assert grid.frame == frame
+    times = Time(np.linspace(59216.9, 59216.95, 7), format="mjd")
+    expected = simpleRM.simpleRM_batch(
+        pointing.reshape((1,)),
+        [site],
+        times,
+        ionexPath=ionexPath,
+        server=server,
+        engine="native",
+    )[0, 0]
+    assert np.allclose(grid.query_coords(pointing, times), expected, rtol=0, atol=0.02)
+    # positions and times are broadcast together
+    coords = SkyCoord([pointing.ra.deg] * 2 * u.deg, [pointing.dec.deg] * 2 * u.deg)
+    RM = grid.query_coords(coords[:, None], times[None, :])
+    assert RM.shape == (2, len(times))
+    assert np.allclose(RM, grid.query_coords(pointing, times)[None, :])
+
+
+def test_save_load(tmp_path, grid, site):
+    filename = str(tmp_path / "grid.npz")
+    grid.save(filename)
+    loaded = RMGrid.load(filename)
+    assert loaded.frame == grid.frame
+    assert np.array_equal(loaded.RM, grid.RM)
+    assert np.array_equal(loaded.mjd, grid.mjd)
+    assert loaded.metadata == grid.metadata
+    assert np.allclose(
+        [x.value for x in loaded.site.to_geocentric()],
+        [x.value for x in site.to_geocentric()],
+    )
+    with pytest.raises(ValueError):
+        RMGrid("galactic", grid.mjd, grid.x, grid.y, grid.RM, site)
@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+from astropy import units as u
+
+from simpleRM import manifest
+from simpleRM import simpleRM
+from conftest import server
+
+
+def write(tmp_path, text):
+    filename = str(tmp_path / "observations.csv")
+    with open(filename, "w") as f:
+        f.write(text)
+    return filename
+
+
+def test_load_manifest(tmp_path):
+    filename = write(
+        tmp_path,
+        """# observations
+site,source,ra,dec,start,stop
+chime,B2034+36,308.895,36.879,59216.9,59216.91
+
+GBT,J0000+00,00:00:00,+00:00:00,2021-01-02T21:36:00,
+,third,10.0,-5.5,59216.95,59216.96
+""",
+    )
+    rows = manifest.load_manifest(filename, site="CHIME")
+    assert list(rows["source"]) == ["B2034+36", "J0000+00", "third"]
+    assert list(rows["site"]) == ["chime", "GBT", "CHIME"]
+    assert np.allclose(rows["pointing"].ra.deg, [308.895, 0, 10])
+    assert np.allclose(rows["pointing"].dec.deg, [36.879, 0, -5.5])
+    assert np.allclose(rows["start"].mjd, [59216.9, 59216.9, 59216.95])
+    # without a stop, only the start
+    assert np.allclose(rows["stop"].mjd, [59216.91, 59216.9, 59216.96])
+    assert set(rows["sites"]) == {"chime", "GBT", "CHIME"}
+
+
+def test_manifest_errors(tmp_path):
+    with pytest.raises(ValueError):
+        manifest.load_manifest(write(tmp_path, "ra,dec,start,telescope\n1,2,3,x\n"))
+    with pytest.raises(ValueError):
+        manifest.load_manifest(write(tmp_path, "ra,start\n1,59216\n"))
+    with pytest.raises(ValueError):
+        manifest.load_manifest(write(tmp_path, "ra,dec,start\n1,2,59216\n"))
+    rows = manifest.load_manifest(
+        write(tmp_path, "ra,dec,start,stop\n1,2,59216,59215\n"), site="CHIME"
+    )
+    with pytest.raises(ValueError):
+        manifest.sample_times(rows["start"], rows["stop"], 100 * u.s)
+    with pytest.raises(ValueError):
+        manifest.load_manifest(
+            write(tmp_path, "ra,dec,start\n1,2,59216,3\n"), site="CHIME"
+        )
+
+
+def test_sample_times():
+    from astropy.time import Time
+
+    rows, times = manifest.sample_times(
+        Time([59216.9, 59217.0], format="mjd"),
+        Time([59216.9 + 250 / 86400, 59217.0], format="mjd"),
+        100 * u.s,
+    )
+    assert list(rows) == [0, 0, 0, 0, 1]
+    offsets = (times.mjd - Time([59216.9] * 4 + [59217.0], format="mjd").mjd) * 86400
+    assert np.allclose(offsets, [0, 100, 200, 250, 0], atol=1e-3)
+
+
+def test_compute_manifest(tmp_path, ionexPath, pointing, site):
+    filename = write(
+        tmp_path,
+        "source,ra,dec,start,stop\nA,308.895,36.879,59216.9,59216.901\n",
+    )
+    rows = manifest.load_manifest(filename, site="CHIME")
+    index, times, RM = manifest.compute_manifest(
+        rows, ionexPath=ionexPath, server=server, engine="native"
+    )
+    assert list(index) == [0, 0]
+    expected = simpleRM.simpleRM_batch(
+        pointing, site, times, ionexPath=ionexPath, server=server, engine="native"
+    )[0, 0]
+    assert np.allclose(RM, expected, rtol=0, atol=1e-12)
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+from astropy.time import Time
+
+from simpleRM import output
+
+times = Time(59216.9 + np.arange(4) / 864.0, format="mjd")
+RM = np.array([[0.123456789], [-1.5], [2.25], [1e-9]])
+
+
+@pytest.mark.parametrize(
+    "extension,module", [(".npz", None), (".h5", "h5py"), (".parquet", "pyarrow")]
+)
+def test_round_trip(tmp_path, extension, module):
+    if module is not None:
+        pytest.importorskip(module)
+    filename = str(tmp_path / f"result{extension}")
+    metadata = {"engine": "native", "ionex": [{"file": "CODG0020.21I"}]}
+    output.write_table(filename, times, RM, metadata=metadata)
+    table = output.read_table(filename)
+    # full precision
+    assert np.array_equal(table["times"].mjd, times.mjd)
+    assert table["times"].scale == "utc"
+    assert np.array_equal(table["RM"], RM[:, 0])
+    assert table["files"] is None
+    assert table["metadata"] == dict(metadata, time_scale="utc")
+
+
+@pytest.mark.parametrize("files_column", ["filename", "source"])
+def test_files_column(tmp_path, files_column):
+    filename = str(tmp_path / "result.npz")
+    files = ["a.fits", "a.fits", "b.fits", "longer name.fits"]
+    output.write_table(filename, times.tt, RM, files=files, files_column=files_column)
+    table = output.read_table(filename)
+    assert table["files_column"] == files_column
+    assert list(table["files"]) == files
+    assert table["times"].scale == "tt"
+    assert np.array_equal(table["times"].mjd, times.tt.mjd)
+
+
+def test_formats(tmp_path):
+    # the format is given, rather than from the extension
+    filename = str(tmp_path / "result.dat")
+    output.write_table(filename, times, RM, format="npz")
+    assert np.array_equal(output.read_table(filename, format="npz")["RM"], RM[:, 0])
+    with pytest.raises(ValueError):
+        output.write_table(filename, times, RM)
+    with pytest.raises(ValueError):
+        output.write_table(filename, times, RM, format="fits")
+
+
+def test_format_text():
+    text = output.format_text(times[:2], RM[:2], prefix="x.fits\t", precision=4)
+    assert text == "x.fits\t59216.9000\t\t0.123\nx.fits\t59216.9012\t\t-1.500\n"
+    assert output.format_text(times[:0], RM[:0]) == ""
@@ -0,0 +1,92 @@
+import datetime
+import gzip
+import os
+
+import pytest
+
+import fixtures
+from simpleRM import ionex
+from simpleRM import prefetch
+
+date = ionex.mjd_to_date(59216)
+
+
+@pytest.fixture
+def mirror(tmp_path):
+    """Local mirror with a gzip-compressed IONEX file for a single day"""
+    filename = str(tmp_path / "CODG0020.21I")
+    fixtures.write_ionex(filename, date)
+    os.makedirs(tmp_path / "mirror" / "2021")
+    with open(filename, "rb") as f:
+        data = f.read()
+    with open(tmp_path / "mirror" / "2021" / "CODG0020.21I.Z", "wb") as f:
+        f.write(gzip.compress(data))
+    return str(tmp_path / "mirror"), data
+
+
+def test_ionex_url(tmp_path):
+    # the path on known servers comes from RMextract
+    for server in ["http://ftp.aiub.unibe.ch/CODE/", "http://ftp.aiub.unibe.ch"]:
+        assert (
+            prefetch.ionex_url(date, server=server)
+            == "http://ftp.aiub.unibe.ch/CODE/2021/CODG0020.21I.Z"
+        )
+    assert (
+        prefetch.ionex_url(date, server="file:///data/mirror/", prefix="CORG")
+        == "file:///data/mirror/2021/CORG0020.21I.Z"
+    )
+    assert prefetch.ionex_url(date, server=str(tmp_path)) == (
+        tmp_path.as_uri() + "/2021/CODG0020.21I.Z"
+    )
+
+
+@pytest.mark.parametrize("uri", [False, True])
+def test_fetch_ionex(tmp_path, mirror, uri):
+    server, data = mirror
+    if uri:
+        server = "file://" + server
+    ionexPath = str(tmp_path / "IONEXdata")
+    filename = prefetch.fetch_ionex(date, ionexPath=ionexPath, server=server)
+    assert filename == os.path.join(ionexPath, "CODG0020.21I")
+    # decompressed, and no temporary files left behind
+    with open(filename, "rb") as f:
+        assert f.read() == data
+    assert os.listdir(ionexPath) == ["CODG0020.21I"]
+
+
+def test_fetch_existing(tmp_path, mirror):
+    server, data = mirror
+    ionexPath = str(tmp_path / "IONEXdata")
+    os.makedirs(ionexPath)
+    filename = os.path.join(ionexPath, "CODG0020.21I")
+    with open(filename, "w") as f:
+        f.write("existing")
+    assert prefetch.fetch_ionex(date, ionexPath=ionexPath, server=server) == filename
+    with open(filename) as f:
+        assert f.read() == "existing"
+    prefetch.fetch_ionex(date, ionexPath=ionexPath, server=server, overwrite=True)
+    with open(filename, "rb") as f:
+        assert f.read() == data
+
+
+def test_fetch_missing(tmp_path, mirror):
+    server, _ = mirror
+    ionexPath = str(tmp_path / "IONEXdata")
+    with pytest.raises(RuntimeError):
+        prefetch.fetch_ionex(
+            date, ionexPath=ionexPath, server=server, prefix="CORG", retries=1
+        )
+    assert os.listdir(ionexPath) == []
+
+
+def test_prefetch(tmp_path, mirror):
+    server, data = mirror
+    ionexPath = str(tmp_path / "IONEXdata")
+    missing = date + datetime.timedelta(days=1)
+    filenames = prefetch.prefetch(
+        [date, missing, date], ionexPath=ionexPath, server=server, jobs=2, retries=1
+    )
+    # each day once, with None for the one that is not on the mirror
+    assert filenames == {date: os.path.join(ionexPath, "CODG0020.21I"), missing: None}
+    with open(filenames[date], "rb") as f:
+        assert f.read() == data
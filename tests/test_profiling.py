@@ -0,0 +1,75 @@
+import threading
+
+import pytest
+
+from simpleRM import profiling
+
+
+@pytest.fixture
+def enabled(monkeypatch):
+    monkeypatch.setattr(profiling, "_enabled", False)
+    profiling.enable()
+    yield
+    profiling.reset()
+
+
+def test_disabled(monkeypatch):
+    monkeypatch.setattr(profiling, "_enabled", False)
+    profiling.reset()
+    with profiling.stage("outer"):
+        profiling.count("n")
+    assert profiling.summary()["stages"] == {}
+    assert profiling.summary()["counters"] == {}
+
+
+def test_nested_stages(enabled):
+    @profiling.timed("inner")
+    def inner():
+        with profiling.stage("inner"):
+            profiling.count("n", 2)
+
+    with profiling.stage("outer"):
+        inner()
+        inner()
+    summary = profiling.summary()
+    assert summary["stages"]["outer"]["calls"] == 1
+    # a stage nested inside itself is only timed once
+    assert summary["stages"]["inner"]["calls"] == 2
+    assert summary["stages"]["outer"]["time"] >= summary["stages"]["inner"]["time"]
+    assert summary["counters"] == {"n": 4}
+
+
+def test_threads(enabled):
+    nthreads, ncalls = 4, 50
+    barrier = threading.Barrier(nthreads)
+
+    def work():
+        for _ in range(ncalls):
+            with profiling.stage("outer"):
+                # every thread is inside the stage at the same time
+                barrier.wait()
+                with profiling.stage("inner"):
+                    profiling.count("n")
+
+    threads = [threading.Thread(target=work) for _ in range(nthreads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    summary = profiling.summary()
+    # stages in one thread do not hide the same stages in another
+    assert summary["stages"]["outer"]["calls"] == nthreads * ncalls
+    assert summary["stages"]["inner"]["calls"] == nthreads * ncalls
+    assert summary["counters"]["n"] == nthreads * ncalls
+
+
+def test_merge(enabled):
+    with profiling.stage("outer"):
+        profiling.count("n")
+    profiling.merge(
+        {"stages": {"outer": {"time": 1.0, "calls": 3}}, "counters": {"n": 2, "m": 1}}
+    )
+    summary = profiling.summary()
+    assert summary["stages"]["outer"]["calls"] == 4
+    assert summary["stages"]["outer"]["time"] >= 1.0
+    assert summary["counters"] == {"n": 3, "m": 1}
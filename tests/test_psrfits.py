@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+from astropy.io import fits
+
+import fixtures
+from simpleRM import psrfits
+
+nsub, nchan, nbin = 6, 8, 16
+
+
+def physical(filename):
+    """DATA * DAT_SCL + DAT_OFFS with shape (subint, pol, chan, bin), and DAT_FREQ"""
+    with fits.open(filename) as f:
+        data = f["SUBINT"].data
+        n = len(data)
+        values = data["DATA"].astype(float) * data["DAT_SCL"].reshape(
+            n, -1, nchan, 1
+        ) + data["DAT_OFFS"].reshape(n, -1, nchan, 1)
+        return values, np.array(data["DAT_FREQ"])
+
+
+def rotated(Q, U, RM, freq):
+    wavelength = 299792458.0 / (freq * 1e6)
+    P = (Q + 1j * U) * np.exp(-2j * RM[:, None] * wavelength**2)[:, :, None]
+    return P.real, P.imag
+
+
+@pytest.fixture
+def archive(tmp_path):
+    filename = str(tmp_path / "test.fits")
+    fixtures.write_psrfits(filename, nsub=nsub, nchan=nchan, nbin=nbin)
+    return filename
+
+
+def test_header(archive):
+    header = psrfits.PSRFITSHeader(archive)
+    assert header.getTelescope() == "CHIME"
+    assert header.getMJD() == 59216
+    assert np.isclose(header.getMJD(full=True), 59216 + (77700 + 0.25) / 86400)
+    assert np.allclose(header.getSubintinfo("OFFS_SUB"), (np.arange(nsub) + 0.5) * 10)
+    assert header.getDuration() == 10.0 * nsub
+
+
+def test_apply_rm_iquv(archive, tmp_path):
+    RM = np.linspace(1, 3, nsub)
+    outname = str(tmp_path / "test.rmcorr")
+    # a chunk smaller than one row, so each row is done separately
+    psrfits.apply_rm(archive, outname, RM, chunk_size=1)
+    before, freq = physical(archive)
+    after, _ = physical(outname)
+    Q, U = rotated(before[:, 1], before[:, 2], RM, freq)
+    # within the quantization of the requantized data
+    step = (np.ptp(after[:, 1:3], axis=-1).max()) / 65535
+    assert np.allclose(after[:, 1], Q, rtol=0, atol=step)
+    assert np.allclose(after[:, 2], U, rtol=0, atol=step)
+    with fits.open(archive) as a, fits.open(outname) as b:
+        # I and V are unchanged, as are the other columns
+        assert np.array_equal(
+            a["SUBINT"].data["DATA"][:, [0, 3]], b["SUBINT"].data["DATA"][:, [0, 3]]
+        )
+        for column in ["DAT_FREQ", "DAT_WTS", "TSUBINT", "OFFS_SUB"]:
+            assert np.array_equal(a["SUBINT"].data[column], b["SUBINT"].data[column])
+        assert "HISTORY" in b["SUBINT"].header
+
+
+def test_apply_rm_linear(archive, tmp_path):
+    with fits.open(archive, mode="update") as f:
+        f["SUBINT"].header["POL_TYPE"] = "AABBCRCI"
+        f[0].header["FD_POLN"] = "LIN"
+    RM = np.full(nsub, -2.0)
+    outname = str(tmp_path / "test.rmcorr")
+    psrfits.apply_rm(archive, outname, RM)
+    before, freq = physical(archive)
+    after, _ = physical(outname)
+    Q, U = rotated(before[:, 0] - before[:, 1], 2 * before[:, 2], RM, freq)
+    step = (np.ptp(after[:, :3], axis=-1).max()) / 65535
+    assert np.allclose(
+        after[:, 0] + after[:, 1], before[:, 0] + before[:, 1], atol=2 * step
+    )
+    assert np.allclose(after[:, 0] - after[:, 1], Q, rtol=0, atol=2 * step)
+    assert np.allclose(2 * after[:, 2], U, rtol=0, atol=2 * step)
+
+
+def test_apply_rm_checks(archive, tmp_path):
+    outname = str(tmp_path / "test.rmcorr")
+    with pytest.raises(ValueError):
+        psrfits.apply_rm(archive, outname, np.zeros(nsub + 1))
+    with pytest.raises(ValueError):
+        psrfits.apply_rm(archive, outname, np.full(nsub, np.nan))
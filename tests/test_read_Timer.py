@@ -0,0 +1,158 @@
+import json
+import os
+
+import numpy as np
+import pytest
+from astropy import units as u
+
+import fixtures
+from simpleRM import read_Timer
+
+# the start of a Timer header, in the form of psrchive's timer.h
+definition = """
+#define TIMER_NAME_LEN 16
+#define TIMER_COORD_LEN 8
+#define TIMER_SPACE_LEN 32
+/* source and time */
+char psrname[TIMER_NAME_LEN];
+int mjd;
+double fracmjd;
+char telid[TIMER_NAME_LEN];
+char coord_type[TIMER_COORD_LEN]; /* "05" for equatorial */
+double ra;
+double dec;
+float l;
+float b;
+int nsub_int;
+float sub_int_time;
+char space[TIMER_SPACE_LEN];
+"""
+
+
+@pytest.fixture
+def layout(tmp_path, monkeypatch):
+    filename = str(tmp_path / "timer.h")
+    with open(filename, "w") as f:
+        f.write(definition)
+    # only for this test
+    monkeypatch.setattr(read_Timer, "_layout", None)
+    return read_Timer.use_definition(filename)
+
+
+def test_layout(layout, tmp_path):
+    names, types, sizes, layout = layout
+    assert names[:3] == ["psrname", "mjd", "fracmjd"]
+    assert sizes[0] == 16
+    assert layout.size == 16 + 4 + 8 + 16 + 8 + 8 + 8 + 4 + 4 + 4 + 4 + 32
+    assert read_Timer.header_dtype().itemsize == layout.size
+    outname = str(tmp_path / "timer_layout.json")
+    read_Timer.write_layout(str(tmp_path / "timer.h"), outname)
+    with open(outname) as f:
+        assert '"format": ">16si' in f.read()
+
+
+def test_uint32(tmp_path):
+    filename = str(tmp_path / "timer.h")
+    with open(filename, "w") as f:
+        f.write(definition + "uint32_t flags;\nint nbin;\n")
+    keywords = read_Timer.TimerHeader.get_definition(filename)
+    assert keywords["flags"] == ["uint32_t", 4]
+    layout = read_Timer.compile_layout(keywords)
+    assert layout["format"].endswith("32s4si")
+
+
+@pytest.mark.skipif(
+    read_Timer._read_data("timer_layout.json") is None,
+    reason="No packaged Timer header layout",
+)
+def test_packaged_layout(monkeypatch):
+    monkeypatch.setattr(read_Timer, "_layout", None)
+    names, types, sizes, layout = read_Timer.get_layout()
+    packaged = json.loads(read_Timer._read_data("timer_layout.json"))
+    assert names == packaged["names"]
+    assert layout.format == packaged["format"]
+    # the same as compiling the packaged definition
+    assert packaged == read_Timer.compile_layout(
+        read_Timer.TimerHeader.get_definition()
+    )
+
+
+def test_data_layout(tmp_path, monkeypatch):
+    """The layout is read from the package data, and compiled from timer.h without it"""
+    data = tmp_path / "data"
+    data.mkdir()
+    with open(str(data / "timer.h"), "w") as f:
+        f.write(definition)
+
+    def read_data(name):
+        try:
+            with open(str(data / name)) as f:
+                return f.read()
+        except OSError:
+            return None
+
+    monkeypatch.setattr(read_Timer, "_read_data", read_data)
+    monkeypatch.setattr(read_Timer, "_layout", None)
+    compiled = read_Timer.get_layout()
+    assert compiled[0][:3] == ["psrname", "mjd", "fracmjd"]
+    read_Timer.write_layout(str(data / "timer.h"), str(data / "timer_layout.json"))
+    os.remove(str(data / "timer.h"))
+    monkeypatch.setattr(read_Timer, "_layout", None)
+    names, types, sizes, layout = read_Timer.get_layout()
+    assert names == compiled[0]
+    assert layout.format == compiled[3].format
+
+
+def test_external_definition(tmp_path, monkeypatch):
+    """Without package data, the definition of the read_Timer package is used"""
+    monkeypatch.setattr(read_Timer, "_read_data", lambda name: None)
+    monkeypatch.setattr(read_Timer, "_layout", None)
+    monkeypatch.setattr(read_Timer, "_external_definition", lambda: None)
+    with pytest.raises(FileNotFoundError):
+        read_Timer.get_layout()
+    monkeypatch.undo()
+
+    package = tmp_path / "site-packages" / "read_Timer"
+    (package / "data").mkdir(parents=True)
+    (package / "__init__.py").write_text("")
+    (package / "data" / "timer.h").write_text(definition)
+    monkeypatch.syspath_prepend(str(tmp_path / "site-packages"))
+    monkeypatch.setattr(read_Timer, "_read_data", lambda name: None)
+    monkeypatch.setattr(read_Timer, "_layout", None)
+    names, types, sizes, layout = read_Timer.get_layout()
+    assert names[:3] == ["psrname", "mjd", "fracmjd"]
+    assert layout.size == read_Timer.header_dtype().itemsize
+
+
+def test_header(layout, tmp_path):
+    filename = str(tmp_path / "test.ar")
+    fixtures.write_timer(filename, mjd=59216.9, nsub=10, tsub=37.5)
+    header = read_Timer.TimerHeader(filename)
+    assert header.telescope == "CHIME"
+    assert header.psrname == "J2035+36"
+    assert header.mjd.mjd == pytest.approx(59216.9)
+    assert header.duration == 375 * u.s
+    assert header.position.ra.deg == pytest.approx(308.895)
+    assert np.allclose(
+        (header.subint_times() - header.mjd).to_value(u.s), (np.arange(10) + 0.5) * 37.5
+    )
+
+
+def test_scan_headers(layout, tmp_path):
+    filenames = []
+    for i in range(3):
+        filenames.append(str(tmp_path / f"test{i}.ar"))
+        fixtures.write_timer(filenames[-1], mjd=59216.5 + i, nsub=i + 1)
+    with open(str(tmp_path / "short.ar"), "wb") as f:
+        f.write(b"short")
+    files, headers = read_Timer.scan_headers(
+        filenames + [str(tmp_path / "short.ar"), str(tmp_path / "missing.ar")]
+    )
+    assert files == filenames
+    assert np.allclose(
+        read_Timer.header_times(headers).mjd, [59216.5, 59217.5, 59218.5]
+    )
+    assert np.allclose(
+        read_Timer.header_durations(headers).to_value(u.s), [37.4, 74.8, 112.2]
+    )
+    assert np.allclose(read_Timer.header_positions(headers).dec.deg, 36.879)
@@ -0,0 +1,135 @@
+import os
+
+import numpy as np
+import pytest
+from astropy.time import Time
+
+import fixtures
+from simpleRM import ionex
+from simpleRM import output
+from simpleRM import refresh
+from simpleRM import simpleRM
+from conftest import server
+
+starttime = Time(59216.9, format="mjd")
+stoptime = Time(59216.95, format="mjd")
+date = ionex.mjd_to_date(59216)
+
+
+@pytest.fixture
+def rapid(tmp_path):
+    """Directory with only a rapid IONEX file for the day"""
+    ionexPath = str(tmp_path / "IONEXdata")
+    os.makedirs(ionexPath)
+    fixtures.write_ionex(
+        os.path.join(ionexPath, ionex.ionex_filename(date, "CORG")), date, seed=1
+    )
+    return ionexPath
+
+
+def write_result(filename, pointing, site, ionexPath, engine):
+    times, RM = simpleRM.simpleRM(
+        pointing,
+        starttime,
+        stoptime,
+        site,
+        ionexPath=ionexPath,
+        server=server,
+        engine=engine,
+    )
+    output.write_table(
+        filename,
+        times,
+        RM,
+        metadata=dict(
+            output.source_metadata(pointing, site),
+            engine=engine,
+            **output.ionex_metadata(times, ionexPath),
+        ),
+    )
+    return times, RM
+
+
+def test_provenance(rapid):
+    (entry,) = ionex.provenance([date], rapid)
+    assert entry["date"] == "2021-01-02"
+    assert entry["file"] == "CORG0020.21I"
+    assert entry["product"] == "rapid"
+    assert entry["sha256"] == ionex.file_hash(os.path.join(rapid, "CORG0020.21I"))
+    assert refresh.superseded_days([entry], rapid) == set()
+    fixtures.write_ionex(os.path.join(rapid, ionex.ionex_filename(date)), date, seed=2)
+    assert refresh.superseded_days([entry], rapid) == {"2021-01-02"}
+
+
+def test_changed_file(rapid):
+    (entry,) = ionex.provenance([date], rapid)
+    fixtures.write_ionex(
+        os.path.join(rapid, ionex.ionex_filename(date, "CORG")), date, seed=3
+    )
+    assert refresh.superseded_days([entry], rapid) == {"2021-01-02"}
+
+
+@pytest.mark.parametrize("engine", ["rmextract", "native"])
+def test_refresh_table(tmp_path, rapid, pointing, site, engine):
+    filename = str(tmp_path / "result.npz")
+    times, RM = write_result(filename, pointing, site, rapid, engine)
+    assert len(refresh.refresh_table(filename, ionexPath=rapid, server=server)) == 0
+
+    fixtures.write_ionex(os.path.join(rapid, ionex.ionex_filename(date)), date, seed=2)
+    assert output.read_table(filename)["metadata"]["ionex_prefix"] == "CORG"
+    rows = refresh.refresh_table(filename, ionexPath=rapid, server=server, dry_run=True)
+    assert len(rows) == len(times)
+    assert np.array_equal(np.ravel(output.read_table(filename)["RM"]), RM[:, 0])
+
+    rows = refresh.refresh_table(filename, ionexPath=rapid, server=server)
+    assert len(rows) == len(times)
+    table = output.read_table(filename)
+    # the same as computing with the final product in the first place
+    _, expected = simpleRM.simpleRM(
+        pointing,
+        starttime,
+        stoptime,
+        site,
+        ionexPath=rapid,
+        server=server,
+        engine=engine,
+    )
+    assert not np.allclose(expected, RM)
+    assert np.allclose(np.ravel(table["RM"]), expected[:, 0], rtol=0, atol=1e-12)
+    assert table["metadata"]["engine"] == engine
+    assert [entry["product"] for entry in table["metadata"]["ionex"]] == ["final"]
+    assert table["metadata"]["ionex_files"] == ["CODG0020.21I"]
+    assert table["metadata"]["ionex_prefix"] == "CODG"
+    assert len(refresh.refresh_table(filename, ionexPath=rapid, server=server)) == 0
+
+
+def test_script_metadata(tmp_path, rapid, monkeypatch):
+    from simpleRM.scripts import getRM_psrfits
+
+    archive = str(tmp_path / "test.fits")
+    fixtures.write_psrfits(archive, nsub=4, nchan=4, nbin=8)
+    outname = str(tmp_path / "result.npz")
+    monkeypatch.setattr(
+        "sys.argv",
+        [
+            "getRM_psrfits",
+            archive,
+            "--ionex",
+            rapid,
+            "--server",
+            server,
+            "--outfmt",
+            "npz",
+            "--out",
+            outname,
+        ],
+    )
+    getRM_psrfits.main()
+    metadata = output.read_table(outname)["metadata"]
+    assert "ionex_prefix" not in metadata
+    (source,) = metadata["sources"]
+    # the product that was used, rather than the final one
+    assert source["ionex_prefix"] == "CORG"
+    assert source["ionex_files"] == ["CORG0020.21I"]
+    assert [entry["product"] for entry in source["ionex"]] == ["rapid"]
+    assert os.listdir(rapid) == ["CORG0020.21I"]
@@ -0,0 +1,101 @@
+import os
+
+import numpy as np
+from astropy import units as u
+from astropy.coordinates import SkyCoord
+from astropy.time import Time
+
+import fixtures
+from simpleRM import ionex
+from simpleRM import simpleRM
+from conftest import server
+
+starttime = Time(59216.9, format="mjd")
+stoptime = Time(59216.95, format="mjd")
+
+
+def getRM(pointing, site, ionexPath, start, stop, prefix="codg"):
+    import RMextract.getRM as gt
+
+    RMdict = gt.getRM(
+        server=server,
+        prefix=prefix,
+        ionexPath=ionexPath,
+        radec=[pointing.ra.rad, pointing.dec.rad],
+        timestep=100,
+        timerange=[start.mjd * 86400, stop.mjd * 86400],
+        stat_positions=[[x.value for x in site.to_geocentric()]],
+    )
+    return RMdict["times"], np.ravel(RMdict["RM"]["st1"])
+
+
+def test_engine_is_getRM(pointing, site, ionexPath):
+    times, RM = simpleRM.simpleRM(
+        pointing, starttime, stoptime, site, ionexPath=ionexPath, server=server
+    )
+    expected_times, expected = getRM(pointing, site, ionexPath, starttime, stoptime)
+    assert np.allclose(times.mjd * 86400, expected_times, rtol=0, atol=1e-3)
+    assert np.array_equal(RM[:, 0], expected)
+
+
+def test_functions_match_getRM(pointing, site, ionexPath):
+    """The RMextract functions for arbitrary times (refinement, batches, samples) give getRM's values"""
+    expected_times, expected = getRM(pointing, site, ionexPath, starttime, stoptime)
+    times = Time(expected_times / 86400, format="mjd")
+    kwargs = dict(ionexPath=ionexPath, server=server, engine="rmextract")
+    assert np.array_equal(
+        simpleRM._evaluate(pointing, site, times, ionexPath, server, "rmextract"),
+        expected,
+    )
+    assert np.array_equal(
+        simpleRM.simpleRM_batch(pointing, site, times, **kwargs)[0, 0], expected
+    )
+    pointings = SkyCoord(
+        np.full(len(times), pointing.ra.deg) * u.deg,
+        np.full(len(times), pointing.dec.deg) * u.deg,
+    )
+    samples = simpleRM.simpleRM_samples(pointings, site, times, **kwargs)
+    assert np.array_equal(samples, expected)
+
+
+def test_rapid_product(tmp_path, pointing, site):
+    ionexPath = str(tmp_path / "IONEXdata")
+    os.makedirs(ionexPath)
+    date = ionex.mjd_to_date(59216)
+    fixtures.write_ionex(
+        os.path.join(ionexPath, ionex.ionex_filename(date, "CORG")), date, seed=1
+    )
+    # nothing is downloaded
+    times, RM = simpleRM.simpleRM(
+        pointing, starttime, stoptime, site, ionexPath=ionexPath, server=server
+    )
+    assert os.listdir(ionexPath) == ["CORG0020.21I"]
+    _, expected = getRM(pointing, site, ionexPath, starttime, stoptime, prefix="corg")
+    assert np.array_equal(RM[:, 0], expected)
+
+
+def test_mixed_products(tmp_path, pointing, site):
+    ionexPath = str(tmp_path / "IONEXdata")
+    os.makedirs(ionexPath)
+    for mjd, prefix in [(59216, "CODG"), (59217, "CORG")]:
+        date = ionex.mjd_to_date(mjd)
+        fixtures.write_ionex(
+            os.path.join(ionexPath, ionex.ionex_filename(date, prefix)), date, seed=mjd
+        )
+    start = Time(59216.9, format="mjd")
+    stop = Time(59217.1, format="mjd")
+    times, RM = simpleRM.simpleRM(
+        pointing,
+        start,
+        stop,
+        site,
+        timestep=600 * u.s,
+        ionexPath=ionexPath,
+        server=server,
+    )
+    grid = simpleRM._time_grid(start, stop, 600 * u.s)
+    assert np.allclose(times.mjd, grid.mjd, rtol=0, atol=1e-8)
+    assert sorted(os.listdir(ionexPath)) == ["CODG0020.21I", "CORG0030.21I"]
+    # each day from its own product
+    direct = simpleRM._evaluate(pointing, site, times, ionexPath, server, "rmextract")
+    assert np.allclose(RM[:, 0], direct, rtol=0, atol=1e-12)
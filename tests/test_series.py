@@ -0,0 +1,48 @@
+import numpy as np
+from astropy import units as u
+from astropy.time import Time
+
+import fixtures
+from simpleRM import simpleRM
+from conftest import server
+
+nsub, nchan, nbin = 6, 8, 16
+
+
+def test_refine_starts_from_grid(pointing, site, ionexPath):
+    for name in ["rmextract", "native"]:
+        series = simpleRM.simpleRM(
+            pointing,
+            Time(59216.9, format="mjd"),
+            Time(59216.95, format="mjd"),
+            site,
+            timestep=600 * u.s,
+            ionexPath=ionexPath,
+            server=server,
+            engine=name,
+        )
+        times, RM = series.times, series.RM.copy()
+        series.refine(tolerance=0.001)
+        assert len(series.times) > len(times)
+        kept = np.isin(series.times.mjd, times.mjd)
+        assert np.array_equal(series.RM[kept], RM)
+        direct = series.evaluator(series.times)
+        assert np.allclose(series.RM[:, 0], direct, rtol=0, atol=1e-12)
+
+
+def test_subint_rm(tmp_path, ionexPath):
+    archive = str(tmp_path / "test.fits")
+    fixtures.write_psrfits(archive, nsub=nsub, nchan=nchan, nbin=nbin)
+    times, RM, header = simpleRM.simpleRM_from_psrfits(
+        archive, ionexPath=ionexPath, server=server, engine="native", subint=True
+    )
+    assert RM.shape == (nsub, 1)
+    direct = simpleRM._evaluate(
+        header.getPulsarCoords(),
+        fixtures.site("CHIME"),
+        times,
+        ionexPath,
+        server,
+        "native",
+    )
+    assert np.allclose(RM[:, 0], direct, rtol=0, atol=0.001)
@@ -0,0 +1,85 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+from http.server import ThreadingHTTPServer
+
+import numpy as np
+import pytest
+from astropy.time import Time
+
+from simpleRM import service
+from simpleRM import simpleRM
+from conftest import server
+
+now = Time(59216.9, format="mjd")
+
+
+@pytest.fixture
+def url(ionexPath):
+    """Address of an RM server running in a thread, on a free port"""
+    rm_service = service.RMService(
+        ionexPath=ionexPath, server=server, engine="native", site="CHIME"
+    )
+    handler = type("Handler", (service._Handler,), {"service": rm_service})
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def get(url):
+    with urllib.request.urlopen(url, timeout=60) as response:
+        return response.headers["Content-Type"], response.read().decode()
+
+
+def test_parse():
+    coord = service.parse_coord("20:35:34.8", "+36:52:44.4")
+    assert np.isclose(coord.ra.deg, 308.895)
+    assert np.isclose(coord.dec.deg, 36.879)
+    assert service.parse_coord("308.895", "36.879").ra.deg == 308.895
+    assert service.parse_time("59216.9").mjd == 59216.9
+    assert service.parse_time("2021-01-02T21:36:00").mjd == pytest.approx(59216.9)
+
+
+def test_rm(url, pointing, site, ionexPath):
+    times = Time([59216.9, 59216.95], format="mjd")
+    content_type, body = get(f"{url}/rm?ra=308.895&dec=36.879&time=59216.9,59216.95")
+    assert content_type == "application/json"
+    result = json.loads(body)
+    assert result["site"] == "CHIME"
+    assert result["mjd"] == list(times.mjd)
+    expected = simpleRM.simpleRM_batch(
+        pointing.reshape((1,)),
+        [site],
+        times,
+        ionexPath=ionexPath,
+        server=server,
+        engine="native",
+    )[0, 0]
+    assert np.allclose(result["RM"], expected, rtol=1e-12, atol=0)
+
+
+def test_rm_errors(url):
+    for query, status in [
+        ("rm?ra=308.895", 400),
+        ("rm?ra=308.895&dec=36.879&time=yesterday", 400),
+        ("other", 404),
+    ]:
+        with pytest.raises(urllib.error.HTTPError) as e:
+            get(f"{url}/{query}")
+        assert e.value.code == status
+        assert "error" in json.loads(e.value.read())
+
+
+def test_stream(url, monkeypatch):
+    # the synthetic IONEX data are for "now"
+    monkeypatch.setattr(Time, "now", classmethod(lambda cls: now))
+    content_type, body = get(f"{url}/stream?ra=308.895&dec=36.879&cadence=0&count=3")
+    assert content_type == "application/x-ndjson"
+    results = [json.loads(line) for line in body.splitlines()]
+    assert len(results) == 3
+    _, expected = get(f"{url}/rm?ra=308.895&dec=36.879&time=59216.9")
+    assert all(result == json.loads(expected) for result in results)
@@ -0,0 +1,55 @@
+import pytest
+from astropy import units as u
+from astropy.coordinates.errors import UnknownSiteException
+
+from simpleRM import sites
+
+
+@pytest.mark.parametrize("name", ["CHIME", "chime", " Chime ", "y", "CH", "ch"])
+def test_aliases(name):
+    assert sites.get_site(name, registry=False) is sites.get_site(
+        "CHIME", registry=False
+    )
+
+
+@pytest.mark.parametrize(
+    "name,site",
+    [
+        ("jodrell_bank", "Jodrell Bank"),
+        ("Jodrell  Bank", "Jodrell Bank"),
+        ("jb", "Jodrell Bank"),
+        ("ao", "Arecibo"),
+        ("1", "GBT"),
+        ("murriyang", "Parkes"),
+        ("uGMRT", "GMRT"),
+    ],
+)
+def test_site_names(name, site):
+    location = sites.get_site(name, registry=False)
+    assert location.x.to_value(u.m) == pytest.approx(sites.positions[site][0])
+
+
+def test_geocentric():
+    for name in [
+        "882589.65,-4924872.32,3943729.348",
+        "882589.65 -4924872.32 3943729.348",
+    ]:
+        location = sites.get_site(name, registry=False)
+        assert location.z.to_value(u.m) == pytest.approx(3943729.348)
+
+
+def test_header_position():
+    xyz = (1.0e6, 2.0e6, 3.0e6)
+    location = sites.get_site("Unknown telescope", xyz=xyz, registry=False)
+    assert location.y.to_value(u.m) == pytest.approx(2.0e6)
+    # known names take priority over the header position
+    location = sites.get_site("GBT", xyz=xyz, registry=False)
+    assert location.x.to_value(u.m) == pytest.approx(sites.positions["GBT"][0])
+
+
+def test_unknown_site():
+    with pytest.raises(UnknownSiteException):
+        sites.get_site("Not a telescope", registry=False)
+    # an all-zero header position is ignored
+    with pytest.raises(UnknownSiteException):
+        sites.get_site("Not a telescope", xyz=(0, 0, 0), registry=False)